@@ -3,6 +3,7 @@ from litellm import Choices, Message
 from litellm.router import Router
 from litellm.files.main import ModelResponse
 import json
+from anki_packager.limiter import AdaptiveLimiter
 from anki_packager.prompt import PROMPT
 
 from pydantic import BaseModel, Field, ValidationError
@@ -49,19 +50,22 @@ class llm:
             for param in model_param
         ]
         self.router = Router(model_list)
+        # concurrent completions, backs off on rate limits and slow answers
+        self.limiter = AdaptiveLimiter("llm", 4)
 
     async def explain(self, word: str) -> Dict:
         try:
-            response = await self.router.acompletion(
-                model="a",
-                messages=[
-                    {"role": "system", "content": PROMPT},
-                    {"role": "user", "content": word},
-                ],
-                temperature=0.3,
-                max_tokens=500,
-                response_format={"type": "json_object"},
-            )
+            async with self.limiter.slot():
+                response = await self.router.acompletion(
+                    model="a",
+                    messages=[
+                        {"role": "system", "content": PROMPT},
+                        {"role": "user", "content": word},
+                    ],
+                    temperature=0.3,
+                    max_tokens=500,
+                    response_format={"type": "json_object"},
+                )
             if isinstance(response, ModelResponse):
                 if isinstance(response.choices, list) and response.choices:
                     first_choice = response.choices[0]
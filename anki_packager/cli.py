@@ -16,7 +16,7 @@ from anki_packager.logger import logger
 from anki_packager.ai import llm
 
 ### Dictionaries
-from anki_packager.dict.youdao import YoudaoScraper
+from anki_packager.dict.youdao import YoudaoCache, YoudaoScraper
 from anki_packager.dict.ecdict import Ecdict
 from anki_packager.dict.eudic import EUDIC
 
@@ -25,7 +25,6 @@ from anki_packager.packager.deck import AnkiDeckCreator
 
 MAX_RETRIES = 3  # 最大重试次数
 RETRY_DELAY = 2  # 每次重试前的等待时间（秒）
-CONCURRENCY_LIMIT = 40  # 并发数
 
 
 def create_signal_handler(anki, audio_files, DECK_NAME):
@@ -44,6 +43,13 @@ async def main():
 
     parser.add_argument("--word", dest="word", type=str, help="word to add")
 
+    parser.add_argument(
+        "-i",
+        "--interactive",
+        action="store_true",
+        help="Add words interactively, <Tab> completes from ECDICT",
+    )
+
     parser.add_argument(
         "--retry",
         action="store_true",
@@ -78,6 +84,87 @@ async def main():
         help="Use a custom txt file instead of vocabulary.txt",
     )
 
+    parser.add_argument(
+        "--search",
+        dest="search",
+        type=str,
+        help="Print ECDICT words whose meaning matches, e.g. --search 放弃",
+    )
+
+    parser.add_argument(
+        "--search_field",
+        dest="search_field",
+        choices=["definition", "translation"],
+        help="Search only English definitions or Chinese translations",
+    )
+
+    parser.add_argument(
+        "--limit",
+        dest="limit",
+        type=int,
+        default=-1,
+        help="Maximum number of search/selection results",
+    )
+
+    parser.add_argument(
+        "--build_index",
+        dest="build_index",
+        action="store_true",
+        help="Build missing ECDICT indexes, MDX sidecars and the full-text "
+        "search index, then exit",
+    )
+
+    # select words from ECDICT instead of a vocabulary file:
+    # ./prog --tag cet6 --collins 3 --frq 20000
+    parser.add_argument(
+        "--tag",
+        dest="tag",
+        type=str,
+        help="Use ECDICT words with all these tags, e.g. --tag 'cet6 ielts'",
+    )
+
+    parser.add_argument(
+        "--collins",
+        dest="collins",
+        type=int,
+        help="Use ECDICT words with at least this many Collins stars",
+    )
+
+    parser.add_argument(
+        "--oxford",
+        action="store_true",
+        help="Use ECDICT words from the Oxford 3000",
+    )
+
+    parser.add_argument(
+        "--frq",
+        dest="frq",
+        type=parse_range,
+        help="Use ECDICT words in this frequency rank range, e.g. 20000 or 5000-20000",
+    )
+
+    parser.add_argument(
+        "--order",
+        dest="order",
+        choices=["frq", "bnc", "collins", "word"],
+        default="frq",
+        help="Order of words selected from ECDICT",
+    )
+
+    parser.add_argument(
+        "--keep_inflections",
+        dest="keep_inflections",
+        action="store_true",
+        help="Do not replace inflected forms (studied, mice) with their lemma",
+    )
+
+    parser.add_argument(
+        "--autocorrect",
+        dest="autocorrect",
+        action="store_true",
+        help="Replace unknown words with their single closest spelling in ECDICT",
+    )
+
     parser.add_argument("--model", dest="model", type=str, help="custome AI model")
 
     parser.add_argument(
@@ -111,6 +198,11 @@ async def main():
         EUDIC_TOKEN = cfg["EUDIC_TOKEN"]
         EUDIC_ID = cfg["EUDIC_ID"]
         DECK_NAME = cfg["DECK_NAME"]
+        ECDICT_HOT_SET = cfg.get("ECDICT_HOT_SET", 0)
+        YOUDAO_CACHE_DAYS = cfg.get("YOUDAO_CACHE_DAYS", 30)
+        YOUDAO_CACHE_SIZE = cfg.get("YOUDAO_CACHE_SIZE", 50000)
+        YOUDAO_PARSE_WORKERS = cfg.get("YOUDAO_PARSE_WORKERS", 0)
+        YOUDAO_BACKEND = cfg.get("YOUDAO_BACKEND", "html")
 
     logger.info("配置读取完毕")
 
@@ -130,13 +222,36 @@ async def main():
         logger.info(f"单词: {WORD} 已添加进 {vocab_path}")
         exit(0)
 
+    # 运行时只读打开词典，索引和 mdx 的 sqlite 文件只在这里建立
+    elif options.build_index:
+        Ecdict(workers=0, build_index=True)
+        logger.info("词典索引已全部建立")
+        exit(0)
+
+    # full-text search: one word per line on stdout, e.g. > theme.txt
+    elif options.search:
+        ecdict = Ecdict(workers=0)
+        count = 0
+        for _, word in ecdict.search(
+            options.search, options.search_field, options.limit
+        ):
+            print(word, flush=True)
+            count += 1
+        logger.info(f"共找到 {count} 个单词")
+        exit(0)
+
+    elif options.interactive:
+        vocab_path = os.path.join(config_path, "vocabulary.txt")
+        interactive_add(vocab_path, Ecdict(workers=0))
+        exit(0)
+
     words = []
     number_words = 0
     audio_files = []
     ai = None
 
     anki = AnkiDeckCreator(f"{DECK_NAME}")
-    ecdict = Ecdict()
+    ecdict = Ecdict(hot_size=ECDICT_HOT_SET)
 
     # AI 配置
     if options.disable_ai:
@@ -157,7 +272,11 @@ async def main():
         except Exception as e:
             logger.error(f"初始化 AI 模型失败: {e}")
             exit(1)
-    ## 4. vocabulary source: eudic data, custom txt file, or default vocabulary.txt
+    ## 4. vocabulary source: eudic data, ECDICT selection, custom txt file,
+    ## or default vocabulary.txt
+    selected = bool(
+        options.tag or options.collins is not None or options.oxford or options.frq
+    )
     if options.eudic:
         logger.info("配置: 对欧路词典生词本单词进行处理...")
         eudic = EUDIC(EUDIC_TOKEN, EUDIC_ID)
@@ -166,6 +285,19 @@ async def main():
         for word in eudic_words:
             words.append(word["word"])
         number_words = len(words)
+    elif selected:
+        logger.info("配置: 对 ECDICT 中筛选出的单词进行处理...")
+        for word in ecdict.select(
+            options.tag,
+            options.collins,
+            options.oxford,
+            options.frq,
+            order=options.order,
+            limit=options.limit,
+        ):
+            words.append(word)
+        number_words = len(words)
+        logger.info(f"从 ECDICT 筛选出 {number_words} 个单词")
     elif options.txt_file:
         txt_file_path = options.txt_file
         if not os.path.isabs(txt_file_path):
@@ -205,11 +337,34 @@ async def main():
             exit(1)
         vocab.close()
 
+    # 拼写检查：词典里没有的单词跳过（--autocorrect 时纠正），不进入后面的网络请求
+    skipped_words = []
+    corrections = []
+    if not selected:
+        words, skipped_words, corrections = check_spelling(
+            ecdict, words, options.autocorrect
+        )
+
+    # 变形词还原为原型并去重，避免为同一个词重复请求网络
+    if not options.keep_inflections:
+        words = collapse_lemmas(ecdict, words)
+
     signal.signal(
         signal.SIGINT,
         create_signal_handler(anki, audio_files, DECK_NAME),
     )
-    async with YoudaoScraper() as youdao:
+    youdao_cache = None
+    if YOUDAO_CACHE_DAYS > 0 and YOUDAO_CACHE_SIZE > 0:
+        youdao_cache = YoudaoCache(
+            os.path.join(config_dir, "cache", "youdao.db"),
+            ttl=YOUDAO_CACHE_DAYS * 86400,
+            max_entries=YOUDAO_CACHE_SIZE,
+        )
+    async with YoudaoScraper(
+        cache=youdao_cache,
+        parse_workers=YOUDAO_PARSE_WORKERS,
+        backend=YOUDAO_BACKEND,
+    ) as youdao:
         logger.info(f"开始并发处理 {len(words)} 个单词...")
         with tqdm(total=len(words), desc="开始处理") as pbar:
             tasks = [
@@ -219,7 +374,8 @@ async def main():
             results = await asyncio.gather(*tasks, return_exceptions=True)
 
         successful_results = []
-        failed_words = []
+        # 拼写检查跳过的单词同样写入 failed.txt
+        failed_words = list(skipped_words)
 
         for word, result in zip(words, results):
             if isinstance(result, Exception):
@@ -239,6 +395,24 @@ async def main():
         else:
             logger.info("所有单词均已成功处理！")
 
+        if corrections:
+            logger.info(f"共自动纠正 {len(corrections)} 个单词:")
+            for word, correction in corrections:
+                logger.info(f"  {word} -> {correction}")
+
+        stats = ecdict.hot_stats()
+        if stats:
+            logger.info(
+                f"高频词表命中 {stats['hits']}/{stats['hits'] + stats['misses']} "
+                f"({stats['hit_rate']:.1%})"
+            )
+        if youdao_cache is not None:
+            stats = youdao_cache.stats()
+            logger.info(
+                f"有道缓存命中 {stats['hits']}/{stats['hits'] + stats['misses']} "
+                f"({stats['hit_rate']:.1%})，共 {stats['entries']} 条"
+            )
+
         try:
             if anki.added:
                 anki.write_to_file(f"{DECK_NAME}.apkg", audio_files)
@@ -247,62 +421,216 @@ async def main():
             logger.error(f"Error saving Anki deck: {e}")
 
 
-async def process_word(word, ai, anki, youdao, ecdict, audio_files):
-    data = {}
-    data["Word"] = word
+def parse_range(text):
+    """Parse "20000" or "5000-20000" into a (low, high) rank range"""
+    low, _, high = text.rpartition("-")
+    return (int(low) if low else None, int(high))
 
-    # Get audio pronunciation from gtts
-    audio_path = await youdao._get_audio(word)
-    if not audio_path:
-        raise Exception("Failed to get audio")
 
-    audio_files.append(audio_path)
-    # 只使用文件名作为 sound 标签的值
-    audio_filename = os.path.basename(audio_path)
-    data["Pronunciation"] = audio_filename
+def interactive_add(vocab_path, ecdict):
+    """逐行输入单词添加进 vocabulary.txt，<Tab> 补全，空行结束"""
+    try:
+        import readline
+    except ImportError:
+        readline = None
+
+    if readline is not None:
+        matches = []
+
+        def completer(text, state):
+            if state == 0:
+                matches[:] = ecdict.complete(text, 20)
+            return matches[state] if state < len(matches) else None
+
+        readline.set_completer(completer)
+        readline.set_completer_delims(" \t\n")
+        readline.parse_and_bind("tab: complete")
+
+    count = 0
+    with open(vocab_path, "a") as f:
+        while True:
+            try:
+                word = input("单词> ").strip()
+            except EOFError:
+                break
+            if not word:
+                break
+            if not ecdict.sd.query(word):
+                candidates = ecdict.complete(word, 5)
+                hint = f", 是否想输入: {', '.join(candidates)}" if candidates else ""
+                logger.warning(f"ECDICT 中没有 {word}{hint}")
+            f.write(word + "\n")
+            count += 1
+    logger.info(f"共 {count} 个单词已添加进 {vocab_path}")
+
+
+def check_spelling(ecdict, words, autocorrect=False):
+    """
+    ECDICT 中找不到的单词报告并跳过；autocorrect 时有唯一最接近的拼写就自动纠正。
+    返回 (保留的单词, 跳过的单词, [(原单词, 纠正后), ...])
+    """
+    result = []
+    skipped = []
+    corrections = []
+    for word, known in zip(words, ecdict.known(words)):
+        if known:
+            result.append(word)
+            continue
+        suggestions = ecdict.suggest(word)
+        best = [text for text, d in suggestions if d == suggestions[0][1]]
+        if autocorrect and len(best) == 1:
+            logger.info(f"拼写纠正: {word} -> {best[0]}")
+            result.append(best[0])
+            corrections.append((word, best[0]))
+            continue
+        skipped.append(word)
+        if suggestions:
+            hint = ", ".join(text for text, _ in suggestions)
+            logger.warning(f"词典中没有 '{word}'，已跳过。是否想输入: {hint}")
+        else:
+            logger.warning(f"词典中没有 '{word}'，已跳过")
+    return result, skipped, corrections
+
+
+def collapse_lemmas(ecdict, words):
+    """studied, study, mice -> study, mouse (保持原有顺序)"""
+    result = []
+    seen = set()
+    for word, lemma in zip(words, ecdict.lemmatize(words)):
+        if lemma != word:
+            logger.info(f"{word} -> {lemma}")
+        if lemma.lower() in seen:
+            continue
+        seen.add(lemma.lower())
+        result.append(lemma)
+    if len(result) < len(words):
+        logger.info(f"合并变形与重复单词后剩余 {len(result)}/{len(words)} 个单词")
+    return result
+
+
+async def run_stages(stages: dict, results: dict = None) -> dict:
+    """
+    按依赖关系运行各阶段：stages 为 名称 -> (依赖的阶段, 返回协程的函数)，
+    依赖都完成的阶段立即开始，互不依赖的阶段并发运行，返回 名称 -> 结果。
+    已完成阶段的结果保存在 results 中并且不再重复运行，重试时传入同一个字典即可。
+    任一阶段失败时取消其余阶段，等它们结束后再抛出该异常；
+    阶段自己被取消（不是 run_stages 被取消）也算失败，抛出 RuntimeError。
+    """
+    results = {} if results is None else results
+    running = {}
+    try:
+        while len(results) < len(stages):
+            for name, (deps, start) in stages.items():
+                if name in results or name in running:
+                    continue
+                if all(dep in results for dep in deps):
+                    running[name] = asyncio.ensure_future(start())
+            if not running:
+                missing = sorted(set(stages) - set(results))
+                raise ValueError(f"无法满足的阶段依赖: {missing}")
+            done, _ = await asyncio.wait(
+                running.values(), return_when=asyncio.FIRST_COMPLETED
+            )
+            failed = None
+            for name, task in list(running.items()):
+                if task not in done:
+                    continue
+                del running[name]
+                if task.cancelled():
+                    # CancelledError is a BaseException: turn it into a
+                    # failure that the retry loop and gather() handle
+                    error = RuntimeError(f"阶段 '{name}' 被取消")
+                else:
+                    error = task.exception()
+                if error is None:
+                    results[name] = task.result()
+                elif failed is None:
+                    failed = error
+            if failed is not None:
+                # the finally cancels the stages still running
+                raise failed
+        return results
+    finally:
+        # also reached when process_word itself is cancelled
+        for task in running.values():
+            task.cancel()
+        await asyncio.gather(*running.values(), return_exceptions=True)
+
 
-    # Get ECDICT definition
+async def fetch_ecdict(ecdict, word):
     dict_def = await ecdict.ret_word(word)
     if not dict_def:
         raise Exception("Failed to get ECDICT definition")
-    data["ECDict"] = dict_def
+    return dict_def
 
+
+async def fetch_audio(youdao, word):
+    # Get audio pronunciation from gtts
+    audio_path = await youdao._get_audio(word)
+    if not audio_path:
+        raise Exception("Failed to get audio")
+    return audio_path
+
+
+async def fetch_youdao(youdao, word):
     # Get Youdao dictionary information
     youdao_result = await youdao.get_word_info(word)
     if not youdao_result:
         raise Exception("Failed to get Youdao information")
+    return youdao_result
 
-    data["Youdao"] = youdao_result
 
+async def fetch_ai(ai, word):
+    try:
+        return await ai.explain(word)
+    except Exception as e:
+        raise Exception(f"Failed to get AI explanation: {str(e)}")
+
+
+def word_stages(word, ai, youdao, ecdict) -> dict:
+    # ECDICT first: it is local, so a miss fails before any network work;
+    # the remote stages don't depend on each other and run side by side
+    stages = {
+        "ecdict": ((), lambda: fetch_ecdict(ecdict, word)),
+        "audio": (("ecdict",), lambda: fetch_audio(youdao, word)),
+        "youdao": (("ecdict",), lambda: fetch_youdao(youdao, word)),
+    }
     # Get AI explanation if AI is enabled
     if ai is not None:
-        try:
-            ai_explanation = await ai.explain(word)
-            data["AI"] = ai_explanation
-        except Exception as e:
-            raise Exception(f"Failed to get AI explanation: {str(e)}")
-    else:
-        data["AI"] = {}
+        stages["ai"] = (("ecdict",), lambda: fetch_ai(ai, word))
+    return stages
+
+
+async def process_word(word, ai, anki, youdao, ecdict, audio_files, results=None):
+    results = await run_stages(word_stages(word, ai, youdao, ecdict), results)
+
+    data = {}
+    data["Word"] = word
+    data["ECDict"] = results["ecdict"]
+    # 只使用文件名作为 sound 标签的值
+    data["Pronunciation"] = os.path.basename(results["audio"])
+    data["Youdao"] = results["youdao"]
+    data["AI"] = results.get("ai", {})
 
     # TODO: Longman English explain
 
     # Add note to deck
     anki.add_note(data)
+    # 卡片加入成功后才记录音频，重试时不会重复打包
+    audio_files.append(results["audio"])
     return True
 
 
-semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
-
-
 async def process_word_with_retries(word, ai, anki, youdao, ecdict, audio_files):
     """
-    包含了重试和退避逻辑
+    包含了重试和退避逻辑，重试时只重新运行失败和被取消的阶段
     """
+    results = {}
     for attempt in range(MAX_RETRIES):
         try:
-            async with semaphore:
-                result = await process_word(word, ai, anki, youdao, ecdict, audio_files)
-            return result
+            return await process_word(
+                word, ai, anki, youdao, ecdict, audio_files, results
+            )
         except Exception as e:
             logger.warning(
                 f"处理 '{word}' 第 {attempt + 1}/{MAX_RETRIES} 次尝试失败: {e}"
@@ -315,6 +643,14 @@ async def process_word_with_retries(word, ai, anki, youdao, ecdict, audio_files)
             await asyncio.sleep(RETRY_DELAY)
 
 
+def format_limits(ai, youdao) -> str:
+    """各后端的并发：进行中/当前上限，如 gtts 3/8 youdao 8/8 llm 4/5"""
+    limiters = [youdao.audio_limiter, youdao.limiter]
+    if ai is not None:
+        limiters.append(ai.limiter)
+    return " ".join(str(limiter) for limiter in limiters)
+
+
 async def task_wrapper(pbar, word, ai, anki, youdao, ecdict, audio_files):
     """
     运行带重试逻辑的任务，并确保进度条在最后总会更新。
@@ -327,6 +663,7 @@ async def task_wrapper(pbar, word, ai, anki, youdao, ecdict, audio_files):
         pbar.set_description(f"'{word}' 处理失败")
         raise
     finally:
+        pbar.set_postfix_str(format_limits(ai, youdao), refresh=False)
         pbar.update(1)
 
 
@@ -1,52 +1,671 @@
+import array
+import asyncio
+import io
+import json
 import os
-import sqlite3
+import queue
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from anki_packager.logger import logger
 from anki_packager.utils import get_user_config_dir
 
 from anki_packager.dict import stardict
+from anki_packager.dict import mdx
 
 # https://github.com/liuyug/mdict-utils
-from mdict_utils.reader import query
 from mdict_utils.utils import ElapsedTimer
 
 
+class _PipeClosed(Exception):
+    """The reading side of a `_PipeReader` went away"""
+
+
+class _PipeReader(io.RawIOBase):
+    """Read end of a bounded pipe, fed by `_PipeWriter` from another thread
+
+    Closing it early (the consumer failed) makes the writer raise
+    `_PipeClosed`, which stops the producer thread; close() waits up to
+    `join_timeout` seconds for that thread.
+    """
+
+    def __init__(self, maxsize=8, join_timeout=5.0):
+        self.queue = queue.Queue(maxsize)
+        self.error = None
+        self.thread = None
+        self.join_timeout = join_timeout
+        self._buffer = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            chunk = self.queue.get()
+            if chunk is None:
+                if self.error is not None:
+                    raise self.error
+                return 0
+            self._buffer = memoryview(chunk)
+        n = min(len(b), len(self._buffer))
+        b[:n] = self._buffer[:n]
+        self._buffer = self._buffer[n:]
+        return n
+
+    def put(self, chunk):
+        """Called by the producer, gives up once the reader is closed"""
+        while not self.closed:
+            try:
+                self.queue.put(chunk, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+        raise _PipeClosed()
+
+    def close(self):
+        if self.closed:
+            return
+        super().close()
+        self._buffer = memoryview(b"")
+        if self.thread is not None:
+            self.thread.join(self.join_timeout)
+            if self.thread.is_alive():
+                logger.warning("7z 解压线程未能及时退出")
+
+
+class _PipeWriter:
+    """Path-like sink py7zr's extraction worker writes decompressed data to"""
+
+    def __init__(self, reader, chunk_size=1 << 20):
+        self.reader = reader
+        self.chunk_size = chunk_size
+
+    @property
+    def parent(self):
+        return self
+
+    def mkdir(self, *args, **kwargs):
+        return None
+
+    def open(self, mode=None):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def write(self, data):
+        for i in range(0, len(data), self.chunk_size):
+            self.reader.put(bytes(data[i : i + self.chunk_size]))
+        return len(data)
+
+    def seek(self, position):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _ExtractedFile(io.FileIO):
+    """A file extracted into a temporary directory, removed on close"""
+
+    def __init__(self, tmpdir, name):
+        self.tmpdir = tmpdir
+        super().__init__(os.path.join(tmpdir.name, name), "rb")
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.tmpdir.cleanup()
+
+
+def _can_stream(ar):
+    """Whether py7zr has the (private) worker API open_7z_csv streams with"""
+    worker = getattr(ar, "worker", None)
+    return all(
+        callable(getattr(worker, name, None))
+        for name in ("register_filelike", "extract")
+    ) and hasattr(ar, "fp")
+
+
+def open_7z_csv(path, encoding="utf-8"):
+    """Return a text stream of the .csv member of a 7z archive
+
+    The member is decompressed by a background thread into a bounded pipe,
+    so the csv never touches the disk and is never held in memory whole.
+    That relies on py7zr internals (tested with the pinned 0.22); when they
+    are missing the member is extracted into a temporary directory instead.
+    """
+    import py7zr
+
+    ar = py7zr.SevenZipFile(path, mode="r")
+    names = [n for n in ar.getnames() if n.lower().endswith(".csv")]
+    if not names:
+        ar.close()
+        raise FileNotFoundError(f"{path} 中没有 csv 文件!")
+
+    if not _can_stream(ar):
+        logger.info("当前 py7zr 不支持流式解压，改为解压到临时目录")
+        tmpdir = tempfile.TemporaryDirectory(dir=os.path.dirname(path))
+        try:
+            with ar:
+                ar.extract(path=tmpdir.name, targets=[names[0]])
+            raw = _ExtractedFile(tmpdir, names[0])
+        except BaseException:
+            tmpdir.cleanup()
+            raise
+        return io.TextIOWrapper(
+            io.BufferedReader(raw, buffer_size=1 << 20), encoding=encoding, newline=""
+        )
+
+    reader = _PipeReader()
+    writer = _PipeWriter(reader)
+    for f in ar.files:
+        ar.worker.register_filelike(f.id, writer if f.filename == names[0] else None)
+
+    def extract():
+        try:
+            ar.worker.extract(ar.fp, None, parallel=False)
+        except _PipeClosed:
+            pass
+        except Exception as e:
+            reader.error = e
+        finally:
+            ar.close()
+            try:
+                reader.put(None)
+            except _PipeClosed:
+                pass
+
+    reader.thread = threading.Thread(target=extract, daemon=True)
+    reader.thread.start()
+    stream = io.BufferedReader(reader, buffer_size=1 << 20)
+    return io.TextIOWrapper(stream, encoding=encoding, newline="")
+
+
+class HotSet:
+    """The most frequent ECDICT entries (by frq/bnc), held in memory
+
+    Columns are stored side by side: integer fields in `array`s (None is
+    kept as a sentinel), text fields in lists with repeated short strings
+    interned. Each entry also carries its MDX distribution/differentiation
+    record, so a hit needs neither SQLite nor the sidecars.
+
+    `get` only looks up; lookups are counted with `count`, which may be
+    called from several executor threads at once.
+    """
+
+    NUMBERS = ("id", "collins", "oxford", "bnc", "frq")
+    INTERNED = ("word", "sw", "pos", "tag")
+    NULL = -(1 << 31)
+
+    def __init__(self, records, distribution, diffrentiation):
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = {}
+        self._columns = {}
+        for name in stardict.RECORD_FIELDS:
+            self._columns[name] = array.array("l") if name in self.NUMBERS else []
+        self._distribution = []
+        self._diffrentiation = []
+        for data in records:
+            if not data or data["word"].lower() in self._index:
+                continue
+            self._index[data["word"].lower()] = len(self._index)
+            for name, column in self._columns.items():
+                value = data[name]
+                if name in self.NUMBERS:
+                    value = self.NULL if value is None else value
+                elif name == "detail" and value is not None:
+                    value = json.dumps(value, ensure_ascii=False)
+                elif name in self.INTERNED and value is not None:
+                    value = sys.intern(value)
+                column.append(value)
+            self._distribution.append(distribution.get(data["word"]))
+            self._diffrentiation.append(diffrentiation.get(data["word"]))
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, word):
+        return word.lower() in self._index
+
+    def get(self, word):
+        """(record, distribution, diffrentiation) of `word`, or None on a miss"""
+        i = self._index.get(word.lower())
+        if i is None:
+            return None
+        row = []
+        for name, column in self._columns.items():
+            value = column[i]
+            if value == self.NULL and name in self.NUMBERS:
+                value = None
+            row.append(value)
+        record = stardict.StarRecord(tuple(row))
+        return record, self._distribution[i], self._diffrentiation[i]
+
+    def count(self, hits, misses):
+        """Add the hits/misses of one batch to the counters"""
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
 class Ecdict:
-    def __init__(self):
+    # schema the sidecar is attached as -> mdx file in the dicts directory
+    MDX_FILES = {
+        "distribution": "单词释义比例词典-带词性.mdx",
+        "diffrentiation": "有道词语辨析.mdx",
+    }
+
+    def __init__(
+        self,
+        batch_delay: float = 0.005,
+        workers: int = 4,
+        slim: bool = True,
+        hot_size: int = 0,
+        build_index: bool = False,
+    ):
         self.config_dir = get_user_config_dir()
         self.dicts_dir = os.path.join(self.config_dir, "dicts")
         # keep the package archive small
         self.seven_zip = os.path.join(self.dicts_dir, "stardict.7z")
         self.csv = os.path.join(self.dicts_dir, "stardict.csv")
         self.sqlite = os.path.join(self.dicts_dir, "stardict.db")
+        # a newly built stardict.db leaves out pos/detail/audio and junk
+        # headwords and zstd-compresses long texts, see stardict.bulk_load
+        self.slim = slim
         self._convert()
-        self.conn = sqlite3.connect(self.sqlite)
-        self.cursor = self.conn.cursor()
-        self.sd = stardict.StarDict(self.sqlite, False)
+        # indexes and sidecars are only written here (and on first use);
+        # otherwise the dictionaries are opened strictly read-only
+        if build_index:
+            self.build_index(fts=True)
+        self._open()
+        # the hot_size most frequent entries are answered from memory
+        self.hot = None
+        if hot_size > 0:
+            self.hot = self._load_hot(hot_size)
+        # ret_word() calls from concurrent tasks are collected for
+        # `batch_delay` seconds and answered by a single batch lookup
+        self.batch_delay = batch_delay
+        self._pending = {}
+        self._flush_handle = None
+        # batch lookups run on a bounded thread pool (each thread gets its own
+        # read-only connection) so they never block the event loop;
+        # workers=0 runs them inline on the event loop thread
+        self._executor = None
+        if workers > 0:
+            self._executor = ThreadPoolExecutor(workers, "ecdict")
 
     def __del__(self):
-        if hasattr(self, "conn"):
-            self.cursor.close()
-            self.conn.close()
+        if getattr(self, "_executor", None) is not None:
+            self._executor.shutdown(wait=False)
+        if hasattr(self, "sd"):
+            self.sd.close()
+        for reader in getattr(self, "_mdx_readers", {}).values():
+            reader.close()
 
     def _convert(self):
-        if not os.path.exists(self.csv):
-            # unzip stardict.csv in 7zip
+        """First use: convert stardict.db and compile the MDX sidecars"""
+        if not os.path.exists(self.sqlite):
+            self._build()
+            self.build_index()
+
+    def build_index(self, fts=False):
+        """Build the derived indexes and MDX sidecars that are missing or stale
+
+        The optional FTS5 index (it is large) is only built with `fts`.
+        This is the only place that writes to the dictionaries directory
+        after the conversion; at runtime anything missing is reported by
+        _open() and looked up the slow way.
+        """
+        sd = stardict.StarDict(self.sqlite, logger.info)
+        try:
+            # databases built by older versions lack the derived indexes
+            if not sd.has_lemma_index():
+                logger.info("正在建立词形索引 stardict_lemma")
+                sd.build_lemma_index()
+            if not sd.has_spell_index():
+                logger.info("正在建立拼写纠错索引 stardict_spell")
+                sd.build_spell_index()
+            if not sd.has_select_index():
+                logger.info("正在建立筛选索引 stardict_tag")
+                sd.build_select_index()
+            if fts and not sd.has_fts_index():
+                logger.info("正在建立全文索引 stardict_fts")
+                sd.build_fts_index()
+            # the prefix index is stamped with the database file: build it
+            # after everything else has been written
+            if not self._has_prefix_index():
+                logger.info("正在建立前缀索引 stardict.db.prefix")
+                sd.build_prefix_index()
+        finally:
+            sd.close()
+        for filename in self.MDX_FILES.values():
+            mdx.ensure_sidecar(os.path.join(self.dicts_dir, filename))
+
+    def _build(self):
+        tmp = self.sqlite + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        logger.info("耐心等待(790M): 正在转换数据库 anki_packager/dicts/stardict.db")
+        if os.path.exists(self.csv):
+            stardict.convert_dict(tmp, self.csv, slim=self.slim, verbose=logger.info)
+        else:
+            # stream stardict.csv out of stardict.7z, nothing is extracted to disk
             if not os.path.exists(self.seven_zip):
                 raise FileNotFoundError(f"{self.seven_zip} 未找到!")
+            logger.info("首次使用: 正在从 anki_packager/dicts/stardict.7z 读取词典")
+            sd = stardict.StarDict(tmp, logger.info)
+            # closing the stream on failure also stops the extraction thread
+            with open_7z_csv(self.seven_zip) as fp:
+                sd.bulk_load(stardict.csv_records(fp), slim=self.slim)
+            sd.close()
+        # only a complete database ever appears under the final name
+        os.replace(tmp, self.sqlite)
 
-            import py7zr
+    def _open(self):
+        # the dictionary is static: one read-only, immutable, mmap'ed connection
+        self.sd = stardict.StarDict(self.sqlite, False, readonly=True)
+        missing = [
+            name
+            for name, exists in (
+                ("stardict_lemma", self.sd.has_lemma_index),
+                ("stardict_spell", self.sd.has_spell_index),
+                ("stardict_tag", self.sd.has_select_index),
+                ("stardict.db.prefix", lambda: self.sd.prefix_index() is not None),
+            )
+            if not exists()
+        ]
+        if missing:
+            logger.warning(
+                f"stardict.db 缺少索引 {', '.join(missing)}，将使用较慢的查询，"
+                "运行 apkger --build_index 建立"
+            )
+        # mdx dictionaries are compiled into sqlite sidecars by build_index()
+        self._mdx_readers = {}
+        for schema, filename in self.MDX_FILES.items():
+            self._attach_mdx(schema, filename)
 
-            logger.info("首次使用: 正在解压词典到 anki_packager/dicts/stardict.csv")
-            ar = py7zr.SevenZipFile(self.seven_zip, mode="r")
-            ar.extractall(path=self.dicts_dir)
-            ar.close()
+    def _has_prefix_index(self):
+        sd = stardict.StarDict(self.sqlite, False, readonly=True)
+        try:
+            return sd.prefix_index() is not None
+        finally:
+            sd.close()
 
-        if not os.path.exists(self.sqlite):
-            logger.info(
-                "耐心等待(790M): 正在转换数据库 anki_packager/dicts/stardict.db"
+    def _attach_mdx(self, schema, filename):
+        mdx_path = os.path.join(self.dicts_dir, filename)
+        if not os.path.exists(mdx_path):
+            raise FileNotFoundError(f"{mdx_path} 未找到!")
+        db_path = mdx.sidecar_path(mdx_path)
+        if mdx.sidecar_is_fresh(mdx_path, db_path):
+            self.sd.attach(db_path, schema)
+            return
+        # a missing or stale sidecar is not rebuilt here, the dictionaries
+        # may sit on a read-only volume: read the .mdx directly instead
+        logger.warning(
+            f"{os.path.basename(db_path)} 缺失或已过期，将直接读取 {filename}（较慢），"
+            "运行 apkger --build_index 重新编译"
+        )
+        self._mdx_readers[schema] = mdx.MdxReader(mdx_path)
+
+    def _query_mdx(self, schema, word):
+        if schema in self._mdx_readers:
+            return self._mdx_readers[schema].lookup(word)
+        row = self.sd.execute(
+            f"SELECT paraphrase FROM {schema}.mdx WHERE entry = ?", (word,)
+        ).fetchone()
+        return row[0] if row else ""
+
+    def _query_mdx_batch(self, schema, words, chunk=500):
+        """Return {entry: paraphrase} for those of `words` found in the sidecar"""
+        words = list(set(words))
+        records = {}
+        if schema in self._mdx_readers:
+            for word in words:
+                text = self._mdx_readers[schema].lookup(word)
+                if text:
+                    records[word] = text
+            return records
+        for i in range(0, len(words), chunk):
+            part = words[i : i + chunk]
+            marks = ", ".join("?" * len(part))
+            cursor = self.sd.execute(
+                f"SELECT entry, paraphrase FROM {schema}.mdx WHERE entry IN ({marks})",
+                part,
+            )
+            records.update(cursor.fetchall())
+        return records
+
+    def _load_hot(self, size):
+        """Preload the `size` entries with the best frq/bnc rank into a HotSet"""
+        with ElapsedTimer(verbose=False) as timer:
+            cursor = self.sd.execute(
+                "SELECT id FROM stardict WHERE frq > 0 OR bnc > 0 "
+                "ORDER BY min(coalesce(nullif(frq, 0), 1 << 31), "
+                "coalesce(nullif(bnc, 0), 1 << 31)) LIMIT ?",
+                (size,),
+            )
+            ids = [row[0] for row in cursor]
+            records = self.sd.query_batch(ids) or []
+            words = [data["word"] for data in records if data]
+            hot = HotSet(
+                records,
+                self._query_mdx_batch("distribution", words),
+                self._query_mdx_batch("diffrentiation", words),
             )
-            stardict.convert_dict(self.sqlite, self.csv)
+        logger.info(f"已预加载 {len(hot)} 个高频词 ({timer.secs:.2f}s)")
+        return hot
+
+    def hot_stats(self):
+        """Hit/miss counters of the hot set, None if it is disabled"""
+        if self.hot is None:
+            return None
+        return {
+            "size": len(self.hot),
+            "hits": self.hot.hits,
+            "misses": self.hot.misses,
+            "hit_rate": self.hot.hit_rate,
+        }
+
+    def _query_batch(self, words, count=False):
+        """sd.query_batch, with hot-set hits answered from memory
+
+        Returns (records, mdx) where mdx maps the index of each hot hit to
+        its (distribution, diffrentiation) records. With `count` the lookups
+        go into the hot set's hit/miss counters.
+        """
+        if self.hot is None:
+            return list(self.sd.query_batch(words) or [None] * len(words)), {}
+        rows = [None] * len(words)
+        mdx = {}
+        missing = []
+        for i, word in enumerate(words):
+            found = self.hot.get(word) if word else None
+            if found is None:
+                missing.append(i)
+            else:
+                rows[i] = found[0]
+                mdx[i] = found[1:]
+        if missing:
+            records = self.sd.query_batch([words[i] for i in missing]) or []
+            for i, data in zip(missing, records):
+                rows[i] = data
+        if count:
+            self.hot.count(len(mdx), sum(1 for i in missing if words[i]))
+        return rows, mdx
+
+    def ret_words(self, words):
+        """Batch version of ret_word: one query_batch plus one query per mdx
+
+        Words in the hot set skip both. Returns a list aligned with `words`,
+        None for words not in ECDICT.
+        """
+        rows, hot = self._query_batch(words, count=True)
+        # inflected forms missing from ECDICT fall back to their lemma
+        missing = [word for word, data in zip(words, rows) if not data]
+        if missing:
+            lemmas = dict(zip(missing, self.sd.lemma_batch(missing)))
+            known = [lemma for lemma in lemmas.values() if lemma]
+            records = dict(zip(known, self.sd.query_batch(known) or []))
+            for i, data in enumerate(rows):
+                if not data:
+                    rows[i] = records.get(lemmas[words[i]])
+        found = [data["word"] for i, data in enumerate(rows) if data and i not in hot]
+        distribution = self._query_mdx_batch("distribution", found)
+        diffrentiation = self._query_mdx_batch("diffrentiation", found)
+        result = []
+        for i, data in enumerate(rows):
+            if data:
+                if i in hot:
+                    mdx = hot[i]
+                else:
+                    mdx = (
+                        distribution.get(data["word"]),
+                        diffrentiation.get(data["word"]),
+                    )
+                # 考纲标签
+                data = self.parse_tag(data)
+                # 释义分布
+                if mdx[0]:
+                    data["distribution"] = mdx[0]
+                # 词语辨析
+                if mdx[1]:
+                    data["diffrentiation"] = mdx[1]
+            result.append(data)
+        return result
+
+    def lemmatize(self, words):
+        """Map each word to the headword worth looking up
+
+        A word is kept if ECDICT has a real entry for it. Forms that are
+        missing, or only have a stub entry like "studied: study的过去式",
+        are replaced by their lemma from the `stardict_lemma` index.
+
+        Demo:
+            Input: ["studied", "mice", "left", "foo"]
+            Output: ["study", "mouse", "left", "foo"]
+        """
+        rows, _ = self._query_batch(words)
+        lemmas = self.sd.lemma_batch(words)
+        result = []
+        for word, data, lemma in zip(words, rows, lemmas):
+            if lemma and (not data or self._is_stub(data)):
+                result.append(lemma)
+            else:
+                result.append(word)
+        return result
+
+    def _is_stub(self, data):
+        """An inflected form (exchange has "0:") without Collins/Oxford rating"""
+        exchange = data.get("exchange") or ""
+        if not any(item.startswith("0:") for item in exchange.split("/")):
+            return False
+        return not (data.get("collins") or data.get("oxford"))
+
+    def known(self, words):
+        """Whether ECDICT has an entry (or a lemma) for each of `words`"""
+        rows, _ = self._query_batch(words)
+        lemmas = self.sd.lemma_batch(words)
+        return [bool(data or lemma) for data, lemma in zip(rows, lemmas)]
+
+    def suggest(self, word, count=5):
+        """Spelling suggestions [(word, distance), ...], best first"""
+        return self.sd.suggest(word, count)
+
+    def search(self, query, field=None, limit=-1):
+        """Stream (id, word) of entries whose definition/translation match `query`
+
+        The optional FTS5 index is built by `apkger --build_index`; without
+        it every entry is scanned, unranked.
+        """
+        if not self.sd.has_fts_index():
+            logger.warning(
+                "没有全文索引 stardict_fts，将逐条扫描词典（较慢），"
+                "运行 apkger --build_index 建立"
+            )
+        return self.sd.search(query, field, limit)
+
+    def select(
+        self,
+        tag=None,
+        collins=None,
+        oxford=None,
+        frq=None,
+        bnc=None,
+        order="frq",
+        limit=-1,
+    ):
+        """Stream the headwords matching tag/rating/frequency conditions
+
+        Demo:
+            select("cet6", collins=3) -> CET6 words with collins >= 3 by frq
+            select(frq=(None, 5000), oxford=True) -> Oxford 3000 in top 5000
+        See stardict.StarDict.select for the arguments.
+        """
+        for _, word in self.sd.select(tag, collins, oxford, frq, bnc, order, limit):
+            yield word
+
+    def complete(self, prefix, limit=10):
+        """Headwords starting with `prefix`, served by the prefix index"""
+        if not prefix:
+            return []
+        index = self.sd.prefix_index()
+        if index is not None:
+            return index.complete(prefix, limit)
+        # no stardict.db.prefix: the same walk over sd.match (SQL)
+        key = prefix.lower()
+        result = []
+        for _, word in self.sd.match(prefix, limit):
+            if not word.lower().startswith(key):
+                break
+            result.append(word)
+        return result
+
+    def _flush(self):
+        """Answer every pending ret_word() with one batch lookup"""
+        pending, self._pending = self._pending, {}
+        self._flush_handle = None
+        words = list(pending)
+        if self._executor is None:
+            future = asyncio.get_running_loop().create_future()
+            try:
+                future.set_result(self.ret_words(words))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, self.ret_words, words)
+        future.add_done_callback(lambda f: self._resolve(pending, words, f))
+
+    def _resolve(self, pending, words, batch):
+        """Fan the result of one batch lookup back out to the waiting callers"""
+        if batch.exception() is not None:
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(batch.exception())
+            return
+        for word, data in zip(words, batch.result()):
+            for future in pending[word]:
+                if not future.done():
+                    # callers may modify the record, give each its own copy
+                    future.set_result(data.copy() if data else data)
 
     async def ret_word(self, word):
         """Return ECDICT data
@@ -64,28 +683,25 @@ class Ecdict:
         - exchange: 时态复数等变换，使用 "/" 分割不同项目
         - detail: json 扩展信息，字典形式保存例句（待添加）
         - audio: 读音音频 url （待添加）
+
+        pos, detail and audio are None in a slim database.
+
+        Lookups from concurrent tasks are batched, see ret_words().
+        Returns None if the word is not in ECDICT.
         """
-        data = self.sd.query(word)
-
-        # 考纲标签
-        data = self.parse_tag(data)
-        # 释义分布
-        data = self.get_distribution(data)
-        # 词语辨析
-        data = self.get_diffrentiation(data)
-        return data
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(word, []).append(future)
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_delay, self._flush)
+        return await future
 
     def get_distribution(self, data):
         """
         Get word distribution from mdx dictionary
         """
         with ElapsedTimer(verbose=False):
-            mdx_path = os.path.join(
-                get_user_config_dir(),
-                "dicts",
-                "单词释义比例词典-带词性.mdx",
-            )
-            record = query(mdx_path, data["word"])
+            record = self._query_mdx("distribution", data["word"])
             if record:
                 data["distribution"] = record
             return data
@@ -93,8 +709,7 @@ class Ecdict:
     def get_diffrentiation(self, data):
         """[《有道词语辨析》加强版](https://skywind.me/blog/archives/2941)"""
         with ElapsedTimer(verbose=False):
-            mdx_path = os.path.join(get_user_config_dir(), "dicts", "有道词语辨析.mdx")
-            record = query(mdx_path, data["word"])
+            record = self._query_mdx("diffrentiation", data["word"])
             if record:
                 data["diffrentiation"] = record
             return data
@@ -188,3 +803,45 @@ class Ecdict:
 
         data["exchange"] = " ".join(result)
         return data
+
+
+if __name__ == "__main__":
+    # event-loop lag: python -m anki_packager.dict.ecdict [words] [tasks]
+    import sys
+    import time
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+    tasks = int(sys.argv[2]) if len(sys.argv) > 2 else 40
+
+    async def measure(ecdict, words):
+        lags = []
+        done = False
+
+        async def ticker():
+            while not done:
+                t = time.perf_counter()
+                await asyncio.sleep(0.001)
+                lags.append(time.perf_counter() - t - 0.001)
+
+        async def worker(part):
+            for word in part:
+                await ecdict.ret_word(word)
+
+        tick = asyncio.create_task(ticker())
+        t = time.perf_counter()
+        await asyncio.gather(*[worker(words[i::tasks]) for i in range(tasks)])
+        elapsed = time.perf_counter() - t
+        done = True
+        await tick
+        lags.sort()
+        return elapsed, lags[len(lags) // 2], lags[int(len(lags) * 0.99)], lags[-1]
+
+    for workers in (0, 4):
+        ecdict = Ecdict(workers=workers)
+        words = [word for _, word in ecdict.sd][: count * 7 : 7]
+        elapsed, p50, p99, worst = asyncio.run(measure(ecdict, words))
+        print(
+            f"workers={workers}: {len(words)} words in {elapsed:.2f}s, "
+            f"loop lag p50 {p50 * 1000:.2f} ms, p99 {p99 * 1000:.2f} ms, "
+            f"max {worst * 1000:.2f} ms"
+        )
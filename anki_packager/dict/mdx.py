@@ -0,0 +1,320 @@
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from urllib.request import pathname2url
+
+from anki_packager.logger import logger
+
+# https://github.com/liuyug/mdict-utils
+from mdict_utils.base.readmdict import MDX
+
+# bump when the sidecar layout changes so stale files get rebuilt
+SIDECAR_VERSION = "1"
+
+
+class MdxReader:
+    """Long-lived .mdx reader
+
+    `mdict_utils.reader.query` re-opens the file, re-parses the header and all
+    key blocks and decompresses a record block from scratch for every single
+    lookup. This reader does the expensive part once:
+
+    - the file is memory-mapped for the lifetime of the reader
+    - keys are kept as a sorted list with a parallel record-offset list
+    - decompressed record blocks are kept in a small LRU cache
+
+    `lookup` returns exactly what `query` returns for the same word.
+    """
+
+    def __init__(self, path: str, cache_size: int = 64):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} 未找到!")
+        self.path = path
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+
+        md = MDX(path)
+        self._md = md
+        self._encoding = md._encoding
+
+        # key -> (record offset, record length), sorted by key
+        entries = []
+        key_list = md._key_list
+        for i, (offset, key) in enumerate(key_list):
+            if i + 1 < len(key_list):
+                length = key_list[i + 1][0] - offset
+            else:
+                length = -1
+            entries.append((key, offset, length))
+        entries.sort(key=lambda x: x[0])
+        self._keys = [e[0] for e in entries]
+        self._offsets = [e[1] for e in entries]
+        self._lengths = [e[2] for e in entries]
+        # the parsed key list is no longer needed
+        md._key_list = []
+
+        self._fp = open(path, "rb")
+        self._mm = mmap.mmap(self._fp.fileno(), 0, access=mmap.ACCESS_READ)
+        # (file offset, compressed size, decompressed offset, decompressed size)
+        self._blocks = self._read_block_table()
+        self._block_starts = [b[2] for b in self._blocks]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, word):
+        key = word.encode("utf-8")
+        i = bisect_left(self._keys, key)
+        return i < len(self._keys) and self._keys[i] == key
+
+    def close(self):
+        if getattr(self, "_mm", None) is not None:
+            self._mm.close()
+            self._fp.close()
+            self._mm = None
+
+    def __del__(self):
+        self.close()
+
+    def _read_block_table(self):
+        md = self._md
+        mm = self._mm
+        pos = md._record_block_offset
+        width = md._number_width
+        fmt = md._number_format
+
+        def number():
+            nonlocal pos
+            value = struct.unpack(fmt, mm[pos : pos + width])[0]
+            pos += width
+            return value
+
+        def int32():
+            nonlocal pos
+            value = struct.unpack(">I", mm[pos : pos + 4])[0]
+            pos += 4
+            return value
+
+        blocks = []
+        decompressed_offset = 0
+        if md._version >= 3:
+            num_record_blocks = int32()
+            number()  # num_bytes
+            for _ in range(num_record_blocks):
+                decompressed_size = int32()
+                compressed_size = int32()
+                blocks.append(
+                    (pos, compressed_size, decompressed_offset, decompressed_size)
+                )
+                decompressed_offset += decompressed_size
+                pos += compressed_size
+        else:
+            num_record_blocks = number()
+            number()  # num_entries
+            record_block_info_size = number()
+            number()  # record_block_size
+            compressed_offset = pos + record_block_info_size
+            for _ in range(num_record_blocks):
+                compressed_size = number()
+                decompressed_size = number()
+                blocks.append(
+                    (
+                        compressed_offset,
+                        compressed_size,
+                        decompressed_offset,
+                        decompressed_size,
+                    )
+                )
+                decompressed_offset += decompressed_size
+                compressed_offset += compressed_size
+        return blocks
+
+    def _block(self, index):
+        """Return a decompressed record block, going through the LRU cache"""
+        block = self._cache.get(index)
+        if block is not None:
+            self._cache.move_to_end(index)
+            return block
+        file_offset, compressed_size, _, decompressed_size = self._blocks[index]
+        compressed = self._mm[file_offset : file_offset + compressed_size]
+        block = self._md._decode_block(compressed, decompressed_size)
+        self._cache[index] = block
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return block
+
+    def _record(self, offset, length):
+        index = bisect_right(self._block_starts, offset) - 1
+        block = self._block(index)
+        start = offset - self._blocks[index][2]
+        if length > 0:
+            data = block[start : start + length]
+        else:
+            data = block[start:]
+        return data.strip().decode(self._encoding)
+
+    def lookup(self, word: str) -> str:
+        """Return the record(s) of `word`, or an empty string if not found"""
+        key = word.encode("utf-8")
+        lo = bisect_left(self._keys, key)
+        hi = bisect_right(self._keys, key, lo)
+        if lo == hi:
+            return ""
+        with self._lock:
+            records = [
+                self._record(self._offsets[i], self._lengths[i]) for i in range(lo, hi)
+            ]
+        return "\n---\n".join(records)
+
+    def items(self):
+        """Yield (word, record) for every distinct key, in key order"""
+        keys = self._keys
+        i = 0
+        while i < len(keys):
+            key = keys[i]
+            j = bisect_right(keys, key, i)
+            word = key.decode("utf-8")
+            yield word, self.lookup(word)
+            i = j
+
+
+def sidecar_path(mdx_path: str) -> str:
+    """单词释义比例词典-带词性.mdx -> 单词释义比例词典-带词性.db"""
+    return os.path.splitext(mdx_path)[0] + ".db"
+
+
+def _source_stamp(mdx_path):
+    st = os.stat(mdx_path)
+    return {
+        "version": SIDECAR_VERSION,
+        "size": str(st.st_size),
+        "mtime": str(st.st_mtime_ns),
+    }
+
+
+def sidecar_is_fresh(mdx_path: str, db_path: str) -> bool:
+    """True if `db_path` was compiled from the current `mdx_path`
+
+    Only reads, so it also works on a read-only volume.
+    """
+    if not os.path.exists(db_path):
+        return False
+    try:
+        stamp = _source_stamp(mdx_path)
+        uri = "file:" + pathname2url(os.path.abspath(db_path)) + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True)
+        try:
+            meta = dict(conn.execute("SELECT key, value FROM meta"))
+        finally:
+            conn.close()
+    except (OSError, sqlite3.Error):
+        return False
+    return all(meta.get(k) == v for k, v in stamp.items())
+
+
+def compile_sidecar(mdx_path: str, db_path: str = None) -> str:
+    """Compile an .mdx into an indexed SQLite file
+
+    Table `mdx(entry, paraphrase)` holds one row per distinct key with the
+    same text `MdxReader.lookup` returns; table `meta` records the size and
+    mtime of the source so the sidecar can be invalidated.
+    """
+    db_path = db_path or sidecar_path(mdx_path)
+    stamp = _source_stamp(mdx_path)
+    tmp = db_path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    reader = MdxReader(mdx_path)
+    conn = sqlite3.connect(tmp)
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        conn.execute(
+            "CREATE TABLE mdx (entry TEXT PRIMARY KEY, paraphrase TEXT NOT NULL) "
+            "WITHOUT ROWID"
+        )
+        conn.executemany("INSERT INTO mdx VALUES (?, ?)", reader.items())
+        conn.executemany("INSERT INTO meta VALUES (?, ?)", stamp.items())
+        conn.commit()
+    finally:
+        conn.close()
+        reader.close()
+    os.replace(tmp, db_path)
+    return db_path
+
+
+def ensure_sidecar(mdx_path: str, db_path: str = None) -> str:
+    """Return the sidecar of `mdx_path`, rebuilding it if it is missing or stale
+
+    Part of the build step (see Ecdict.build_index), never called at runtime.
+    """
+    db_path = db_path or sidecar_path(mdx_path)
+    if not os.path.exists(mdx_path):
+        raise FileNotFoundError(f"{mdx_path} 未找到!")
+    if not sidecar_is_fresh(mdx_path, db_path):
+        logger.info(f"正在编译词典索引 {os.path.basename(db_path)}")
+        compile_sidecar(mdx_path, db_path)
+    return db_path
+
+
+if __name__ == "__main__":
+    # benchmark: python -m anki_packager.dict.mdx <file.mdx> [count]
+    import random
+    import shutil
+    import sys
+    import tempfile
+    import time
+
+    from mdict_utils.reader import query
+
+    mdx_path = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+    t = time.perf_counter()
+    reader = MdxReader(mdx_path)
+    print(f"open: {(time.perf_counter() - t) * 1000:.1f} ms, {len(reader)} keys")
+
+    random.seed(0)
+    words = [k.decode("utf-8") for k in random.sample(reader._keys, count)]
+
+    t = time.perf_counter()
+    expected = [query(mdx_path, word) for word in words]
+    old = (time.perf_counter() - t) / count
+
+    t = time.perf_counter()
+    actual = [reader.lookup(word) for word in words]
+    new = (time.perf_counter() - t) / count
+
+    # never touch the dictionaries directory: use the sidecar only if it is
+    # fresh, otherwise compile a throwaway one
+    tmpdir = None
+    db_path = sidecar_path(mdx_path)
+    t = time.perf_counter()
+    if not sidecar_is_fresh(mdx_path, db_path):
+        tmpdir = tempfile.mkdtemp()
+        db_path = compile_sidecar(mdx_path, os.path.join(tmpdir, "sidecar.db"))
+        print(f"compile sidecar: {(time.perf_counter() - t) * 1000:.1f} ms")
+        t = time.perf_counter()
+    uri = "file:" + pathname2url(os.path.abspath(db_path)) + "?mode=ro"
+    conn = sqlite3.connect(uri, uri=True)
+    print(f"sidecar: {(time.perf_counter() - t) * 1000:.1f} ms")
+    t = time.perf_counter()
+    sidecar = []
+    for word in words:
+        row = conn.execute("SELECT paraphrase FROM mdx WHERE entry = ?", (word,))
+        sidecar.append(row.fetchone()[0])
+    side = (time.perf_counter() - t) / count
+    conn.close()
+    if tmpdir is not None:
+        shutil.rmtree(tmpdir)
+
+    assert expected == actual == sidecar
+    print(f"mdict_utils.reader.query: {old * 1e6:10.1f} us/word")
+    print(f"MdxReader.lookup:         {new * 1e6:10.1f} us/word")
+    print(f"sqlite sidecar:           {side * 1e6:10.1f} us/word")
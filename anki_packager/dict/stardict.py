@@ -13,16 +13,34 @@ from __future__ import print_function
 import sys
 import time
 import os
+import re
 import io
 import csv
 import sqlite3
 import codecs
+import array
+import bisect
+import mmap
+import struct
+import itertools
+import threading
+import zlib
 
 try:
     import json
 except:
     import simplejson as json
 
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+try:
+    import pyzstd
+except ImportError:
+    pyzstd = None
+
 MySQLdb = None
 
 
@@ -35,6 +53,24 @@ if sys.version_info[0] >= 3:
     xrange = range
 
 
+#----------------------------------------------------------------------
+# query_batch: keys per IN (...) statement (below SQLITE_MAX_VARIABLE_NUMBER
+# of old sqlite builds), and the batch size above which a temp table is used
+#----------------------------------------------------------------------
+BATCH_CHUNK_SIZE = 500
+BATCH_TEMP_THRESHOLD = 20000
+
+# exchange 里指向变形的项目：复数、过去式、过去分词、现在分词、三单、比较级、最高级
+LEMMA_EXCHANGES = ('s', 'd', 'p', 'i', '3', 'r', 't')
+
+# 拼写纠错（SymSpell）：最大编辑距离，以及只对单词前多少个字母做删除
+SPELL_DISTANCE = 2
+SPELL_PREFIX = 7
+
+# 参与拼写纠错的常用单词：有词频、考纲标签或星级
+SPELL_WHERE = "(frq > 0 or bnc > 0 or tag != '' or collins > 0 or oxford > 0)"
+
+
 #----------------------------------------------------------------------
 # word strip
 #----------------------------------------------------------------------
@@ -42,17 +78,595 @@ def stripword(word):
     return (''.join([ n for n in word if n.isalnum() ])).lower()
 
 
+#----------------------------------------------------------------------
+# 转义编解码：csv 里的 \\ \n \r (tab 分割的 txt 还有 \t)，编码用一次
+# translate，解码用一次正则替换，没有需要处理的字符时直接返回原串
+#----------------------------------------------------------------------
+class EscapeCodec (object):
+
+    def __init__ (self, chars = '\\\n\r'):
+        names = { '\\': '\\', '\n': 'n', '\r': 'r', '\t': 't' }
+        self.__chars = chars
+        self.__encode = str.maketrans(dict([ (c, '\\' + names[c]) for c in chars ]))
+        self.__decode = dict([ (names[c], c) for c in chars ])
+        self.__pattern = re.compile(r'\\(.?)', re.S)
+
+    def __replace (self, match):
+        c = match.group(1)
+        return self.__decode.get(c, '\\' + c)
+
+    def encode (self, text):
+        if not text:
+            return text
+        for c in self.__chars:
+            if c in text:
+                return text.translate(self.__encode)
+        return text
+
+    def decode (self, text):
+        if not text or '\\' not in text:
+            return text
+        return self.__pattern.sub(self.__replace, text)
+
+
+csv_codec = EscapeCodec('\\\n\r')
+tab_codec = EscapeCodec('\\\n\r\t')
+
+
+#----------------------------------------------------------------------
+# sqlite 的 COLLATE NOCASE 只转换 ASCII 字母
+#----------------------------------------------------------------------
+NOCASE_TABLE = dict([ (ord(c), ord(c) + 32) for c in 
+    'ABCDEFGHIJKLMNOPQRSTUVWXYZ' ])
+
+def nocase(text):
+    if text.isascii():
+        return text.lower()
+    return text.translate(NOCASE_TABLE)
+
+
+#----------------------------------------------------------------------
+# PrefixIndex：前缀匹配（自动补全）索引，StarDict.match 和 DictCsv.match
+# 共用。两组按 utf-8 排好序的数组：fold(word) 和 (fold(sw), fold(word))，
+# 保存在文件里直接 mmap，另外每隔 PREFIX_FENCE 个键取一个放在内存里，
+# 先用 bisect 定位到块，再在块内二分
+#----------------------------------------------------------------------
+PREFIX_FENCE = 64
+
+class PrefixIndex (object):
+
+    # 格式：魔数 + 头部 (源文件大小、修改时间、词数、三个字符串区长度)
+    # + 键偏移 I[n+1] + 单词偏移 I[n+1] + id I[n] + sw 排序 I[n]
+    # + sw 键偏移 I[n+1] + 键区 + 单词区 + sw 键区
+    MAGIC = b'PREFIX\x00\x01'
+    HEADER = '<8s6Q'
+
+    def __init__ (self, fold = None):
+        self.__fold = fold and fold or nocase
+        self.__count = 0
+        self.__stamp = None
+        self.__data = None
+        self.__base = 0
+        self.__size = 0
+        self.__sections = None
+        self.__fences = [None, None]
+
+    # 读取索引文件，stamp 不一致（源文件改变）时返回 False
+    def load (self, filename, stamp = (0, 0)):
+        try:
+            with open(filename, 'rb') as fp:
+                data = mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            return False
+        head = struct.calcsize(self.HEADER)
+        if len(data) < head or sys.byteorder != 'little':
+            return False
+        header = struct.unpack(self.HEADER, data[:head])
+        if header[0] != self.MAGIC or tuple(header[1:3]) != tuple(stamp):
+            return False
+        self.__attach(data)
+        return True
+
+    # 从 (id, word, sw) 序列建立索引
+    def build (self, rows, stamp = (0, 0)):
+        fold = self.__fold
+        items = []
+        for id, word, sw in rows:
+            if word is None:
+                continue
+            if sw is None:
+                sw = stripword(word)
+            key = fold(word).encode('utf-8')
+            items.append((key, id, word.encode('utf-8'), 
+                fold(sw).encode('utf-8')))
+        items.sort()
+        strips = [ (n[3], n[0], i) for i, n in enumerate(items) ]
+        strips.sort()
+        parts = []
+        blobs = []
+        for keys in ([ n[0] for n in items ], [ n[2] for n in items ]):
+            parts.append(self.__offsets(keys))
+            blobs.append(b''.join(keys))
+        parts.append(array.array('I', [ n[1] for n in items ]))
+        parts.append(array.array('I', [ n[2] for n in strips ]))
+        keys = [ n[0] for n in strips ]
+        parts.append(self.__offsets(keys))
+        blobs.append(b''.join(keys))
+        header = struct.pack(self.HEADER, self.MAGIC, stamp[0], stamp[1],
+                len(items), len(blobs[0]), len(blobs[1]), len(blobs[2]))
+        data = [ header ] + [ n.tobytes() for n in parts ] + blobs
+        self.__attach(b''.join(data))
+        return True
+
+    # 使用嵌在其它文件中的索引数据（比如 DictBinary），从 offset 开始
+    def attach (self, data, offset = 0):
+        self.__attach(data, offset)
+        return True
+
+    # 索引的二进制数据
+    def tobytes (self):
+        data = self.__data[self.__base:self.__base + self.__size]
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return data
+
+    # 保存索引文件（先写临时文件再改名）
+    def save (self, filename):
+        tmp = filename + '.tmp'
+        with open(tmp, 'wb') as fp:
+            fp.write(self.tobytes())
+        os.replace(tmp, filename)
+        return True
+
+    def __offsets (self, keys):
+        offsets = array.array('I', [0])
+        pos = 0
+        for key in keys:
+            pos += len(key)
+            offsets.append(pos)
+        return offsets
+
+    def __attach (self, data, base = 0):
+        head = struct.calcsize(self.HEADER)
+        header = struct.unpack(self.HEADER, data[base:base + head])
+        count = header[3]
+        view = memoryview(data)
+        pos = base + head
+        sections = []
+        for length in (count + 1, count + 1, count, count, count + 1):
+            sections.append(view[pos:pos + length * 4].cast('I'))
+            pos += length * 4
+        for length in header[4:]:
+            sections.append(pos)
+            pos += length
+        self.__data = data
+        self.__base = base
+        self.__size = pos - base
+        self.__stamp = tuple(header[1:3])
+        self.__count = count
+        self.__sections = sections
+        self.__fences = [None, None]
+
+    # 第一个 >= key 的位置
+    def __lower_bound (self, key, strip):
+        sections = self.__sections
+        if not strip:
+            offsets, start = sections[0], sections[5]
+        else:
+            offsets, start = sections[4], sections[7]
+        data = self.__data
+        fences = self.__fences[strip and 1 or 0]
+        if fences is None:
+            fences = [ data[start + offsets[i]:start + offsets[i + 1]] 
+                    for i in xrange(0, self.__count, PREFIX_FENCE) ]
+            self.__fences[strip and 1 or 0] = fences
+        block = bisect.bisect_left(fences, key)
+        if block == 0:
+            return 0
+        top = (block - 1) * PREFIX_FENCE + 1
+        bottom = min(block * PREFIX_FENCE, self.__count)
+        while top < bottom:
+            middle = (top + bottom) >> 1
+            if data[start + offsets[middle]:start + offsets[middle + 1]] < key:
+                top = middle + 1
+            else:
+                bottom = middle
+        return top
+
+    # 返回 [(id, word), ...]，语义同 StarDict.match
+    def match (self, word, count = 10, strip = False):
+        if not self.__count:
+            return []
+        if not strip:
+            key = self.__fold(word)
+        else:
+            key = self.__fold(stripword(word))
+        pos = self.__lower_bound(key.encode('utf-8'), strip)
+        data = self.__data
+        offsets, ids, order, _, _, start = self.__sections[1:7]
+        result = []
+        for pos in xrange(pos, min(pos + count, self.__count)):
+            if strip:
+                pos = order[pos]
+            word = data[start + offsets[pos]:start + offsets[pos + 1]]
+            result.append((ids[pos], word.decode('utf-8')))
+        return result
+
+    # 以 prefix 开头的单词，最多 count 个
+    def complete (self, prefix, count = 10):
+        key = self.__fold(prefix)
+        result = []
+        for id, word in self.match(prefix, count):
+            if not self.__fold(word).startswith(key):
+                break
+            result.append(word)
+        return result
+
+    def stamp (self):
+        return self.__stamp
+
+    def __len__ (self):
+        return self.__count
+
+    # 按键的顺序返回 (id, word)
+    def __iter__ (self):
+        data = self.__data
+        offsets, ids, _, _, _, start = self.__sections[1:7]
+        for pos in xrange(self.__count):
+            word = data[start + offsets[pos]:start + offsets[pos + 1]]
+            yield (ids[pos], word.decode('utf-8'))
+
+
+#----------------------------------------------------------------------
+# 拼写纠错用的工具函数
+#----------------------------------------------------------------------
+def spell_candidate(word):
+    if not word or not word.isascii():
+        return False
+    if not (word[0].isalpha() and word[-1].isalpha()):
+        return False
+    return word.replace('-', '').replace("'", '').isalpha()
+
+# 最多删除 distance 个字母得到的所有字符串（包括自己）
+def spell_deletes(word, distance):
+    result = set([word])
+    current = [word]
+    for _ in xrange(distance):
+        following = []
+        for text in current:
+            for i in xrange(len(text)):
+                item = text[:i] + text[i + 1:]
+                if item not in result:
+                    result.add(item)
+                    following.append(item)
+        current = following
+    return result
+
+# Damerau-Levenshtein（相邻交换算一次），只计算对角线附近 limit 宽的带，
+# 超过 limit 时提前返回 limit + 1
+def edit_distance(s1, s2, limit = 2):
+    if s1 == s2:
+        return 0
+    n1, n2 = len(s1), len(s2)
+    if abs(n1 - n2) > limit:
+        return limit + 1
+    large = limit + 1
+    prev2 = None
+    prev = [ min(j, large) for j in xrange(n2 + 1) ]
+    for i in xrange(1, n1 + 1):
+        current = [large] * (n2 + 1)
+        if i <= limit:
+            current[0] = i
+        low = current[0]
+        c1 = s1[i - 1]
+        for j in xrange(max(1, i - limit), min(n2, i + limit) + 1):
+            c2 = s2[j - 1]
+            value = prev[j - 1]
+            if c1 != c2:
+                value += 1
+                if prev[j] < value:
+                    value = prev[j] + 1
+                if current[j - 1] < value:
+                    value = current[j - 1] + 1
+                if i > 1 and j > 1 and c1 == s2[j - 2] and s1[i - 2] == c2:
+                    if prev2[j - 2] < value:
+                        value = prev2[j - 2] + 1
+            current[j] = value
+            if value < low:
+                low = value
+        if low > limit:
+            return large
+        prev2, prev = prev, current
+    return min(prev[n2], large)
+
+
+#----------------------------------------------------------------------
+# 全文索引：unicode61 不会切分中文，连续的汉字切成相邻二元组，
+# 每段最后一个字单独保留，这样单字可以用前缀查询 "字"* 找到
+#----------------------------------------------------------------------
+def fts_is_cjk(c):
+    return ('\u2e80' <= c <= '\u9fff') or ('\uf900' <= c <= '\ufaff')
+
+def fts_cjk_split(text):
+    if not text:
+        return text
+    output = []
+    run = []
+    for c in text + ' ':
+        if fts_is_cjk(c):
+            run.append(c)
+            continue
+        if run:
+            tokens = [ run[i] + run[i + 1] for i in xrange(len(run) - 1) ]
+            tokens.append(run[-1])
+            output.append(' ' + ' '.join(tokens) + ' ')
+            run = []
+        output.append(c)
+    return ''.join(output[:-1])
+
+# 用户输入转为 FTS5 查询：空格分隔的每一项都要出现（AND），
+# 中文转为二元组短语，英文作为短语（会做词干匹配）
+def fts_query(text, field = None):
+    terms = []
+    for term in text.split():
+        chars = [ c for c in term if fts_is_cjk(c) ]
+        if chars and len(chars) == len(term):
+            if len(term) == 1:
+                phrase = '"%s"*'%term
+            else:
+                tokens = [ term[i:i + 2] for i in xrange(len(term) - 1) ]
+                phrase = '"%s"'%' '.join(tokens)
+        else:
+            words = fts_cjk_split(term).split()
+            phrase = '"%s"'%' '.join(words).replace('"', '""')
+        if field:
+            phrase = '%s : %s'%(field, phrase)
+        terms.append(phrase)
+    return ' AND '.join(terms)
+
+
+#----------------------------------------------------------------------
+# DictRecord：查询结果，既能当字典用也能用属性访问。直接引用数据库
+# 返回的行（不复制），detail 的 json 以及 csv 里转义过的文本在第一次
+# 读取时才解码；新加的键（比如 distribution）和改过的值另外保存
+#----------------------------------------------------------------------
+RECORD_FIELDS = ('id', 'word', 'sw', 'phonetic', 'definition', 'translation',
+    'pos', 'collins', 'oxford', 'tag', 'bnc', 'frq', 'exchange', 'detail',
+    'audio')
+
+class DictRecord (MutableMapping):
+
+    __slots__ = ('_row', '_pending', '_changed')
+
+    # name -> (bit, 行中位置, 解码函数)，由子类通过 record_layout 设置
+    _lookup = {}
+    _lazy = 0
+
+    def __init__ (self, row):
+        self._row = row
+        self._pending = self._lazy
+        self._changed = None
+
+    def __getitem__ (self, key):
+        changed = self._changed
+        if changed is not None and key in changed:
+            return changed[key]
+        bit, pos, decoder = self._lookup[key]
+        value = self._row[pos]
+        if self._pending & bit:
+            value = decoder(value)
+            self._pending &= ~bit
+            if changed is None:
+                changed = self._changed = {}
+            changed[key] = value
+        return value
+
+    def __setitem__ (self, key, value):
+        if self._changed is None:
+            self._changed = {}
+        self._changed[key] = value
+        if key in self._lookup:
+            self._pending &= ~self._lookup[key][0]
+
+    def __delitem__ (self, key):
+        if key in self._lookup:
+            raise KeyError('%s is a dictionary field'%key)
+        if self._changed is None:
+            raise KeyError(key)
+        del self._changed[key]
+
+    def __contains__ (self, key):
+        if key in self._lookup:
+            return True
+        return self._changed is not None and key in self._changed
+
+    def __iter__ (self):
+        for key in RECORD_FIELDS:
+            yield key
+        if self._changed:
+            for key in list(self._changed):
+                if key not in self._lookup:
+                    yield key
+
+    def __len__ (self):
+        count = len(RECORD_FIELDS)
+        if self._changed:
+            for key in self._changed:
+                if key not in self._lookup:
+                    count += 1
+        return count
+
+    def __getattr__ (self, name):
+        if name[:1] == '_':
+            raise AttributeError(name)
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __repr__ (self):
+        return repr(dict(self))
+
+    # 浅复制：共享原始行，已解码和改过的值各自一份
+    def copy (self):
+        record = self.__class__(self._row)
+        record._pending = self._pending
+        if self._changed is not None:
+            record._changed = dict(self._changed)
+        return record
+
+
+# 字段在行中的位置和解码函数 -> DictRecord._lookup 与 _lazy
+def record_layout(positions, decoders):
+    lookup = {}
+    lazy = 0
+    for i, name in enumerate(RECORD_FIELDS):
+        decoder = decoders.get(name)
+        bit = decoder and (1 << i) or 0
+        lookup[name] = (bit, positions[name], decoder)
+        lazy |= bit
+    return lookup, lazy
+
+def record_json(text):
+    if not text:
+        return text
+    try:
+        return json.loads(text)
+    except:
+        return None
+
+
+# sqlite/mysql：select * 的列顺序就是 RECORD_FIELDS
+STAR_POSITIONS = dict([ (n, i) for i, n in enumerate(RECORD_FIELDS) ])
+
+class StarRecord (DictRecord):
+    __slots__ = ()
+    _lookup, _lazy = record_layout(STAR_POSITIONS, { 'detail': record_json })
+
+
+# 另外带有解码函数的 StarRecord（比如 slim 词典中压缩过的文本列）
+def star_record(decoders):
+    decoders = dict(decoders)
+    decoders.setdefault('detail', record_json)
+    class SlimRecord (StarRecord):
+        __slots__ = ()
+        _lookup, _lazy = record_layout(STAR_POSITIONS, decoders)
+    return SlimRecord
+
+
+# csv：行的前 13 列是 csv 的列，后面是 id, sd, sw (见 COLUMN_ID)
+def record_csv_text(text):
+    return csv_codec.decode(text)
+
+def record_csv_number(text):
+    if text is None:
+        return None
+    return csv_helper.readint(text)
+
+def record_csv_json(text):
+    if text is None or text == '':
+        return None
+    return json.loads(text)
+
+class CsvRecord (DictRecord):
+    __slots__ = ()
+    _lookup, _lazy = record_layout(
+        { 'word': 0, 'phonetic': 1, 'definition': 2, 'translation': 3,
+          'pos': 4, 'collins': 5, 'oxford': 6, 'tag': 7, 'bnc': 8, 
+          'frq': 9, 'exchange': 10, 'detail': 11, 'audio': 12,
+          'id': 13, 'sw': 15 },
+        { 'word': record_csv_text, 'phonetic': record_csv_text, 
+          'definition': record_csv_text, 'translation': record_csv_text,
+          'pos': record_csv_text, 'tag': record_csv_text,
+          'exchange': record_csv_text, 'audio': record_csv_text,
+          'collins': record_csv_number, 'oxford': record_csv_number,
+          'bnc': record_csv_number, 'frq': record_csv_number,
+          'detail': record_csv_json })
+
+
+#----------------------------------------------------------------------
+# slim 词典：不保存 pos/detail/audio，过滤掉无效单词，definition 和
+# translation 中较长的文本用共享字典的 zstd 压缩后存为 BLOB。
+# 共享字典用导入的前 SLIM_SAMPLES 条记录训练，保存在 stardict_zstd 表
+#----------------------------------------------------------------------
+SLIM_COLUMNS = ('definition', 'translation')
+SLIM_TEXT_MIN = 48
+SLIM_SAMPLES = 50000
+SLIM_DICT_SIZE = 1 << 17
+SLIM_LEVEL = 3
+
+class TextZstd (object):
+
+    def __init__ (self, data, level = SLIM_LEVEL):
+        if pyzstd is None:
+            raise ImportError('pyzstd is required for compressed text')
+        self.data = data
+        self.__zdict = pyzstd.ZstdDict(data)
+        self.__option = { pyzstd.CParameter.compressionLevel: level,
+            pyzstd.CParameter.dictIDFlag: 0 }
+        self.__compressor = None
+
+    # 用样本文本训练共享字典，样本太少时返回 None
+    @staticmethod
+    def train (texts, size = SLIM_DICT_SIZE):
+        if pyzstd is None:
+            raise ImportError('pyzstd is required for compressed text')
+        samples = [ n.encode('utf-8') for n in texts if n ]
+        try:
+            return pyzstd.train_dict(samples, size).dict_content
+        except pyzstd.ZstdError:
+            return None
+
+    # 短文本或压缩后没有变小的文本原样返回
+    def compress (self, text):
+        if not text:
+            return text
+        data = text.encode('utf-8')
+        if len(data) < SLIM_TEXT_MIN:
+            return text
+        # 每次新建压缩器都要重新加载字典，所以复用同一个
+        compressor = self.__compressor
+        if compressor is None:
+            compressor = pyzstd.ZstdCompressor(self.__option, self.__zdict)
+            self.__compressor = compressor
+        output = compressor.compress(data, compressor.FLUSH_FRAME)
+        if len(output) >= len(data):
+            return text
+        return output
+
+    def decompress (self, value):
+        if not isinstance(value, bytes):
+            return value
+        return pyzstd.decompress(value, self.__zdict).decode('utf-8')
+
+
 #----------------------------------------------------------------------
 # StarDict 
 #----------------------------------------------------------------------
 class StarDict (object):
 
-    def __init__ (self, filename, verbose = False):
+    # readonly: 以只读、不可变 (immutable) 方式打开，用于静态词典的查询，
+    # 不执行建表语句，不加锁，数据通过 mmap 从系统页缓存读取。
+    # 只读模式下每个线程使用自己的连接，可以在线程池中并发查询
+    def __init__ (self, filename, verbose = False, readonly = False,
+            mmap_size = 1 << 30):
         self.__dbname = filename
         if filename != ':memory:':
             os.path.abspath(filename)
-        self.__conn = None
+        self.__main = None
         self.__verbose = verbose
+        self.__readonly = readonly
+        self.__mmap_size = mmap_size
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.__pool = []
+        self.__attached = []
+        self.__prefix = None
+        self.__zstd = None
+        self.__record = StarRecord
+        # 没有派生索引时（只读的旧数据库）在内存里建立的替代
+        self.__lemmas = None
+        self.__spell = None
         self.__open()
 
     # 初始化并创建必要的表格和索引
@@ -81,14 +695,19 @@ class StarDict (object):
         CREATE INDEX IF NOT EXISTS "sd_1" ON stardict (word collate nocase);
         '''
 
-        self.__conn = sqlite3.connect(self.__dbname, isolation_level = "IMMEDIATE")
-        self.__conn.isolation_level = "IMMEDIATE"
+        if self.__readonly:
+            self.__main = self.__connect()
+            self.__local.conn = self.__main
+        else:
+            self.__main = sqlite3.connect(self.__dbname,
+                    isolation_level = "IMMEDIATE")
+            self.__main.isolation_level = "IMMEDIATE"
 
-        sql = '\n'.join([ n.strip('\t') for n in sql.split('\n') ])
-        sql = sql.strip('\n')
+            sql = '\n'.join([ n.strip('\t') for n in sql.split('\n') ])
+            sql = sql.strip('\n')
 
-        self.__conn.executescript(sql)
-        self.__conn.commit()
+            self.__main.executescript(sql)
+            self.__main.commit()
 
         fields = ( 'id', 'word', 'sw', 'phonetic', 'definition', 
             'translation', 'pos', 'collins', 'oxford', 'tag', 'bnc', 'frq', 
@@ -98,36 +717,101 @@ class StarDict (object):
         for k, v in self.__fields:
             self.__names[k] = v
         self.__enable = self.__fields[3:]
+        self.__load_zstd()
+        return True
+
+    # slim 词典：读取共享的 zstd 字典，压缩过的文本列在读取时才解压
+    def __load_zstd (self):
+        self.__zstd = None
+        self.__record = StarRecord
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+        sql += "AND name = 'stardict_zstd';"
+        if self.__conn.execute(sql).fetchone() is None:
+            return False
+        sql = "select data from stardict_zstd where name = 'text';"
+        record = self.__conn.execute(sql).fetchone()
+        if record is None:
+            return False
+        self.__zstd = TextZstd(record[0])
+        decompress = self.__zstd.decompress
+        self.__record = star_record(dict([ (n, decompress) 
+            for n in SLIM_COLUMNS ]))
         return True
 
+    # 新建一个只读连接，并附加之前 attach 过的数据库
+    def __connect (self):
+        conn = sqlite3.connect(self.__uri(self.__dbname), uri = True,
+                isolation_level = None, check_same_thread = False)
+        conn.execute('PRAGMA query_only = ON;')
+        conn.execute('PRAGMA mmap_size = %d;'%self.__mmap_size)
+        for filename, name in self.__attached:
+            sql = 'ATTACH DATABASE ? AS "%s";'%name
+            conn.execute(sql, (self.__uri(filename),))
+        with self.__lock:
+            self.__pool.append(conn)
+        return conn
+
+    # 当前线程的连接：只读模式下每个线程一个，读写模式下共用一个
+    @property
+    def __conn (self):
+        if not self.__readonly:
+            return self.__main
+        conn = getattr(self.__local, 'conn', None)
+        if conn is None:
+            conn = self.__connect()
+            self.__local.conn = conn
+        return conn
+
+    # 只读不可变的 sqlite uri
+    def __uri (self, filename):
+        import urllib.request
+        path = urllib.request.pathname2url(os.path.abspath(filename))
+        return 'file:%s?mode=ro&immutable=1'%path
+
     # 数据库记录转化为字典
     def __record2obj (self, record):
         if record is None:
             return None
-        word = {}
-        for k, v in self.__fields:
-            word[k] = record[v]
-        if word['detail']:
-            text = word['detail']
-            try:
-                obj = json.loads(text)
-            except:
-                obj = None
-            word['detail'] = obj
-        return word
+        return self.__record(record)
 
-    # 关闭数据库
+    # 关闭数据库（包括各线程的连接）
     def close (self):
-        if self.__conn:
-            self.__conn.close()
-        self.__conn = None
+        if self.__main:
+            self.__main.close()
+        self.__main = None
+        with self.__lock:
+            pool, self.__pool = self.__pool, []
+        for conn in pool:
+            conn.close()
     
+    # 在同一连接上附加其他数据库，只读模式下附加的数据库同样只读，
+    # 并且之后新建的线程连接也会自动附加
+    def attach (self, filename, name):
+        if not self.__readonly:
+            sql = 'ATTACH DATABASE ? AS "%s";'%name
+            self.__main.execute(sql, (filename,))
+            return True
+        self.__attached.append((filename, name))
+        with self.__lock:
+            pool = list(self.__pool)
+        for conn in pool:
+            sql = 'ATTACH DATABASE ? AS "%s";'%name
+            conn.execute(sql, (self.__uri(filename),))
+        return True
+
+    # 在词典连接上执行查询语句（比如查询附加的数据库）
+    def execute (self, sql, args = ()):
+        return self.__conn.execute(sql, args)
+
     def __del__ (self):
-        self.close()
+        if hasattr(self, '_StarDict__pool'):
+            self.close()
 
-    # 输出日志
+    # 输出日志，verbose 可以是接收每行文本的函数（比如 logger.info）
     def out (self, text):
-        if self.__verbose:
+        if callable(self.__verbose):
+            self.__verbose(text)
+        elif self.__verbose:
             print(text)
         return True
 
@@ -146,6 +830,10 @@ class StarDict (object):
 
     # 查询单词匹配
     def match (self, word, limit = 10, strip = False):
+        if self.__readonly:
+            prefix = self.prefix_index()
+            if prefix is not None:
+                return prefix.match(word, limit, strip)
         c = self.__conn.cursor()
         if not strip:
             sql = 'select id, word from stardict where word >= ? '
@@ -161,28 +849,59 @@ class StarDict (object):
             result.append(tuple(record))
         return result
 
-    # 批量查询
+    # 前缀索引 filename + '.prefix'，只读模式下 match 使用。这里只映射
+    # 已有的文件，没有或者数据库改变过（大小或修改时间）时返回 None，
+    # match 改用 SQL 查询。索引文件由 build_prefix_index 生成
+    def prefix_index (self):
+        with self.__lock:
+            if self.__prefix is None and self.__dbname != ':memory:':
+                prefix = PrefixIndex(nocase)
+                try:
+                    stamp = self.__stamp()
+                except (IOError, OSError):
+                    return None
+                if prefix.load(self.__dbname + '.prefix', stamp):
+                    self.__prefix = prefix
+        return self.__prefix
+
+    # 生成并保存前缀索引，要在所有写入之后调用（索引记录了数据库文件的
+    # 大小和修改时间），只读模式下不写文件
+    def build_prefix_index (self):
+        if self.__readonly or self.__dbname == ':memory:':
+            return False
+        self.__conn.commit()
+        prefix = PrefixIndex(nocase)
+        c = self.__conn.cursor()
+        c.execute('select id, word, sw from stardict;')
+        prefix.build(c, self.__stamp())
+        prefix.save(self.__dbname + '.prefix')
+        self.out('prefix index: %d words'%len(prefix))
+        return True
+
+    def __stamp (self):
+        st = os.stat(self.__dbname)
+        return (st.st_size, st.st_mtime_ns)
+
+    # 批量查询：小批量用分段的 IN 列表，超大批量用临时表 JOIN
     def query_batch (self, keys):
-        sql = 'select * from stardict where '
         if keys is None:
             return None
         if not keys:
             return []
-        querys = []
+        ids = []
+        words = []
         for key in keys:
             if isinstance(key, int) or isinstance(key, long):
-                querys.append('id = ?')
+                ids.append(key)
             elif key is not None:
-                querys.append('word = ?')
-        sql = sql + ' or '.join(querys) + ';'
+                words.append(key)
         query_word = {}
         query_id = {}
-        c = self.__conn.cursor()
-        c.execute(sql, tuple(keys))
-        for row in c:
-            obj = self.__record2obj(row)
-            query_word[obj['word'].lower()] = obj
-            query_id[obj['id']] = obj
+        for name, values in (('id', ids), ('word', words)):
+            for row in self.__select_batch(name, values):
+                obj = self.__record2obj(row)
+                query_word[obj['word'].lower()] = obj
+                query_id[obj['id']] = obj
         results = []
         for key in keys:
             if isinstance(key, int) or isinstance(key, long):
@@ -193,6 +912,488 @@ class StarDict (object):
                 results.append(None)
         return tuple(results)
 
+    # 按 id 或 word 列批量取出记录，返回行迭代器
+    def __select_batch (self, name, values):
+        # 排序后按索引顺序访问，磁盘上的局部性更好
+        values = sorted(set(values))
+        if not values:
+            return []
+        c = self.__conn.cursor()
+        # 只读模式下不能创建临时表
+        if len(values) <= BATCH_TEMP_THRESHOLD or self.__readonly:
+            rows = []
+            for i in xrange(0, len(values), BATCH_CHUNK_SIZE):
+                chunk = values[i:i + BATCH_CHUNK_SIZE]
+                sql = 'select * from stardict where %s in (%s);'
+                sql = sql%(name, ','.join(['?'] * len(chunk)))
+                c.execute(sql, chunk)
+                rows.extend(c.fetchall())
+            return rows
+        if name == 'id':
+            sql = 'CREATE TEMP TABLE IF NOT EXISTS batch_id '
+            sql += '("key" INTEGER);'
+            table = 'batch_id'
+        else:
+            sql = 'CREATE TEMP TABLE IF NOT EXISTS batch_word '
+            sql += '("key" VARCHAR(64) COLLATE NOCASE);'
+            table = 'batch_word'
+        c.execute(sql)
+        c.execute('DELETE FROM temp.%s;'%table)
+        sql = 'INSERT INTO temp.%s VALUES (?);'%table
+        c.executemany(sql, [ (n,) for n in values ])
+        sql = 'select s.* from temp.%s b cross join stardict s '%table
+        sql += 'on s.%s = b.key;'%name
+        c.execute(sql)
+        rows = c.fetchall()
+        c.execute('DELETE FROM temp.%s;'%table)
+        self.__conn.commit()
+        return rows
+
+    # 批量导入：清空词典后写入 records，每条为 csv 顺序的
+    # (word, phonetic, definition, ..., detail, audio) 元组。
+    # 导入期间关闭日志和同步，先无索引写入，再去重并创建索引，
+    # slim 为真时导入精简版（见 SLIM_COLUMNS 上面的说明）。
+    # 依赖 stardict.id 的派生表全部删除重建，原来有全文索引的也重建
+    def bulk_load (self, records, batch = 50000, slim = False):
+        conn = self.__conn
+        conn.commit()
+        fts = self.has_fts_index()
+        journal = conn.execute('PRAGMA journal_mode;').fetchone()[0]
+        synchronous = conn.execute('PRAGMA synchronous;').fetchone()[0]
+        conn.execute('PRAGMA journal_mode = OFF;')
+        conn.execute('PRAGMA synchronous = OFF;')
+        sql = '''
+        DROP TABLE IF EXISTS "stardict";
+        DROP TABLE IF EXISTS "stardict_zstd";
+        DROP TABLE IF EXISTS "stardict_lemma";
+        DROP TABLE IF EXISTS "stardict_spell";
+        DROP TABLE IF EXISTS "stardict_tag";
+        DROP TABLE IF EXISTS "stardict_fts";
+        CREATE TABLE "stardict" (
+            "id" INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+            "word" VARCHAR(64) COLLATE NOCASE NOT NULL,
+            "sw" VARCHAR(64) COLLATE NOCASE NOT NULL,
+            "phonetic" VARCHAR(64),
+            "definition" TEXT,
+            "translation" TEXT,
+            "pos" VARCHAR(16),
+            "collins" INTEGER DEFAULT(0),
+            "oxford" INTEGER DEFAULT(0),
+            "tag" VARCHAR(64),
+            "bnc" INTEGER DEFAULT(NULL),
+            "frq" INTEGER DEFAULT(NULL),
+            "exchange" TEXT,
+            "detail" TEXT,
+            "audio" TEXT
+        );
+        '''
+        conn.executescript(sql)
+        if slim:
+            records = self.__slim_records(records)
+        names = [ n for n, _ in self.__fields[1:] ]
+        sql = 'INSERT INTO stardict (%s) VALUES (%s);'%(
+                ', '.join(names), ', '.join(['?'] * len(names)))
+        rows = ( (r[0], stripword(r[0])) + tuple(r[1:]) for r in records )
+        count = 0
+        ts = time.time()
+        while True:
+            chunk = list(itertools.islice(rows, batch))
+            if not chunk:
+                break
+            conn.executemany(sql, chunk)
+            count += len(chunk)
+            t = max(time.time() - ts, 0.001)
+            self.out('progress: %d rows (%d rows/sec)'%(count, count / t))
+        conn.commit()
+        self.out('creating indexes ...')
+        sql = '''
+        CREATE INDEX "sd_1" ON stardict (word collate nocase);
+        DELETE FROM stardict WHERE id NOT IN
+            (SELECT min(id) FROM stardict GROUP BY word);
+        CREATE UNIQUE INDEX "stardict_1" ON stardict (id);
+        CREATE UNIQUE INDEX "stardict_2" ON stardict (word);
+        CREATE INDEX "stardict_3" ON stardict (sw, word collate nocase);
+        '''
+        conn.executescript(sql)
+        conn.commit()
+        self.__load_zstd()
+        self.build_lemma_index()
+        self.build_spell_index()
+        self.build_select_index()
+        if fts:
+            self.build_fts_index()
+        conn.execute('PRAGMA journal_mode = %s;'%journal)
+        conn.execute('PRAGMA synchronous = %d;'%synchronous)
+        t = max(time.time() - ts, 0.001)
+        count = self.count()
+        self.out('[Finished in %d seconds (%d rows, %d rows/sec)]'%(t, count,
+            count / t))
+        return count
+
+    # slim 导入：过滤无效单词，去掉 pos/detail/audio，用前 SLIM_SAMPLES
+    # 条记录训练共享字典，然后压缩 definition 和 translation
+    def __slim_records (self, records):
+        validate = tools.validate_word
+        rows = ( tuple(r[:4]) + (None,) + tuple(r[5:11]) + (None, None)
+            for r in records if r[0] and validate(r[0], False) )
+        head = list(itertools.islice(rows, SLIM_SAMPLES))
+        data = TextZstd.train([ n[i] for n in head for i in (2, 3) ])
+        if data is None:
+            self.out('slim: too few samples, text is not compressed')
+            for row in itertools.chain(head, rows):
+                yield row
+            return
+        conn = self.__conn
+        sql = 'CREATE TABLE "stardict_zstd" ("name" VARCHAR(16) '
+        sql += 'PRIMARY KEY NOT NULL, "data" BLOB);'
+        conn.execute(sql)
+        conn.execute('INSERT INTO stardict_zstd VALUES (?, ?);', 
+                ('text', data))
+        compress = TextZstd(data).compress
+        self.out('slim: %d bytes zstd dictionary'%len(data))
+        for row in itertools.chain(head, rows):
+            yield row[:2] + (compress(row[2]), compress(row[3])) + row[4:]
+
+    # 是否已经建立词形反查表
+    def has_lemma_index (self):
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+        sql += "AND name = 'stardict_lemma';"
+        return self.__conn.execute(sql).fetchone() is not None
+
+    # 根据 exchange 字段建立 "变形 -> 原型" 的反查表：
+    # 原型词条里的 s:/d:/p:/i:/3:/r:/t: 各项指向该词条（priority 1），
+    # 变形词条自己的 0: 项指向它的原型（priority 0，优先使用）
+    def build_lemma_index (self):
+        conn = self.__conn
+        rows = list(self.__lemma_rows())
+        sql = '''
+        DROP TABLE IF EXISTS "stardict_lemma";
+        CREATE TABLE "stardict_lemma" (
+            "form" VARCHAR(64) COLLATE NOCASE NOT NULL,
+            "lemma" VARCHAR(64) NOT NULL,
+            "kind" VARCHAR(1),
+            "priority" INTEGER DEFAULT(1),
+            "frq" INTEGER
+        );
+        '''
+        conn.executescript(sql)
+        sql = 'INSERT INTO stardict_lemma VALUES (?, ?, ?, ?, ?);'
+        conn.executemany(sql, rows)
+        sql = 'CREATE INDEX "stardict_lemma_1" ON stardict_lemma '
+        sql += '(form, priority, frq);'
+        conn.execute(sql)
+        conn.commit()
+        self.__lemmas = None
+        self.out('lemma index: %d forms'%len(rows))
+        return len(rows)
+
+    # 从 exchange 字段生成 (form, lemma, kind, priority, frq)
+    def __lemma_rows (self):
+        c = self.__conn.cursor()
+        c.execute("select word, exchange, frq from stardict where exchange != '';")
+        for word, exchange, frq in c:
+            frq = frq and frq or 0x7fffffff
+            for item in exchange.split('/'):
+                pos = item.find(':')
+                if pos < 0:
+                    continue
+                kind = item[:pos].strip()
+                value = item[pos + 1:].strip()
+                if not value or value.lower() == word.lower():
+                    continue
+                if kind == '0':
+                    yield (word, value, kind, 0, 0x7fffffff)
+                elif kind in LEMMA_EXCHANGES:
+                    yield (value, word, kind, 1, frq)
+
+    # 没有 stardict_lemma 表时的替代：扫描一遍词典，在内存里建立
+    # 变形 -> 原型，和 lemma_batch 的排序规则相同
+    def __lemma_map (self):
+        if self.__lemmas is None:
+            best = {}
+            for form, lemma, kind, priority, frq in self.__lemma_rows():
+                key = form.lower()
+                if key not in best or (priority, frq) < best[key][:2]:
+                    best[key] = (priority, frq, lemma)
+            self.__lemmas = dict([ (k, v[2]) for k, v in best.items() ])
+        return self.__lemmas
+
+    # 批量查找变形的原型，返回和 forms 对应的列表，找不到为 None
+    def lemma_batch (self, forms):
+        forms = [ n for n in forms ]
+        if not self.has_lemma_index():
+            lemmas = self.__lemma_map()
+            return [ n and lemmas.get(n.lower()) or None for n in forms ]
+        keys = sorted(set([ n.lower() for n in forms if n ]))
+        found = {}
+        c = self.__conn.cursor()
+        for i in xrange(0, len(keys), BATCH_CHUNK_SIZE):
+            chunk = keys[i:i + BATCH_CHUNK_SIZE]
+            sql = 'select form, lemma from stardict_lemma where form in (%s) '
+            sql += 'order by form, priority, frq;'
+            c.execute(sql%','.join(['?'] * len(chunk)), chunk)
+            for form, lemma in c:
+                form = form.lower()
+                if form not in found:
+                    found[form] = lemma
+        return [ n and found.get(n.lower()) or None for n in forms ]
+
+    # 查找一个变形的原型
+    def lemma (self, form):
+        return self.lemma_batch([form])[0]
+
+    # 是否已经建立拼写纠错索引
+    def has_spell_index (self):
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+        sql += "AND name = 'stardict_spell';"
+        return self.__conn.execute(sql).fetchone() is not None
+
+    # SymSpell 删除索引：对常用单词（有词频、考纲标签或星级的纯字母单词）
+    # 的前 SPELL_PREFIX 个字母做最多 SPELL_DISTANCE 次删除，保存删除结果的
+    # crc32 -> 单词 id，哈希冲突只会多出几个候选，最后都会计算编辑距离
+    def build_spell_index (self):
+        conn = self.__conn
+        sql = '''
+        DROP TABLE IF EXISTS "stardict_spell";
+        CREATE TABLE "stardict_spell" (
+            "hash" INTEGER NOT NULL,
+            "id" INTEGER NOT NULL,
+            PRIMARY KEY ("hash", "id")
+        ) WITHOUT ROWID;
+        '''
+        conn.executescript(sql)
+        sql = "select id, word from stardict where %s;"%SPELL_WHERE
+        rows = set()
+        for id, word in conn.execute(sql).fetchall():
+            key = word.lower()
+            if not spell_candidate(key):
+                continue
+            for text in spell_deletes(key[:SPELL_PREFIX], SPELL_DISTANCE):
+                rows.add((zlib.crc32(text.encode('utf-8')), id))
+        rows = sorted(rows)
+        conn.executemany('INSERT INTO stardict_spell VALUES (?, ?);', rows)
+        conn.commit()
+        self.__spell = None
+        self.out('spell index: %d deletes'%len(rows))
+        return len(rows)
+
+    # 拼写建议：返回 [(word, distance), ...]，按编辑距离、词频排序
+    # 没有 stardict_spell 表时和所有常用单词逐个比较编辑距离（慢）
+    def suggest (self, word, count = 5, distance = SPELL_DISTANCE):
+        key = word.lower()
+        if self.has_spell_index():
+            hashes = [ zlib.crc32(n.encode('utf-8')) for n in 
+                    spell_deletes(key[:SPELL_PREFIX], distance) ]
+            sql = 'select distinct s.word, s.frq from stardict_spell p '
+            sql += 'join stardict s on s.id = p.id where p.hash in (%s);'
+            sql = sql%','.join(['?'] * len(hashes))
+            candidates = self.__conn.execute(sql, hashes)
+        else:
+            candidates = self.__spell_words()
+        result = []
+        for text, frq in candidates:
+            if abs(len(text) - len(key)) > distance:
+                continue
+            d = edit_distance(key, text.lower(), distance)
+            if d <= distance:
+                result.append((d, frq and frq or 0x7fffffff, text))
+        result.sort()
+        return [ (text, d) for d, _, text in result[:count] ]
+
+    # 参与拼写纠错的全部单词 [(word, frq), ...]，只读取一次
+    def __spell_words (self):
+        if self.__spell is None:
+            sql = "select word, frq from stardict where %s;"%SPELL_WHERE
+            self.__spell = [ (text, frq) for text, frq in 
+                self.__conn.execute(sql) if spell_candidate(text.lower()) ]
+        return self.__spell
+
+    # 是否已经建立全文索引
+    def has_fts_index (self):
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+        sql += "AND name = 'stardict_fts';"
+        return self.__conn.execute(sql).fetchone() is not None
+
+    # FTS5 全文索引（可选，比较大）：definition 用 porter 词干，
+    # translation 的中文先切成二元组 (见 fts_cjk_split)，rowid 即 stardict.id
+    def build_fts_index (self):
+        conn = self.__conn
+        sql = '''
+        DROP TABLE IF EXISTS "stardict_fts";
+        CREATE VIRTUAL TABLE "stardict_fts" USING fts5(
+            definition, translation, content = '', 
+            tokenize = 'porter unicode61 remove_diacritics 2'
+        );
+        '''
+        conn.executescript(sql)
+        c = conn.cursor()
+        c.execute('select id, definition, translation from stardict;')
+        sql = 'INSERT INTO stardict_fts (rowid, definition, translation) '
+        sql += 'VALUES (?, ?, ?);'
+        count = 0
+        while True:
+            rows = c.fetchmany(50000)
+            if not rows:
+                break
+            if self.__zstd is not None:
+                text = self.__zstd.decompress
+                rows = [ (id, text(definition), text(translation)) 
+                    for id, definition, translation in rows ]
+            conn.executemany(sql, [ (id, definition, fts_cjk_split(translation))
+                for id, definition, translation in rows ])
+            count += len(rows)
+            self.out('fts: %d rows'%count)
+        sql = "INSERT INTO stardict_fts (stardict_fts) VALUES ('optimize');"
+        conn.execute(sql)
+        conn.commit()
+        return count
+
+    # 全文搜索，field 为 'definition' 或 'translation'，默认两者都搜，
+    # 按相关度逐条返回 (id, word)。没有全文索引时逐条扫描（见 __search_scan）
+    def search (self, text, field = None, limit = -1):
+        if not self.has_fts_index():
+            for record in self.__search_scan(text, field, limit):
+                yield record
+            return
+        query = fts_query(text, field)
+        if not query:
+            return
+        sql = 'select s.id, s.word from stardict_fts f '
+        sql += 'join stardict s on s.id = f.rowid '
+        sql += 'where stardict_fts match ? order by f.rank limit ?;'
+        c = self.__conn.cursor()
+        c.execute(sql, (query, limit))
+        while True:
+            rows = c.fetchmany(500)
+            if not rows:
+                break
+            for record in rows:
+                yield tuple(record)
+
+    # 不用索引的全文搜索：每个词（不区分大小写）都在字段里出现才算匹配，
+    # 没有词干和相关度，按 id 顺序返回
+    def __search_scan (self, text, field = None, limit = -1):
+        terms = [ n.lower() for n in text.split() ]
+        if not terms:
+            return
+        columns = field and [field] or ['definition', 'translation']
+        decompress = self.__zstd and self.__zstd.decompress or (lambda x: x)
+        c = self.__conn.cursor()
+        c.execute('select id, word, %s from stardict;'%', '.join(columns))
+        count = 0
+        while True:
+            rows = c.fetchmany(5000)
+            if not rows:
+                break
+            for row in rows:
+                content = '\n'.join([ decompress(n) or '' for n in row[2:] ])
+                content = content.lower()
+                for term in terms:
+                    if term not in content:
+                        break
+                else:
+                    yield (row[0], row[1])
+                    count += 1
+                    if count == limit:
+                        return
+
+    # 是否已经建立筛选用的索引
+    def has_select_index (self):
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+        sql += "AND name = 'stardict_tag';"
+        return self.__conn.execute(sql).fetchone() is not None
+
+    # select 用的索引：tag 拆成 (tag, id) 表，collins/oxford/frq/bnc 各一个索引
+    def build_select_index (self):
+        conn = self.__conn
+        sql = '''
+        DROP TABLE IF EXISTS "stardict_tag";
+        CREATE TABLE "stardict_tag" (
+            "tag" VARCHAR(16) COLLATE NOCASE NOT NULL,
+            "id" INTEGER NOT NULL,
+            PRIMARY KEY ("tag", "id")
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS "stardict_collins" ON stardict (collins);
+        CREATE INDEX IF NOT EXISTS "stardict_oxford" ON stardict (oxford);
+        CREATE INDEX IF NOT EXISTS "stardict_frq" ON stardict (frq);
+        CREATE INDEX IF NOT EXISTS "stardict_bnc" ON stardict (bnc);
+        '''
+        conn.executescript(sql)
+        rows = set()
+        sql = "select id, tag from stardict where tag != '';"
+        for id, tag in conn.execute(sql):
+            for name in tag.split():
+                rows.add((name.lower(), id))
+        rows = sorted(rows)
+        conn.executemany('INSERT INTO stardict_tag VALUES (?, ?);', rows)
+        # 让查询计划知道各个标签和条件的选择性
+        conn.execute('ANALYZE stardict;')
+        conn.execute('ANALYZE stardict_tag;')
+        conn.commit()
+        self.out('select index: %d tags'%len(rows))
+        return len(rows)
+
+    # 按条件筛选单词，逐条返回 (id, word)：
+    # tag 为一个或多个考纲标签（同时具有），collins/frq/bnc 为下限或者
+    # (下限, 上限)，None 表示不限（frq/bnc 为 0 表示没有词频，指定了范围
+    # 就不会选中），oxford 为真时只要牛津 3000 核心词。
+    # order 为 'frq', 'bnc', 'collins' (星级高的在前) 或 'word'，
+    # 没有词频的单词排在最后
+    def select (self, tag = None, collins = None, oxford = None, frq = None,
+            bnc = None, order = 'frq', limit = -1):
+        sql = 'select s.id, s.word from stardict s'
+        args = []
+        if isinstance(tag, str):
+            tag = tag.split()
+        where = []
+        # 没有 stardict_tag 表时在 tag 字段里匹配（慢）
+        indexed = tag and self.has_select_index()
+        for i, name in enumerate(tag or []):
+            if indexed:
+                sql += ' join stardict_tag t%d on t%d.id = s.id '%(i, i)
+                sql += 'and t%d.tag = ?'%i
+            else:
+                where.append("(' ' || s.tag || ' ') like ?")
+            args.append(indexed and name.lower() or '%% %s %%'%name.lower())
+        for column, value in (('collins', collins), ('frq', frq), 
+                ('bnc', bnc)):
+            if value is None:
+                continue
+            if isinstance(value, int) or isinstance(value, long):
+                value = (value, None)
+            # 词频 0 表示没有排名，下限至少为 1 才能把它们排除
+            if column != 'collins' and (value[0] is None or value[0] < 1):
+                value = (1, value[1])
+            if value[0] is not None:
+                where.append('s.%s >= ?'%column)
+                args.append(value[0])
+            if value[1] is not None:
+                where.append('s.%s <= ?'%column)
+                args.append(value[1])
+        if oxford:
+            where.append('s.oxford > 0')
+        if where:
+            sql += ' where ' + ' and '.join(where)
+        orders = {
+            'frq': 'coalesce(nullif(s.frq, 0), 1 << 31), s.word',
+            'bnc': 'coalesce(nullif(s.bnc, 0), 1 << 31), s.word',
+            'collins': 'coalesce(s.collins, 0) desc, '
+                'coalesce(nullif(s.frq, 0), 1 << 31), s.word',
+            'word': 's.word collate nocase',
+        }
+        if order:
+            sql += ' order by ' + orders[order]
+        sql += ' limit ?;'
+        args.append(limit)
+        c = self.__conn.cursor()
+        c.execute(sql, args)
+        while True:
+            rows = c.fetchmany(500)
+            if not rows:
+                break
+            for record in rows:
+                yield tuple(record)
+
     # 取得单词总数
     def count (self):
         c = self.__conn.cursor()
@@ -454,17 +1655,7 @@ class DictMySQL (object):
     def __record2obj (self, record):
         if record is None:
             return None
-        word = {}
-        for k, v in self.__fields:
-            word[k] = record[v]
-        if word['detail']:
-            text = word['detail']
-            try:
-                obj = json.loads(text)
-            except:
-                obj = None
-            word['detail'] = obj
-        return word
+        return StarRecord(record)
 
     # 关闭数据库
     def close (self):
@@ -684,6 +1875,8 @@ class DictCsv (object):
         self.__words = {}
         self.__rows = []
         self.__index = []
+        self.__prefix = None
+        self.__pristine = False
         self.__read()
 
     def reset (self):
@@ -691,37 +1884,15 @@ class DictCsv (object):
         self.__words = {}
         self.__rows = []
         self.__index = []
+        self.__prefix = None
+        self.__pristine = False
         return True
 
     def encode (self, text):
-        if text is None:
-            return None
-        text = text.replace('\\', '\\\\').replace('\n', '\\n')
-        return text.replace('\r', '\\r')
+        return csv_codec.encode(text)
 
     def decode (self, text):
-        output = []
-        i = 0
-        if text is None:
-            return None
-        size = len(text)
-        while i < size:
-            c = text[i]
-            if c == '\\':
-                c = text[i + 1:i + 2]
-                if c == '\\':
-                    output.append('\\')
-                elif c == 'n':
-                    output.append('\n')
-                elif c == 'r':
-                    output.append('\r')
-                else:
-                    output.append('\\' + c)
-                i += 2
-            else:
-                output.append(c)
-                i += 1
-        return ''.join(output)
+        return csv_codec.decode(text)
 
     # 安全转行整数
     def readint (self, text):
@@ -793,6 +1964,35 @@ class DictCsv (object):
         for index in xrange(len(self.__index)):
             row = self.__index[index]
             row[COLUMN_SD] = index
+        self.__pristine = True
+        return True
+
+    # 前缀索引 filename + '.prefix'，文件读入后没有改动时 match 使用。
+    # 这里只映射已有的文件，没有或者 csv 改变过时返回 None，match 改用
+    # 内存里的二分查找。索引文件由 build_prefix_index 生成
+    def prefix_index (self):
+        if self.__prefix is None and self.__csvname is not None:
+            prefix = PrefixIndex(lambda text: text.lower())
+            try:
+                st = os.stat(self.__csvname)
+            except (IOError, OSError):
+                return None
+            stamp = (st.st_size, st.st_mtime_ns)
+            if prefix.load(self.__csvname + '.prefix', stamp):
+                self.__prefix = prefix
+        return self.__prefix
+
+    # 根据读入的 csv 生成并保存前缀索引，有改动没保存时不生成
+    def build_prefix_index (self):
+        if not self.__pristine:
+            return False
+        st = os.stat(self.__csvname)
+        prefix = PrefixIndex(lambda text: text.lower())
+        rows = [ (row[COLUMN_ID], row[0], row[COLUMN_SW]) 
+                for row in self.__rows ]
+        prefix.build(rows, (st.st_size, st.st_mtime_ns))
+        prefix.save(self.__csvname + '.prefix')
+        self.__prefix = prefix
         return True
 
     # 保存文件
@@ -825,26 +2025,8 @@ class DictCsv (object):
     def __obj_decode (self, row):
         if row is None:
             return None
-        obj = {}
-        obj['id'] = row[COLUMN_ID]
-        obj['sw'] = row[COLUMN_SW]
-        skip = self.__numbers
-        for key, index in self.__fields:
-            value = row[index]
-            if index in skip:
-                if value is not None:
-                    value = self.readint(value)
-            elif key != 'detail':
-                value = self.decode(value)
-            obj[key] = value
-        detail = obj.get('detail', None)
-        if detail is not None:
-            if detail != '':
-                detail = json.loads(detail)
-            else:
-                detail = None
-        obj['detail'] = detail
-        return obj
+        # 复制一份，之后 update 不会影响已经返回的记录
+        return CsvRecord(tuple(row))
 
     # 对象编码
     def __obj_encode (self, obj):
@@ -891,6 +2073,9 @@ class DictCsv (object):
     def match (self, word, count = 10, strip = False):
         if len(self.__rows) == 0:
             return []
+        prefix = self.__pristine and self.prefix_index() or None
+        if prefix is not None:
+            return prefix.match(word, count, strip)
         if self.__dirty:
             self.__resort()
         if not strip:
@@ -946,10 +2131,7 @@ class DictCsv (object):
 
     # 迭代器
     def __iter__ (self):
-        record = []
-        for index in xrange(len(self.__rows)):
-            record.append((index, self.__rows[index][0]))
-        return record.__iter__()
+        return iter([ (index, row[0]) for index, row in enumerate(self.__rows) ])
 
     # 注册新单词
     def register (self, word, items, commit = True):
@@ -964,6 +2146,7 @@ class DictCsv (object):
         self.__index.append(row)
         self.__words[word.lower()] = row
         self.__dirty = True
+        self.__pristine = False
         return True
 
     # 删除单词
@@ -988,6 +2171,7 @@ class DictCsv (object):
         self.__index.pop()
         del self.__words[key]
         self.__dirty = True
+        self.__pristine = False
         return True
 
     # 清空所有
@@ -1021,11 +2205,500 @@ class DictCsv (object):
             self.save(self.__csvname, self.__codec)
         return True
 
+    # 取得所有单词
+    def dumps (self):
+        return [ row[0] for row in self.__rows ]
+
+
+# 解码用的 DictCsv 实例（decode/readint 不依赖文件）
+csv_helper = DictCsv(None)
+
+
+#----------------------------------------------------------------------
+# DictCsvLazy: 只读的 DictCsv，csv 文件用 mmap 打开，不整个读入内存；
+# 第一次打开时建立按 word 和 (sw, word) 排序的偏移索引，保存为
+# filename + '.idx'，之后直接映射索引文件，行数据在查询时才解析
+#----------------------------------------------------------------------
+class DictCsvLazy (object):
+
+    # 索引格式：魔数 + 头部 (csv 大小、修改时间、行数、两个字符串区长度)
+    # + 行偏移 Q[n] + 行长度 I[n] + 单词区偏移 I[n+1] + sw 排序 I[n]
+    # + sw 区偏移 I[n+1] + 单词区 (按小写排序的原始单词) + sw 区
+    INDEX_MAGIC = b'DICTCSV\x01'
+    INDEX_HEADER = '<8s5Q'
+
+    def __init__ (self, filename, codec = 'utf-8'):
+        self.__csvname = os.path.abspath(filename)
+        self.__codec = codec
+        self.__fp = open(self.__csvname, 'rb')
+        size = os.fstat(self.__fp.fileno()).st_size
+        self.__mm = None
+        if size > 0:
+            self.__mm = mmap.mmap(self.__fp.fileno(), 0, 
+                    access = mmap.ACCESS_READ)
+        self.__load_index(self.__csvname + '.idx')
+
+    def close (self):
+        if self.__fp is not None:
+            self.__index = None
+            self.__starts = self.__lengths = None
+            self.__word_off = self.__sd = self.__sw_off = None
+            if self.__mm is not None:
+                self.__mm.close()
+                self.__mm = None
+            self.__fp.close()
+            self.__fp = None
+        return True
+
+    def __stamp (self):
+        st = os.stat(self.__csvname)
+        return st.st_size, getattr(st, 'st_mtime_ns', int(st.st_mtime))
+
+    # 读取索引，不存在或者过期就重新生成
+    def __load_index (self, idxname):
+        size, mtime = self.__stamp()
+        data = None
+        try:
+            with open(idxname, 'rb') as fp:
+                data = mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            data = None
+        head = struct.calcsize(self.INDEX_HEADER)
+        if data is not None:
+            if len(data) < head or sys.byteorder != 'little':
+                data = None
+            elif struct.unpack(self.INDEX_HEADER, data[:head])[:3] != \
+                    (self.INDEX_MAGIC, size, mtime):
+                data = None
+        if data is None:
+            data = self.__build_index(size, mtime)
+            try:
+                tmp = idxname + '.tmp'
+                with open(tmp, 'wb') as fp:
+                    fp.write(data)
+                os.replace(tmp, idxname)
+            except (IOError, OSError):
+                pass
+        _, _, _, count, nword, nsw = struct.unpack(self.INDEX_HEADER, 
+                data[:head])
+        view = memoryview(data)
+        pos = head
+        sections = []
+        for code, length in (('Q', count), ('I', count), ('I', count + 1),
+                ('I', count), ('I', count + 1), ('B', nword), ('B', nsw)):
+            width = struct.calcsize(code)
+            part = view[pos:pos + length * width]
+            if code != 'B':
+                part = part.cast(code)
+            sections.append(part)
+            pos += length * width
+        self.__index = data
+        self.__count = count
+        self.__starts, self.__lengths, self.__word_off, self.__sd, \
+            self.__sw_off, self.__word_blob, self.__sw_blob = sections
+        return True
+
+    # 扫描一遍 csv：去重（同 DictCsv，保留第一次出现的单词）并排序
+    def __build_index (self, size, mtime):
+        mm = self.__mm
+        codec = self.__codec
+        rows = []
+        if mm is not None:
+            mm.seek(0)
+            def lines():
+                while True:
+                    line = mm.readline()
+                    if not line:
+                        break
+                    yield line.decode(codec)
+            reader = csv.reader(lines())
+            next(reader, None)
+            seen = set()
+            start = mm.tell()
+            for row in reader:
+                end = mm.tell()
+                if row:
+                    word = row[0]
+                    key = word.lower()
+                    if key not in seen:
+                        seen.add(key)
+                        rows.append((key, word, start, end - start))
+                start = end
+            seen = None
+        rows.sort()
+        starts = array.array('Q', [ n[2] for n in rows ])
+        lengths = array.array('I', [ n[3] for n in rows ])
+        words = [ n[1].encode('utf-8') for n in rows ]
+        strips = [ (stripword(n[1]), n[0], i) for i, n in enumerate(rows) ]
+        rows = None
+        strips.sort()
+        sd = array.array('I', [ n[2] for n in strips ])
+        strips = [ n[0].encode('utf-8') for n in strips ]
+        parts = [starts, lengths]
+        for keys in (words, strips):
+            offsets = array.array('I', [0])
+            pos = 0
+            for key in keys:
+                pos += len(key)
+                offsets.append(pos)
+            parts.append(offsets)
+            if keys is words:
+                parts.append(sd)
+        header = struct.pack(self.INDEX_HEADER, self.INDEX_MAGIC, size, mtime,
+                len(words), parts[2][-1], parts[4][-1])
+        output = [ header ] + [ n.tobytes() for n in parts ]
+        output.append(b''.join(words))
+        output.append(b''.join(strips))
+        return b''.join(output)
+
+    def __word (self, index):
+        offsets = self.__word_off
+        data = self.__word_blob[offsets[index]:offsets[index + 1]]
+        return data.tobytes().decode('utf-8')
+
+    def __strip (self, pos):
+        offsets = self.__sw_off
+        data = self.__sw_blob[offsets[pos]:offsets[pos + 1]]
+        return data.tobytes().decode('utf-8')
+
+    # 二分查找第一个 >= key 的位置
+    def __lower_bound (self, key, strip):
+        top, bottom = 0, self.__count
+        while top < bottom:
+            middle = (top + bottom) >> 1
+            if strip:
+                text = self.__strip(middle)
+            else:
+                text = self.__word(middle).lower()
+            if text < key:
+                top = middle + 1
+            else:
+                bottom = middle
+        return top
+
+    def __find (self, word):
+        key = word.lower()
+        index = self.__lower_bound(key, False)
+        if index < self.__count and self.__word(index).lower() == key:
+            return index
+        return -1
+
+    # 解析一行数据，字段处理同 DictCsv
+    def __obj_decode (self, index):
+        start = self.__starts[index]
+        text = self.__mm[start:start + self.__lengths[index]]
+        text = text.decode(self.__codec)
+        row = next(csv.reader(text.splitlines(True)))
+        if len(row) < COLUMN_SIZE:
+            row.extend([None] * (COLUMN_SIZE - len(row)))
+        del row[COLUMN_SIZE:]
+        row.extend((index, index, stripword(row[0])))
+        return CsvRecord(row)
+
+    # 查询单词
+    def query (self, key):
+        if key is None:
+            return None
+        if isinstance(key, int) or isinstance(key, long):
+            if key < 0 or key >= self.__count:
+                return None
+            return self.__obj_decode(key)
+        index = self.__find(key)
+        if index < 0:
+            return None
+        return self.__obj_decode(index)
+
+    # 查询单词匹配
+    def match (self, word, count = 10, strip = False):
+        if not strip:
+            key = word.lower()
+        else:
+            key = stripword(word)
+        pos = self.__lower_bound(key, strip)
+        likely = []
+        for pos in xrange(pos, min(pos + count, self.__count)):
+            index = pos
+            if strip:
+                index = self.__sd[pos]
+            likely.append((index, self.__word(index)))
+        return likely
+
+    # 批量查询
+    def query_batch (self, keys):
+        return [ self.query(key) for key in keys ]
+
+    # 单词总量
+    def count (self):
+        return self.__count
+
+    # 取得长度
+    def __len__ (self):
+        return self.__count
+
+    # 取得单词
+    def __getitem__ (self, key):
+        return self.query(key)
+
+    # 是否存在
+    def __contains__ (self, key):
+        return self.__find(key) >= 0
+
+    # 迭代器
+    def __iter__ (self):
+        for index in xrange(self.__count):
+            yield (index, self.__word(index))
+
+    # 取得所有单词
+    def dumps (self):
+        return [ n for _, n in self.__iter__() ]
+
+
+#----------------------------------------------------------------------
+# DictBinary: 只读的二进制词典 (.bdict)，由 DictHelper.export_binary 生成。
+# 整个文件用 mmap 打开，不需要 sqlite，打开时只读一个头部：
+#   头部 + PrefixIndex (键按 nocase 排序，id 即排序位置) + 块偏移 Q[m+1]
+#   + 记录区。记录按 id 顺序每 block 条打包成一块，块内是 I[k+1] 的
+#   记录偏移和记录数据，整块可以用 zlib 或 zstd (需要 pyzstd) 压缩。
+# 每条记录：整数字段 collins/oxford/bnc/frq (NULL 为 BINARY_NULL)，
+# 九个字符串字段的长度 (NULL 为 0xffffffff)，然后是 utf-8 的字符串
+#----------------------------------------------------------------------
+BINARY_COMPRESS = ('none', 'zlib', 'zstd')
+BINARY_NULL = -0x80000000
+BINARY_NONE = 0xffffffff
+BINARY_TEXTS = ('word', 'phonetic', 'definition', 'translation', 'pos', 
+    'tag', 'exchange', 'detail', 'audio')
+
+class DictBinary (object):
+
+    MAGIC = b'BDICT\x00\x00\x01'
+    HEADER = '<8s5Q'
+    RECORD = struct.Struct('<4i9I')
+
+    def __init__ (self, filename, cache = 32):
+        self.__filename = os.path.abspath(filename)
+        self.__fp = open(self.__filename, 'rb')
+        self.__mm = None
+        try:
+            self.__mm = mmap.mmap(self.__fp.fileno(), 0, 
+                    access = mmap.ACCESS_READ)
+            self.__open()
+        except (ValueError, mmap.error):
+            self.close()
+            raise ValueError('bad binary dictionary: %s'%filename)
+        self.__cache = {}
+        self.__cache_order = []
+        self.__cache_size = cache
+        self.__lock = threading.Lock()
+
+    def __open (self):
+        mm = self.__mm
+        head = struct.calcsize(self.HEADER)
+        if len(mm) < head or sys.byteorder != 'little':
+            raise ValueError('bad header')
+        magic, count, block, compress, size, nblocks = \
+            struct.unpack(self.HEADER, mm[:head])
+        if magic != self.MAGIC or compress >= len(BINARY_COMPRESS):
+            raise ValueError('bad header')
+        if compress == 2 and pyzstd is None:
+            raise ImportError('pyzstd is required to read %s'%self.__filename)
+        self.__count = count
+        self.__block = block
+        self.__compress = compress
+        self.__prefix = PrefixIndex()
+        self.__prefix.attach(mm, head)
+        pos = head + ((size + 7) & ~7)
+        view = memoryview(mm)
+        self.__blocks = view[pos:pos + (nblocks + 1) * 8].cast('Q')
+        self.__records = pos + (nblocks + 1) * 8
+        return True
+
+    def close (self):
+        if self.__fp is not None:
+            self.__prefix = None
+            self.__blocks = None
+            self.__cache = {}
+            if self.__mm is not None:
+                try:
+                    self.__mm.close()
+                except BufferError:
+                    pass
+                self.__mm = None
+            self.__fp.close()
+            self.__fp = None
+        return True
+
+    # 块的数据，未压缩时直接读 mmap，返回 (数据, 块的起始位置)
+    def __load_block (self, index):
+        start = self.__records + self.__blocks[index]
+        if not self.__compress:
+            return self.__mm, start
+        cache = self.__cache
+        with self.__lock:
+            data = cache.get(index)
+            if data is not None:
+                return data, 0
+        data = self.__mm[start:self.__records + self.__blocks[index + 1]]
+        if self.__compress == 1:
+            data = zlib.decompress(data)
+        else:
+            data = pyzstd.decompress(data)
+        with self.__lock:
+            if index not in cache:
+                cache[index] = data
+                self.__cache_order.append(index)
+                if len(self.__cache_order) > self.__cache_size:
+                    del cache[self.__cache_order.pop(0)]
+        return data, 0
+
+    def __obj_decode (self, index):
+        block, pos = divmod(index, self.__block)
+        data, base = self.__load_block(block)
+        size = min(self.__block, self.__count - block * self.__block)
+        start = struct.unpack_from('<I', data, base + pos * 4)[0]
+        pos = base + (size + 1) * 4 + start
+        fields = self.RECORD.unpack_from(data, pos)
+        pos += self.RECORD.size
+        texts = []
+        for length in fields[4:]:
+            if length == BINARY_NONE:
+                texts.append(None)
+            else:
+                texts.append(data[pos:pos + length].decode('utf-8'))
+                pos += length
+        numbers = [ n for n in fields[:4] ]
+        for i in xrange(4):
+            if numbers[i] == BINARY_NULL:
+                numbers[i] = None
+        word, phonetic, definition, translation, pos, tag, exchange, \
+            detail, audio = texts
+        collins, oxford, bnc, frq = numbers
+        return StarRecord((index, word, stripword(word), phonetic, 
+            definition, translation, pos, collins, oxford, tag, bnc, frq,
+            exchange, detail, audio))
+
+    def __find (self, word):
+        likely = self.__prefix.match(word, 1)
+        if likely and nocase(likely[0][1]) == nocase(word):
+            return likely[0][0]
+        return -1
+
+    # 查询单词
+    def query (self, key):
+        if key is None:
+            return None
+        if isinstance(key, int) or isinstance(key, long):
+            if key < 0 or key >= self.__count:
+                return None
+            return self.__obj_decode(key)
+        index = self.__find(key)
+        if index < 0:
+            return None
+        return self.__obj_decode(index)
+
+    # 查询单词匹配
+    def match (self, word, count = 10, strip = False):
+        return self.__prefix.match(word, count, strip)
+
+    # 批量查询，按 id 顺序解码，同一块只解压一次
+    def query_batch (self, keys):
+        indexes = []
+        for key in keys:
+            if isinstance(key, int) or isinstance(key, long):
+                if key < 0 or key >= self.__count:
+                    key = -1
+                indexes.append(key)
+            elif key is None:
+                indexes.append(-1)
+            else:
+                indexes.append(self.__find(key))
+        records = {}
+        for index in sorted(set(indexes)):
+            if index >= 0:
+                records[index] = self.__obj_decode(index)
+        return [ records.get(index) for index in indexes ]
+
+    # 单词总量
+    def count (self):
+        return self.__count
+
+    # 取得长度
+    def __len__ (self):
+        return self.__count
+
+    # 取得单词
+    def __getitem__ (self, key):
+        return self.query(key)
+
+    # 是否存在
+    def __contains__ (self, key):
+        return self.__find(key) >= 0
+
+    # 迭代器
+    def __iter__ (self):
+        return self.__prefix.__iter__()
+
     # 取得所有单词
     def dumps (self):
         return [ n for _, n in self.__iter__() ]
 
 
+#----------------------------------------------------------------------
+# 流式读取 csv，逐行返回 StarDict.bulk_load 需要的元组，
+# 字段处理和 DictCsv + convert_dict 相同（collins/oxford 为 0 时存 NULL）
+# filename 也可以是已经打开的文本流（比如直接从 7z 中解压的数据）
+#----------------------------------------------------------------------
+def csv_records(filename, codec = 'utf-8'):
+    helper = csv_helper
+    text = csv_codec.decode
+    def number(value):
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError:
+            return helper.readint(value)
+    if isinstance(filename, str):
+        fp = open(filename, encoding = codec, newline = '')
+    else:
+        fp = filename
+    with fp:
+        reader = csv.reader(fp)
+        next(reader, None)
+        for row in reader:
+            if len(row) < 1:
+                continue
+            if len(row) < COLUMN_SIZE:
+                row.extend([None] * (COLUMN_SIZE - len(row)))
+            word, phonetic, definition, translation, pos, collins, oxford, \
+                tag, bnc, frq, exchange, detail, audio = row[:COLUMN_SIZE]
+            if detail:
+                detail = json.dumps(json.loads(detail), ensure_ascii = False)
+            else:
+                detail = None
+            yield (word, text(phonetic), text(definition), text(translation),
+                text(pos), number(collins) or None, number(oxford) or None,
+                text(tag), number(bnc), number(frq), text(exchange), detail,
+                text(audio))
+
+
+#----------------------------------------------------------------------
+# 从任意词典对象按 csv 的列顺序逐条返回记录，同 csv_records
+#----------------------------------------------------------------------
+def dict_records(dictionary, chunk = 1000):
+    names = ('word', 'phonetic', 'definition', 'translation', 'pos', 
+        'collins', 'oxford', 'tag', 'bnc', 'frq', 'exchange', 'detail', 
+        'audio')
+    words = dictionary.dumps()
+    for i in xrange(0, len(words), chunk):
+        for record in dictionary.query_batch(words[i:i + chunk]):
+            if record is None:
+                continue
+            row = [ record.get(n) for n in names ]
+            if row[11] is not None and not isinstance(row[11], str):
+                row[11] = json.dumps(row[11], ensure_ascii = False)
+            yield tuple(row)
+
+
 #----------------------------------------------------------------------
 # 词形衍生：查找动词的各种时态，名词的复数等，或反向查找
 # 格式为每行一条数据：根词汇 -> 衍生1,衍生2,衍生3
@@ -1034,16 +2707,32 @@ class DictCsv (object):
 #----------------------------------------------------------------------
 class LemmaDB (object):
 
+    # 二进制缓存格式：魔数 + 头部 (字符串数、正反向边数、词根数、衍生数、
+    # 字符串区长度、源文件大小和修改时间) + 排好序的字符串区及其偏移 +
+    # 词频 + 正向/反向邻接表 (CSR)
+    CACHE_MAGIC = b'LEMMADB\x02'
+    CACHE_HEADER = '<8s6I2Q'
+
     def __init__ (self):
-        self._stems = {}
-        self._words = {}
-        self._frqs = {}
+        self.reset()
 
-    # 读取数据
-    def load (self, filename, encoding = None):
+    # 读取数据，多次调用会合并到一起。cache 为真时使用/生成 filename + '.bin'
+    # 二进制缓存，缓存只对应这一个文件，所以只在数据库为空时使用，
+    # 已经有数据（之前 load 过或者 add/remove 过）时忽略 cache
+    def load (self, filename, encoding = None, cache = False):
+        if cache and (self._base or self._strings):
+            cache = False
+        if cache:
+            binary = filename + '.bin'
+            try:
+                stamp = self.__stamp(filename)
+                if self.load_cache(binary, stamp = stamp):
+                    return True
+            except (IOError, OSError):
+                pass
         content = open(filename, 'rb').read()
         if content[:3] == b'\xef\xbb\xbf':
-            content = content[3:].decode('utf-8', 'ignore')
+            text = content[3:].decode('utf-8', 'ignore')
         elif encoding is not None:
             text = content.decode(encoding, 'ignore')
         else:
@@ -1057,14 +2746,12 @@ class LemmaDB (object):
                     pass
             if text is None:
                 text = content.decode('utf-8', 'ignore')
-        number = 0
         for line in text.split('\n'):
-            number += 1
             line = line.strip('\r\n ')
             if (not line) or (line[:1] == ';'):
                 continue
             pos = line.find('->')
-            if not pos:
+            if pos < 0:
                 continue
             stem = line[:pos].strip()
             p1 = stem.find('/')
@@ -1075,28 +2762,38 @@ class LemmaDB (object):
             if not stem:
                 continue
             if frq > 0:
-                self._frqs[stem] = frq
+                self._frqs[self.__intern(stem)] = frq
             for word in line[pos + 2:].strip().split(','):
                 p1 = word.find('/')
                 if p1 >= 0:
-                    word = word[:p1].strip()
+                    word = word[:p1]
+                word = word.strip()
                 if not word:
                     continue
-                self.add(stem, word.strip())
+                self.add(stem, word)
+        if cache:
+            try:
+                self.save_cache(binary, filename)
+            except (IOError, OSError):
+                pass
         return True
 
+    # 源文件的 (大小, 修改时间)，写进缓存头部判断缓存是否过期
+    def __stamp (self, filename):
+        st = os.stat(filename)
+        return (st.st_size, st.st_mtime_ns)
+
     # 保存数据文件
     def save (self, filename, encoding = 'utf-8'):
-        stems = list(self._stems.keys())
+        stems = list(self)
         stems.sort(key = lambda x: x.lower())
-        import codecs
         fp = codecs.open(filename, 'w', encoding)
         output = []
         for stem in stems:
             words = self.get(stem)
             if not words:
                 continue
-            frq = self._frqs.get(stem, 0)
+            frq = self._frqs[self.__find(stem)]
             if frq > 0:
                 stem = '%s/%d'%(stem, frq)
             output.append((-frq, u'%s -> %s'%(stem, ','.join(words))))
@@ -1106,57 +2803,208 @@ class LemmaDB (object):
         fp.close()
         return True
 
+    # 保存二进制缓存：字符串按序重新编号，去掉已经没有关联的字符串，
+    # source 为生成这些数据的源文件，它的大小和修改时间记在头部
+    def save_cache (self, filename, source = None):
+        stamp = source and self.__stamp(source) or (0, 0)
+        live = [ i for i in xrange(self._base + len(self._strings))
+                if self.__adjacent(True, i) or self.__adjacent(False, i) ]
+        strings = dict([ (i, self.__string(i).encode('utf-8')) for i in live ])
+        live.sort(key = lambda i: strings[i])
+        remap = dict([ (i, n) for n, i in enumerate(live) ])
+        positions = array.array('I', [0])
+        for i in live:
+            positions.append(positions[-1] + len(strings[i]))
+        blob = b''.join([ strings[i] for i in live ])
+        blob += b'\0' * (-len(blob) % 4)
+        frqs = array.array('i', [ self._frqs[i] for i in live ])
+        tables = []
+        for forward in (True, False):
+            offsets = array.array('I', [0])
+            targets = array.array('I')
+            for i in live:
+                targets.extend([ remap[n] for n in self.__adjacent(forward, i) ])
+                offsets.append(len(targets))
+            tables.append((offsets, targets))
+        header = struct.pack(self.CACHE_HEADER, self.CACHE_MAGIC,
+                len(live), len(tables[0][1]), len(tables[1][1]),
+                self._nstems, self._nwords, len(blob), stamp[0], stamp[1])
+        parts = [positions, frqs, tables[0][0], tables[0][1], tables[1][0], tables[1][1]]
+        if sys.byteorder != 'little':
+            parts = [ array.array(n.typecode, n) for n in parts ]
+            for n in parts:
+                n.byteswap()
+        tmp = filename + '.tmp'
+        with open(tmp, 'wb') as fp:
+            fp.write(header)
+            fp.write(blob)
+            for part in parts:
+                fp.write(part.tobytes())
+        os.replace(tmp, filename)
+        return True
+
+    # 读取二进制缓存，use_mmap 为真时邻接表直接映射文件，不复制，
+    # stamp 不为空时，和缓存里记录的源文件 (大小, 修改时间) 不同就返回 False
+    def load_cache (self, filename, use_mmap = True, stamp = None):
+        with open(filename, 'rb') as fp:
+            if use_mmap and sys.byteorder == 'little':
+                data = mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ)
+            else:
+                data = fp.read()
+        size = struct.calcsize(self.CACHE_HEADER)
+        if len(data) < size:
+            return False
+        head = struct.unpack(self.CACHE_HEADER, data[:size])
+        magic, count, nfwd, nrev, nstems, nwords, nblob = head[:7]
+        if magic != self.CACHE_MAGIC:
+            return False
+        if stamp is not None and tuple(head[7:]) != tuple(stamp):
+            return False
+        self.reset()
+        view = memoryview(data)
+        pos = size
+        start = pos
+        pos += nblob
+        sections = []
+        for length in (count + 1, count, count + 1, nfwd, count + 1, nrev):
+            part = view[pos:pos + length * 4]
+            pos += length * 4
+            if sys.byteorder != 'little':
+                part = array.array('I', part.tobytes())
+                part.byteswap()
+            elif not isinstance(data, mmap.mmap):
+                part = array.array('I', part.tobytes())
+            else:
+                part = part.cast('I')
+            sections.append(part)
+        self._blob = data
+        self._start = start
+        self._offsets = sections[0]
+        self._base = count
+        self._frqs = array.array('i', sections[1].tobytes())
+        if sys.byteorder != 'little':
+            self._frqs.byteswap()
+        self._tables = ((sections[4], sections[5]), (sections[2], sections[3]))
+        self._nstems = nstems
+        self._nwords = nwords
+        self._mmap = isinstance(data, mmap.mmap) and data or None
+        return True
+
+    # 编号 -> 字符串，缓存里的字符串用到时才解码
+    def __string (self, i):
+        if i >= self._base:
+            return self._strings[i - self._base]
+        start, offsets = self._start, self._offsets
+        return self._blob[start + offsets[i]:start + offsets[i + 1]].decode('utf-8')
+
+    # 字符串 -> 编号，缓存里的字符串按 utf-8 排好序可以二分，新加入的查字典
+    def __find (self, word):
+        i = self._ids.get(word, -1)
+        if i >= 0 or not self._base:
+            return i
+        key = word.encode('utf-8')
+        blob, start, offsets = self._blob, self._start, self._offsets
+        lo, hi = 0, self._base
+        while lo < hi:
+            mid = (lo + hi) >> 1
+            if blob[start + offsets[mid]:start + offsets[mid + 1]] < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._base and \
+                blob[start + offsets[lo]:start + offsets[lo + 1]] == key:
+            return lo
+        return -1
+
+    def __intern (self, word):
+        i = self.__find(word)
+        if i < 0:
+            i = self._base + len(self._strings)
+            self._strings.append(word)
+            self._ids[word] = i
+            self._frqs.append(0)
+        return i
+
+    # 邻接表：改动过的在 _overlay 里，否则取缓存里的 CSR 数据
+    def __adjacent (self, forward, i):
+        overlay = self._overlay[forward and 1 or 0]
+        if i in overlay:
+            return overlay[i]
+        if i < 0 or i >= self._base:
+            return ()
+        offsets, targets = self._tables[forward and 1 or 0]
+        return targets[offsets[i]:offsets[i + 1]]
+
+    def __mutable (self, forward, i):
+        overlay = self._overlay[forward and 1 or 0]
+        if i not in overlay:
+            overlay[i] = array.array('l', self.__adjacent(forward, i))
+        return overlay[i]
+
     # 添加一个词根的一个衍生词
     def add (self, stem, word):
-        if stem not in self._stems:
-            self._stems[stem] = {}
-        if word not in self._stems[stem]:
-            self._stems[stem][word] = len(self._stems[stem]) 
-        if word not in self._words:
-            self._words[word] = {}
-        if stem not in self._words[word]:
-            self._words[word][stem] = len(self._words[word])
+        s = self.__intern(stem)
+        w = self.__intern(word)
+        words = self.__mutable(True, s)
+        if w not in words:
+            if not words:
+                self._nstems += 1
+            words.append(w)
+        stems = self.__mutable(False, w)
+        if s not in stems:
+            if not stems:
+                self._nwords += 1
+            stems.append(s)
         return True
 
     # 删除一个词根的一个衍生词
     def remove (self, stem, word):
+        s = self.__find(stem)
+        w = self.__find(word)
+        if s < 0 or w < 0:
+            return False
         count = 0
-        if stem in self._stems:
-            if word in self._stems[stem]:
-                del self._stems[stem][word]
-                count += 1
-            if not self._stems[stem]:
-                del self._stems[stem]
-        if word in self._words:
-            if stem in self._words[word]:
-                del self._words[word][stem]
-                count += 1
-            if not self._words[word]:
-                del self._words[word]
+        if w in self.__adjacent(True, s):
+            words = self.__mutable(True, s)
+            words.remove(w)
+            if not words:
+                self._nstems -= 1
+            count += 1
+        if s in self.__adjacent(False, w):
+            stems = self.__mutable(False, w)
+            stems.remove(s)
+            if not stems:
+                self._nwords -= 1
+            count += 1
         return (count > 0) and True or False
 
     # 清空数据库
     def reset (self):
-        self._stems = {}
-        self._words = {}
+        self._strings = []
+        self._ids = {}
+        self._frqs = array.array('i')
+        self._blob = b''
+        self._start = 0
+        self._offsets = None
+        self._base = 0
+        self._tables = None
+        self._overlay = ({}, {})
+        self._nstems = 0
+        self._nwords = 0
+        self._mmap = None
         return True
 
     # 根据词根找衍生，或者根据衍生反向找词根
     def get (self, word, reverse = False):
-        if not reverse:
-            if word not in self._stems:
-                if word in self._words:
-                    return [word]
-                return None
-            words = [ (v, k) for (k, v) in self._stems[word].items() ]
-        else:
-            if word not in self._words:
-                if word in self._stems:
-                    return [word]
-                return None
-            words = [ (v, k) for (k, v) in self._words[word].items() ]
-        words.sort()
-        return [ k for (v, k) in words ]
+        i = self.__find(word)
+        if i < 0:
+            return None
+        items = self.__adjacent(not reverse, i)
+        if not items:
+            if self.__adjacent(reverse, i):
+                return [word]
+            return None
+        return [ self.__string(n) for n in items ]
 
     # 知道一个单词求它的词根
     def word_stem (self, word):
@@ -1164,34 +3012,35 @@ class LemmaDB (object):
 
     # 总共多少条词根数据
     def stem_size (self):
-        return len(self._stems)
+        return self._nstems
 
     # 总共多少条衍生数据
     def word_size (self):
-        return len(self._words)
+        return self._nwords
 
     def dump (self, what = 'ALL'):
         words = {}
         what = what.lower()
-        if what in ('all', 'stem'):
-            for word in self._stems:
-                words[word] = 1
-        if what in ('all', 'word'):
-            for word in self._words:
-                words[word] = 1
+        for i in xrange(self._base + len(self._strings)):
+            if what in ('all', 'stem') and self.__adjacent(True, i):
+                words[self.__string(i)] = 1
+            elif what in ('all', 'word') and self.__adjacent(False, i):
+                words[self.__string(i)] = 1
         return words
 
     def __len__ (self):
-        return len(self._stems)
+        return self._nstems
 
     def __getitem__ (self, stem):
         return self.get(stem)
 
     def __contains__ (self, stem):
-        return (stem in self._stems)
+        return len(self.__adjacent(True, self.__find(stem))) > 0
 
     def __iter__ (self):
-        return self._stems.__iter__()
+        for i in xrange(self._base + len(self._strings)):
+            if self.__adjacent(True, i):
+                yield self.__string(i)
 
 
 
@@ -1380,6 +3229,87 @@ class DictHelper (object):
         pc.done()
         return True
 
+    # 导出二进制词典 (DictBinary)，dictionary 是任意的词典对象，
+    # compress 为 None, 'zlib' 或 'zstd'，block 为每块的记录数
+    def export_binary (self, dictionary, outname, compress = None, 
+            level = None, block = 64):
+        mode = BINARY_COMPRESS.index(compress or 'none')
+        if mode == 2 and pyzstd is None:
+            raise ImportError('pyzstd is required for zstd compression')
+        words = {}
+        for word in dictionary.dumps():
+            key = nocase(word).encode('utf-8')
+            if key not in words:
+                words[key] = word
+        words = [ words[key] for key in sorted(words) ]
+        prefix = PrefixIndex()
+        prefix.build([ (i, word, None) for i, word in enumerate(words) ])
+        data = prefix.tobytes()
+        size = len(data)
+        data += b'\x00' * (((size + 7) & ~7) - size)
+        count = len(words)
+        nblocks = (count + block - 1) // block
+        header = struct.pack(DictBinary.HEADER, DictBinary.MAGIC, count, 
+                block, mode, size, nblocks)
+        offsets = array.array('Q', [0])
+        position = 0
+        chunk = block * 16
+        pc = self.progress(nblocks)
+        tmp = outname + '.tmp'
+        with open(tmp, 'wb') as fp:
+            fp.write(header)
+            fp.write(data)
+            fp.write(b'\x00' * (8 * (nblocks + 1)))
+            for i in xrange(0, count, chunk):
+                keys = words[i:i + chunk]
+                records = dictionary.query_batch(keys)
+                for j in xrange(0, len(keys), block):
+                    pc.next()
+                    body = [ self.__binary_record(keys[k], records[k])
+                        for k in xrange(j, min(j + block, len(keys))) ]
+                    positions = array.array('I', [0])
+                    for text in body:
+                        positions.append(positions[-1] + len(text))
+                    body = positions.tobytes() + b''.join(body)
+                    if mode == 1:
+                        body = zlib.compress(body, 
+                                level is None and 6 or level)
+                    elif mode == 2:
+                        body = pyzstd.compress(body, level)
+                    fp.write(body)
+                    position += len(body)
+                    offsets.append(position)
+            fp.seek(len(header) + len(data))
+            fp.write(offsets.tobytes())
+        os.replace(tmp, outname)
+        pc.done()
+        return True
+
+    def __binary_record (self, word, record):
+        if record is None:
+            record = {}
+        numbers = []
+        for name in ('collins', 'oxford', 'bnc', 'frq'):
+            value = record.get(name)
+            if value is None or value == '':
+                value = BINARY_NULL
+            numbers.append(int(value))
+        lengths = []
+        texts = []
+        for name in BINARY_TEXTS:
+            value = word
+            if name != 'word':
+                value = record.get(name)
+            if name == 'detail' and isinstance(value, dict):
+                value = json.dumps(value, ensure_ascii = False)
+            if value is None:
+                lengths.append(BINARY_NONE)
+            else:
+                value = value.encode('utf-8')
+                lengths.append(len(value))
+                texts.append(value)
+        return DictBinary.RECORD.pack(*(numbers + lengths)) + b''.join(texts)
+
     # 导出 mdict 的源文件
     def export_mdict (self, wordmap, outname):
         keys = [ k for k in wordmap ]
@@ -1649,17 +3579,14 @@ class DictHelper (object):
                 continue
             word = line[:p1].rstrip('\r\n\t ')
             text = line[p1:].lstrip('\r\n\t ')
-            text = text.replace('\\n', '\n').replace('\\r', '\r')
-            words[word] = text.replace('\\t', '\t').replace('\\\\', '\\')
+            words[word] = tab_codec.decode(text)
         return words
 
     # 保存 tab 分割的 txt文件
     def tab_txt_save (self, filename, words, encoding = 'utf-8'):
         with codecs.open(filename, 'w', encoding = encoding) as fp:
             for word in words:
-                text = words[word]
-                text = text.replace('\\', '\\\\').replace('\n', '\\n')
-                text = text.replace('\r', '\\r').replace('\t', '\\t')
+                text = tab_codec.encode(words[word])
                 fp.write('%s\t%s\r\n'%(word, text))
         return True
 
@@ -1754,21 +3681,45 @@ class DictHelper (object):
 #----------------------------------------------------------------------
 tools = DictHelper()
 
-# 根据文件名自动判断数据库类型并打开
-def open_dict(filename):
+# 根据文件名自动判断数据库类型并打开，只读时 csv 使用 DictCsvLazy，
+# .bdict 总是只读的 DictBinary
+def open_dict(filename, readonly = False):
     if isinstance(filename, dict):
         return DictMySQL(filename)
     if filename[:8] == 'mysql://':
         return DictMySQL(filename)
-    if os.path.splitext(filename)[-1].lower() in ('.csv', '.txt'):
+    ext = os.path.splitext(filename)[-1].lower()
+    if ext in ('.csv', '.txt'):
+        if readonly:
+            return DictCsvLazy(filename)
         return DictCsv(filename)
-    return StarDict(filename)
-
-
-# 字典转化，csv sqlite之间互转
-def convert_dict(dstname, srcname):
+    if ext == '.bdict':
+        return DictBinary(filename)
+    return StarDict(filename, readonly = readonly)
+
+
+# 字典转化，csv sqlite之间互转，slim 为真时生成精简版的 sqlite 词典
+def convert_dict(dstname, srcname, bulk = True, slim = False, verbose = True):
+    if isinstance(dstname, str) and dstname[:8] != 'mysql://':
+        if os.path.splitext(dstname)[-1].lower() == '.bdict':
+            src = open_dict(srcname, readonly = True)
+            return tools.export_binary(src, dstname)
+    if bulk and isinstance(dstname, str) and isinstance(srcname, str):
+        ext1 = os.path.splitext(dstname)[-1].lower()
+        ext2 = os.path.splitext(srcname)[-1].lower()
+        if ext1 not in ('.csv', '.txt') and dstname[:8] != 'mysql://':
+            records = None
+            if ext2 in ('.csv', '.txt'):
+                records = csv_records(srcname)
+            elif slim:
+                records = dict_records(open_dict(srcname, readonly = True))
+            if records is not None:
+                dst = StarDict(dstname, verbose)
+                dst.bulk_load(records, slim = slim)
+                dst.close()
+                return True
     dst = open_dict(dstname)
-    src = open_dict(srcname)
+    src = open_dict(srcname, readonly = True)
     dst.delete_all()
     pc = tools.progress(len(src))
     for word in src.dumps():
@@ -1874,6 +3825,11 @@ if __name__ == '__main__':
         t = time.time()
         lemma.load('lemma.en.txt')
         print('load in %s seconds'%str(time.time() - t))
+        lemma.save_cache('lemma.en.txt.bin', 'lemma.en.txt')
+        lemma = LemmaDB()
+        t = time.time()
+        lemma.load('lemma.en.txt', cache = True)
+        print('load cache in %s seconds'%str(time.time() - t))
         print(len(lemma))
         for word in ('be', 'give', 'see', 'take'):
             print('%s -> %s'%(word, ','.join(lemma.get(word))))
@@ -1883,6 +3839,166 @@ if __name__ == '__main__':
         return 0
     def test5():
         print(tools.validate_word('Hello World', False))
+    def test6():
+        # query_batch benchmark against the old "word = ? or ..." predicate
+        import random
+        def query_batch_or(sd, keys):
+            querys = []
+            for key in keys:
+                if isinstance(key, int) or isinstance(key, long):
+                    querys.append('id = ?')
+                elif key is not None:
+                    querys.append('word = ?')
+            sql = 'select * from stardict where ' + ' or '.join(querys) + ';'
+            c = sd._StarDict__conn.cursor()
+            c.execute(sql, tuple(keys))
+            return c.fetchall()
+        sd = StarDict(':memory:', False)
+        random.seed(0)
+        letters = 'abcdefghijklmnopqrstuvwxyz'
+        words = set()
+        while len(words) < 200000:
+            n = random.randint(3, 12)
+            words.add(''.join([ random.choice(letters) for i in xrange(n) ]))
+        words = list(words)
+        for word in words:
+            sd.register(word, {'definition':'test'}, False)
+        sd.commit()
+        for size in (500, 1000, 10000, 100000):
+            keys = random.sample(words, size)
+            keys[::3] = [ random.randint(1, len(words)) for k in keys[::3] ]
+            t = time.time()
+            try:
+                query_batch_or(sd, keys)
+                old = '%.3fs'%(time.time() - t)
+            except sqlite3.Error as e:
+                old = 'failed (%s)'%e
+            t = time.time()
+            result = sd.query_batch(keys)
+            new = time.time() - t
+            assert len(result) == size and None not in result
+            print('%6d keys: new %.3fs, old %s'%(size, new, old))
+        return 0
+    def test7():
+        # DictRecord vs the old per-row dict + json.loads
+        import tracemalloc
+        def record2obj_dict(record):
+            word = {}
+            for i, k in enumerate(RECORD_FIELDS):
+                word[k] = record[i]
+            if word['detail']:
+                try:
+                    word['detail'] = json.loads(word['detail'])
+                except:
+                    word['detail'] = None
+            return word
+        sd = StarDict(':memory:', False)
+        detail = {'sentences': [['an example', '例句']] * 4}
+        for i in xrange(100000):
+            sd.register('word%d'%i, {'definition':'n. test\nv. test', 
+                'translation':'测试', 'detail':detail}, False)
+        sd.commit()
+        c = sd._StarDict__conn.cursor()
+        rows = c.execute('select * from stardict;').fetchall()
+        for name, make in (('dict', record2obj_dict), ('record', StarRecord)):
+            tracemalloc.start()
+            t = time.time()
+            records = [ make(row) for row in rows ]
+            for record in records:
+                record['word'], record['translation']
+            t = time.time() - t
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            print('%6s: %.3fs, %d bytes/row'%(name, t, size / len(rows)))
+            records = None
+        return 0
+    def test8():
+        # escape codec over every text column of stardict.csv
+        def decode_loop(text):
+            output = []
+            i = 0
+            if text is None:
+                return None
+            size = len(text)
+            while i < size:
+                c = text[i]
+                if c == '\\':
+                    c = text[i + 1:i + 2]
+                    if c == '\\':
+                        output.append('\\')
+                    elif c == 'n':
+                        output.append('\n')
+                    elif c == 'r':
+                        output.append('\r')
+                    else:
+                        output.append('\\' + c)
+                    i += 2
+                else:
+                    output.append(c)
+                    i += 1
+            return ''.join(output)
+        def encode_replace(text):
+            if text is None:
+                return None
+            text = text.replace('\\', '\\\\').replace('\n', '\\n')
+            return text.replace('\r', '\\r')
+        with open('stardict.csv', encoding = 'utf-8', newline = '') as fp:
+            reader = csv.reader(fp)
+            next(reader)
+            fields = [ n for row in reader for n in row[1:5] + row[7:8] ]
+        print('%d fields'%len(fields))
+        for name, func in (('loop decode', decode_loop), 
+                ('codec decode', csv_codec.decode)):
+            t = time.time()
+            texts = [ func(n) for n in fields ]
+            print('%s: %.3fs'%(name, time.time() - t))
+        for name, func in (('replace encode', encode_replace), 
+                ('codec encode', csv_codec.encode)):
+            t = time.time()
+            result = [ func(n) for n in texts ]
+            print('%s: %.3fs'%(name, time.time() - t))
+        assert result == fields
+        return 0
+    def test9():
+        # cold start (open + first query) and lookup latency per backend
+        import random
+        for comp in ('none', 'zstd'):
+            name = 'stardict.%s.bdict'%comp
+            if not os.path.exists(name):
+                src = StarDict('stardict.db', readonly = True)
+                tools.export_binary(src, name, comp)
+                src.close()
+        backends = (('StarDict', lambda: StarDict('stardict.db', 
+                        readonly = True)),
+                    ('DictCsv', lambda: DictCsv('stardict.csv')),
+                    ('DictCsvLazy', lambda: DictCsvLazy('stardict.csv')),
+                    ('DictBinary', lambda: DictBinary('stardict.none.bdict')),
+                    ('DictBinary+zstd', 
+                        lambda: DictBinary('stardict.zstd.bdict')))
+        words = None
+        for name, factory in backends:
+            t = time.time()
+            dd = factory()
+            dd.query('hello')
+            cold = time.time() - t
+            if words is None:
+                random.seed(0)
+                words = random.sample(dd.dumps(), 10000)
+            t = time.time()
+            for word in words:
+                dd.query(word)
+            single = (time.time() - t) / len(words)
+            t = time.time()
+            dd.query_batch(words)
+            batch = (time.time() - t) / len(words)
+            t = time.time()
+            for word in words[:2000]:
+                dd.match(word, 10)
+            match = (time.time() - t) / 2000
+            print('%-16s cold %8.1f ms  query %6.1f us  batch %6.1f us'
+                '  match %6.1f us'%(name, cold * 1000, single * 1e6, 
+                    batch * 1e6, match * 1e6))
+        return 0
     test3()
 
 
@@ -1,19 +1,318 @@
 import asyncio
+import json
 import os
 import re
 import shutil
+import sqlite3
 import tempfile
+import time
+import zlib
 import aiohttp
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from gtts import gTTS
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 from typing import Dict, Optional
+from anki_packager.limiter import AdaptiveLimiter
 from anki_packager.logger import logger
 
+try:
+    import lxml  # noqa: F401
+
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+# phrases and sentences live in the only two <ul> without a class
+PAGE_STRAINER = SoupStrainer("ul", class_="")
+
+# "html": the m.youdao.com result page, "json": the dictionary JSON API
+BACKENDS = ("html", "json")
+# only ask the JSON API for the two sections we keep
+JSON_DICTS = json.dumps({"count": 99, "dicts": [["phrs", "blng_sents_part"]]})
+
+
+def parse_word_page(
+    text: str, word: str, features: Optional[str] = None, parse_only=PAGE_STRAINER
+) -> Dict:
+    """Extract phrases and sentences from a m.youdao.com result page
+
+    Plain function so it can run in a thread or process pool. Only the
+    class-less <ul> sections are built into a tree, `parse_only=None` parses
+    the whole page.
+    """
+    soup = BeautifulSoup(text, features or HTML_PARSER, parse_only=parse_only)
+
+    result = {
+        "word": word,
+        "example_phrases": [],
+        "example_sentences": [],
+    }
+
+    all_uls = soup.find_all("ul", class_="")
+    # Extract example phrases
+    if len(all_uls) > 0:
+        phrase_ul = all_uls[0]
+        if phrase_ul:
+            phrase_lis = phrase_ul.find_all("li", class_="mcols-layout")
+            for li in phrase_lis:
+                index = (
+                    li.find("span", class_="grey").text.strip()
+                    if li.find("span", class_="grey")
+                    else None
+                )
+                col2_element = li.find("div", class_="col2")
+                point_element = col2_element.find("a", class_="point")
+                sen_phrase_element = col2_element.find("p", class_="sen-phrase")
+                english = None
+                chinese = None
+                if point_element and sen_phrase_element:
+                    english = point_element.text.strip()
+                    chinese = sen_phrase_element.text.strip()
+                else:
+                    content = col2_element.text.strip()
+                    parts = re.split(r"([;；])", content)
+                    parts = [
+                        s.strip() for s in parts if s.strip() and s not in [";", "；"]
+                    ]
+                    if len(parts) > 1:
+                        english = parts[0]
+                        chinese = "".join(parts[1:])
+                    else:
+                        english = content
+
+                result["example_phrases"].append(
+                    {
+                        "index": index,
+                        "english": english,
+                        "chinese": chinese,
+                    }
+                )
+
+    # Extract example sentences
+    if len(all_uls) > 1:
+        sentence_ul = all_uls[1]
+        if sentence_ul:
+            sentence_lis = sentence_ul.find_all("li", class_="mcols-layout")
+            for li in sentence_lis:
+                index = (
+                    li.find("span", class_="grey index").text.strip()
+                    if li.find("span", class_="grey index")
+                    else None
+                )
+                english_element = li.find("div", class_="sen-eng")
+                chinese_element = li.find("div", class_="sen-ch")
+                source_element = li.find("div", class_="secondary")
+
+                english = english_element.text.strip() if english_element else None
+                chinese = chinese_element.text.strip() if chinese_element else None
+                source = source_element.text.strip() if source_element else None
+
+                result["example_sentences"].append(
+                    {
+                        "index": index,
+                        "english": english,
+                        "chinese": chinese,
+                        "source": source,
+                    }
+                )
+
+    return result
+
+
+def _json_text(value) -> Optional[str]:
+    """JSON API texts are either a string or a list of strings"""
+    if isinstance(value, list):
+        value = "；".join(v for v in value if isinstance(v, str))
+    if not isinstance(value, str):
+        return None
+    return value.strip()
+
+
+def parse_word_json(data: Dict, word: str) -> Dict:
+    """Same shape as parse_word_page() from a dictionary JSON API payload
+
+    The payload layout (phrs.phrs[].phr, blng_sents_part.sentence-pair[]) is
+    assumed from the jsonapi's public output, no live response is recorded
+    in the tests. A payload with neither section raises ValueError, so a
+    changed schema falls back to the HTML page instead of being cached as
+    a word without examples.
+    """
+    if "phrs" not in data and "blng_sents_part" not in data:
+        raise ValueError(f"No phrs/blng_sents_part in JSON payload for {word}")
+    result = {
+        "word": word,
+        "example_phrases": [],
+        "example_sentences": [],
+    }
+
+    phrases = (data.get("phrs") or {}).get("phrs") or []
+    for i, item in enumerate(phrases, 1):
+        phrase = item.get("phr") or {}
+        english = _json_text(phrase.get("headword", {}).get("l", {}).get("i"))
+        chinese = [
+            _json_text(tr.get("tr", {}).get("l", {}).get("i"))
+            for tr in phrase.get("trs") or []
+        ]
+        result["example_phrases"].append(
+            {
+                "index": f"{i}.",
+                "english": english,
+                "chinese": "；".join(c for c in chinese if c) or None,
+            }
+        )
+
+    sentences = (data.get("blng_sents_part") or {}).get("sentence-pair") or []
+    for i, pair in enumerate(sentences, 1):
+        result["example_sentences"].append(
+            {
+                "index": f"{i}.",
+                "english": _json_text(pair.get("sentence")),
+                "chinese": _json_text(pair.get("sentence-translation")),
+                "source": _json_text(pair.get("source")),
+            }
+        )
+
+    return result
+
+
+class YoudaoCache:
+    """Persistent cache of parsed get_word_info() results
+
+    A single SQLite file keyed by the normalized word, values are
+    zlib-compressed JSON. Entries expire after `ttl` seconds, results
+    without any phrase or sentence after `negative_ttl` seconds (None
+    never expires), and beyond `max_entries` the least recently used
+    entries are evicted.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: Optional[float] = 30 * 86400,
+        negative_ttl: Optional[float] = 86400,
+        max_entries: int = 50000,
+    ):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS youdao ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "negative INTEGER NOT NULL, created REAL NOT NULL, "
+                "accessed REAL NOT NULL) WITHOUT ROWID"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS youdao_accessed ON youdao (accessed)"
+            )
+        self._count = self._conn.execute("SELECT count(*) FROM youdao").fetchone()[0]
+
+    @staticmethod
+    def normalize(word: str) -> str:
+        return " ".join(word.split()).lower()
+
+    def __len__(self):
+        return self._count
+
+    def get(self, word: str) -> Optional[Dict]:
+        """The cached result of `word`, None on a miss or an expired entry"""
+        key = self.normalize(word)
+        row = self._conn.execute(
+            "SELECT value, negative, created FROM youdao WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is not None:
+            ttl = self.negative_ttl if row[1] else self.ttl
+            if ttl is not None and now - row[2] > ttl:
+                with self._conn:
+                    self._conn.execute("DELETE FROM youdao WHERE key = ?", (key,))
+                self._count -= 1
+                row = None
+        if row is None:
+            self.misses += 1
+            return None
+        with self._conn:
+            self._conn.execute(
+                "UPDATE youdao SET accessed = ? WHERE key = ?", (now, key)
+            )
+        self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, word: str, result: Dict):
+        """Store a parsed result, one without phrases and sentences is negative"""
+        key = self.normalize(word)
+        value = zlib.compress(json.dumps(result, ensure_ascii=False).encode("utf-8"))
+        negative = not (
+            result.get("example_phrases") or result.get("example_sentences")
+        )
+        now = time.time()
+        with self._conn:
+            cursor = self._conn.execute(
+                "UPDATE youdao SET value = ?, negative = ?, created = ?, "
+                "accessed = ? WHERE key = ?",
+                (value, negative, now, now, key),
+            )
+            if cursor.rowcount == 0:
+                self._conn.execute(
+                    "INSERT INTO youdao VALUES (?, ?, ?, ?, ?)",
+                    (key, value, negative, now, now),
+                )
+                self._count += 1
+            if self._count > self.max_entries:
+                # least recently used first
+                self._conn.execute(
+                    "DELETE FROM youdao WHERE key IN (SELECT key FROM youdao "
+                    "ORDER BY accessed LIMIT ?)",
+                    (self._count - self.max_entries,),
+                )
+                self._count = self.max_entries
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": self._count,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
 
 class YoudaoScraper:
-    def __init__(self):
+    def __init__(
+        self,
+        cache: Optional[YoudaoCache] = None,
+        parse_workers: int = 0,
+        backend: str = "html",
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown Youdao backend: {backend}")
         self.base_url = "https://m.youdao.com/result"
+        self.json_url = "https://dict.youdao.com/jsonapi"
+        # the other backend is tried when the preferred one fails
+        self.backends = (backend,) + tuple(b for b in BACKENDS if b != backend)
         self.tmp = tempfile.mkdtemp()
+        # parsed results survive between runs, see YoudaoCache
+        self.cache = cache
+        # 0: parse pages in the default thread pool, n: in n processes
+        self.parse_workers = parse_workers
+        self._parser_pool = None
+        # concurrent requests to Youdao and gTTS, adapted to how they respond
+        self.limiter = AdaptiveLimiter("youdao", 8)
+        self.audio_limiter = AdaptiveLimiter("gtts", 8)
+        self._audio_pool = None
 
     async def __aenter__(self):
         """进入 async with 时被调用"""
@@ -22,11 +321,24 @@ class YoudaoScraper:
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3"
             }
         )
+        # own threads: the default pool would cap gTTS below its limiter
+        self._audio_pool = ThreadPoolExecutor(self.audio_limiter.max_limit)
+        if self.parse_workers > 0:
+            # spawn: forking a process that already runs threads is unsafe
+            self._parser_pool = ProcessPoolExecutor(
+                self.parse_workers, mp_context=multiprocessing.get_context("spawn")
+            )
         return self  # 返回实例本身
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """离开 async with 时被调用，确保 Session 被关闭"""
         await self._session.close()
+        if self._parser_pool is not None:
+            self._parser_pool.shutdown(cancel_futures=True)
+            self._parser_pool = None
+        self._audio_pool.shutdown(cancel_futures=True)
+        if self.cache is not None:
+            self.cache.close()
         try:
             self._clean_temp_dir()
         except Exception as e:
@@ -42,7 +354,8 @@ class YoudaoScraper:
             tts = gTTS(text=word, lang="en")
             tts.save(filename)
 
-        await loop.run_in_executor(None, generate_and_save_audio)
+        async with self.audio_limiter.slot():
+            await loop.run_in_executor(self._audio_pool, generate_and_save_audio)
 
         return filename
 
@@ -56,104 +369,123 @@ class YoudaoScraper:
             logger.error(f"音频临时文件夹 {self.tmp} 清理失败: {e}")
 
     async def get_word_info(self, word: str) -> Optional[Dict]:
-        try:
-            params = {"word": word, "lang": "en"}
+        """Phrases and sentences of `word`, from the cache when possible"""
+        if self.cache is not None:
+            result = self.cache.get(word)
+            if result is not None:
+                result["word"] = word
+                return result
+        result = await self._fetch_word_info(word)
+        # request errors (None) are not cached
+        if result is not None and self.cache is not None:
+            self.cache.put(word, result)
+        return result
+
+    async def _fetch_word_info(self, word: str) -> Optional[Dict]:
+        for backend in self.backends:
+            try:
+                if backend == "json":
+                    return await self._fetch_json(word)
+                return await self._fetch_html(word)
+            except aiohttp.ClientError as e:
+                logger.error(f"Request error ({backend}): {e}")
+            except Exception as e:
+                logger.error(f"An error occurred ({backend}): {e}")
+        return None
+
+    async def _fetch_html(self, word: str) -> Dict:
+        params = {"word": word, "lang": "en"}
 
+        async with self.limiter.slot():
             async with self._session.get(self.base_url, params=params) as response:
                 response.raise_for_status()
                 r_text = await response.text()
-                soup = BeautifulSoup(r_text, "html.parser")
 
-            result = {
-                "word": word,
-                "example_phrases": [],
-                "example_sentences": [],
-            }
+        # parsing is CPU bound, keep it off the event loop
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._parser_pool, parse_word_page, r_text, word
+        )
 
+    async def _fetch_json(self, word: str) -> Dict:
+        params = {"q": word, "le": "en", "dicts": JSON_DICTS}
 
-            all_uls = soup.find_all("ul", class_="")
-            # Extract example phrases
-            if len(all_uls) > 0:
-                phrase_ul = all_uls[0]
-                if phrase_ul:
-                    phrase_lis = phrase_ul.find_all("li", class_="mcols-layout")
-                    for li in phrase_lis:
-                        index = (
-                            li.find("span", class_="grey").text.strip()
-                            if li.find("span", class_="grey")
-                            else None
-                        )
-                        col2_element = li.find("div", class_="col2")
-                        point_element = col2_element.find("a", class_="point")
-                        sen_phrase_element = col2_element.find("p", class_="sen-phrase")
-                        english = None
-                        chinese = None
-                        if point_element and sen_phrase_element:
-                            english = point_element.text.strip()
-                            chinese = sen_phrase_element.text.strip()
-                        else:
-                            content = col2_element.text.strip()
-                            parts = re.split(r"([;；])", content)
-                            parts = [
-                                s.strip()
-                                for s in parts
-                                if s.strip() and s not in [";", "；"]
-                            ]
-                            if len(parts) > 1:
-                                english = parts[0]
-                                chinese = "".join(parts[1:])
-                            else:
-                                english = content
-
-                        result["example_phrases"].append(
-                            {
-                                "index": index,
-                                "english": english,
-                                "chinese": chinese,
-                            }
-                        )
-
-            # Extract example sentences
-            if len(all_uls) > 1:
-                sentence_ul = all_uls[1]
-                if sentence_ul:
-                    sentence_lis = sentence_ul.find_all("li", class_="mcols-layout")
-                    for li in sentence_lis:
-                        index = (
-                            li.find("span", class_="grey index").text.strip()
-                            if li.find("span", class_="grey index")
-                            else None
-                        )
-                        english_element = li.find("div", class_="sen-eng")
-                        chinese_element = li.find("div", class_="sen-ch")
-                        source_element = li.find("div", class_="secondary")
-
-                        english = english_element.text.strip() if english_element else None
-                        chinese = chinese_element.text.strip() if chinese_element else None
-                        source = source_element.text.strip() if source_element else None
-
-                        result["example_sentences"].append(
-                            {
-                                "index": index,
-                                "english": english,
-                                "chinese": chinese,
-                                "source": source,
-                            }
-                        )
-
-            return result
-
-        except aiohttp.ClientError as e:
-            logger.error(f"Request error: {e}")
-            return None
-        except Exception as e:
-            logger.error(f"An error occurred: {e}")
-            return None
+        async with self.limiter.slot():
+            async with self._session.get(self.json_url, params=params) as response:
+                response.raise_for_status()
+                # the content type is not always application/json
+                data = json.loads(await response.text())
+
+        if not isinstance(data, dict):
+            raise ValueError(f"Unexpected JSON payload for {word}")
+        return parse_word_json(data, word)
 
 
 if __name__ == "__main__":
-    async def main():
-        async with YoudaoScraper() as youdao:
-            result = asyncio.run(youdao.get_word_info("variable"))
-            print(result)
-    asyncio.run(main())
+    # python -m anki_packager.dict.youdao [word]
+    # benchmark on saved pages and JSON API payloads:
+    # python -m anki_packager.dict.youdao --bench <word.html>... [<word.json>...]
+    # tests/fixtures/youdao holds small hand-written pages (1-3 KB), not real
+    # result pages: they check correctness, measure on saved live pages
+    import sys
+
+    if sys.argv[1:2] != ["--bench"]:
+        word = sys.argv[1] if len(sys.argv) > 1 else "variable"
+
+        async def main():
+            async with YoudaoScraper() as youdao:
+                print(await youdao.get_word_info(word))
+
+        asyncio.run(main())
+        sys.exit(0)
+
+    pages = []
+    payloads = []
+    for path in sys.argv[2:]:
+        with open(path, encoding="utf-8") as f:
+            word, ext = os.path.splitext(os.path.basename(path))
+            (payloads if ext == ".json" else pages).append((f.read(), word))
+
+    def report(name, items, rate):
+        size = sum(len(text.encode("utf-8")) for text, _ in items) / len(items)
+        print(f"{name:24} {rate:8.1f} pages/s (1 core), {size / 1024:6.1f} KB/page")
+
+    if pages:
+        rounds = max(1, 200 // len(pages))
+        expected = [parse_word_page(t, w, "html.parser", None) for t, w in pages]
+        features = ["html.parser"] + (["lxml"] if HTML_PARSER == "lxml" else [])
+        for feature in features:
+            for name, strainer in (("full page", None), ("strained", PAGE_STRAINER)):
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    actual = [
+                        parse_word_page(t, w, feature, strainer) for t, w in pages
+                    ]
+                rate = len(pages) * rounds / (time.perf_counter() - start)
+                assert actual == expected, (feature, name)
+                report(f"{feature} {name}", pages, rate)
+
+        workers = os.cpu_count() or 1
+        with ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            # warm up the workers before timing
+            list(pool.map(parse_word_page, *zip(*pages)))
+            start = time.perf_counter()
+            for _ in range(rounds):
+                actual = list(pool.map(parse_word_page, *zip(*pages)))
+            rate = len(pages) * rounds / (time.perf_counter() - start)
+        assert actual == expected
+        print(
+            f"{HTML_PARSER + ' processes':24} {rate:8.1f} pages/s "
+            f"({workers} cores, {rate / workers:.1f} per core)"
+        )
+
+    if payloads:
+        rounds = max(1, 2000 // len(payloads))
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for text, word in payloads:
+                parse_word_json(json.loads(text), word)
+        rate = len(payloads) * rounds / (time.perf_counter() - start)
+        report("json", payloads, rate)
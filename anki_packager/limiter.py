@@ -0,0 +1,113 @@
+import asyncio
+import contextlib
+import time
+
+
+def is_overload(error: BaseException) -> bool:
+    """True if `error`, or an exception it was raised from, means "slow down"
+
+    Timeouts and HTTP 429/5xx count, whether they come from aiohttp
+    (`status`), litellm/httpx (`status_code`) or gTTS (`rsp.status_code`).
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (asyncio.TimeoutError, TimeoutError)):
+            return True
+        status = getattr(error, "status", None)
+        if not isinstance(status, int):
+            status = getattr(error, "status_code", None)
+        if not isinstance(status, int):
+            status = getattr(getattr(error, "rsp", None), "status_code", None)
+        if isinstance(status, int) and (status == 429 or status >= 500):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+class AdaptiveLimiter:
+    """Concurrency limit of one backend, adapted AIMD style
+
+    Every call that finishes in time raises the limit by 1/limit, about one
+    more slot per round of requests. A 429/5xx or a timeout halves it, a call
+    slower than `tolerance` times the baseline latency shrinks it by 10%.
+    Decreases are at most one per baseline latency, so a burst of failures
+    counts as a single congestion event.
+
+        async with limiter.slot():
+            await fetch()
+    """
+
+    def __init__(
+        self,
+        name: str,
+        limit: float = 8,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        backoff: float = 0.5,
+        tolerance: float = 2.0,
+    ):
+        self.name = name
+        self.limit = float(limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.inflight = 0
+        self.overloads = 0
+        # close to the fastest latency seen, drifts up slowly
+        self.baseline = None
+        self._last_decrease = 0.0
+        self._cond = None
+
+    def __str__(self):
+        return f"{self.name} {self.inflight}/{int(self.limit)}"
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        if self._cond is None:
+            # created lazily so it binds to the running loop
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.inflight < int(self.limit))
+            self.inflight += 1
+        start = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self._feedback(time.monotonic() - start, e)
+            raise
+        else:
+            self._feedback(time.monotonic() - start, None)
+        finally:
+            # before any await: a second cancel must not leak the slot
+            self.inflight -= 1
+            await asyncio.shield(self._notify())
+
+    async def _notify(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+    def _feedback(self, latency: float, error):
+        if error is not None:
+            if not is_overload(error):
+                # e.g. a 404 or a parse error, nothing to learn from
+                return
+            self.overloads += 1
+            self._decrease(self.backoff, latency)
+            return
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            self.baseline += (latency - self.baseline) * 0.05
+        if latency > self.baseline * self.tolerance:
+            self._decrease(0.9, latency)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _decrease(self, factor: float, latency: float):
+        now = time.monotonic()
+        if now - self._last_decrease < (self.baseline or latency):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * factor)
@@ -27,11 +27,15 @@ def initialize_config():
         │   ├── config.toml
         │   ├── failed.txt
         │   └── vocabulary.txt
+        ├── cache
+        │   └── youdao.db
         └── dicts
             ├── 单词释义比例词典-带词性.mdx
+            ├── 单词释义比例词典-带词性.db
             ├── 有道词语辨析.mdx
+            ├── 有道词语辨析.db
             ├── stardict.7z
-            ├── stardict.csv
+            ├── stardict.csv (可选)
             └── stardict.db
     """
     config_dir = get_user_config_dir()
@@ -47,6 +51,11 @@ PROXY = ""
 EUDIC_TOKEN = ""
 EUDIC_ID = "0"
 DECK_NAME = "anki_packager"
+ECDICT_HOT_SET = 0                # 启动时载入内存的 ECDICT 高频词数量，如 50000
+YOUDAO_CACHE_DAYS = 30            # 有道查询结果缓存天数，0 为不缓存
+YOUDAO_CACHE_SIZE = 50000         # 有道缓存最多保留的单词数
+YOUDAO_PARSE_WORKERS = 0          # 解析有道网页的进程数，0 为在线程中解析
+YOUDAO_BACKEND = "html"           # 有道数据来源："html" 网页或 "json" 接口，失败时自动换用另一个
 
 [[MODEL_PARAM]]
 model = "gemini/gemini-2.5-flash"
@@ -0,0 +1,85 @@
+"""Wall clock of process_word's stage DAG against running the stages in a chain
+
+    python -m tests.bench_stages [words ...]
+
+Stand-in backends sleep for a fixed latency behind the same AdaptiveLimiter
+the real ones use (ECDICT 5 ms, gTTS 150 ms, Youdao 120 ms, LLM 600 ms).
+"""
+
+import asyncio
+import sys
+import time
+
+from anki_packager.cli import run_stages, word_stages
+from anki_packager.limiter import AdaptiveLimiter
+
+ECDICT, TTS, YOUDAO, LLM = 0.005, 0.15, 0.12, 0.6
+
+
+class Ecdict:
+    async def ret_word(self, word):
+        await asyncio.sleep(ECDICT)
+        return {"word": word}
+
+
+class Youdao:
+    def __init__(self):
+        self.limiter = AdaptiveLimiter("youdao", 8)
+        self.audio_limiter = AdaptiveLimiter("gtts", 8)
+
+    async def _get_audio(self, word):
+        async with self.audio_limiter.slot():
+            await asyncio.sleep(TTS)
+        return f"{word}.mp3"
+
+    async def get_word_info(self, word):
+        async with self.limiter.slot():
+            await asyncio.sleep(YOUDAO)
+        return {"word": word, "example_phrases": [], "example_sentences": []}
+
+
+class AI:
+    def __init__(self):
+        self.limiter = AdaptiveLimiter("llm", 4)
+
+    async def explain(self, word):
+        async with self.limiter.slot():
+            await asyncio.sleep(LLM)
+        return {"word": word}
+
+
+def chained(stages):
+    """The same stages, each one waiting for the one before it"""
+    names = list(stages)
+    return {
+        name: (tuple(names[i - 1 : i]), stages[name][1]) for i, name in enumerate(names)
+    }
+
+
+async def run(count, with_ai, staged):
+    ai, youdao, ecdict = AI() if with_ai else None, Youdao(), Ecdict()
+
+    async def one(word):
+        stages = word_stages(word, ai, youdao, ecdict)
+        await run_stages(stages if staged else chained(stages))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(f"w{i}") for i in range(count)])
+    return time.perf_counter() - start
+
+
+def main():
+    counts = [int(n) for n in sys.argv[1:]] or [1, 5, 20, 500]
+    print(f"{'words':>6} {'ai':>5} {'chained':>9} {'staged':>9} {'speedup':>8}")
+    for count in counts:
+        for with_ai in (False, True):
+            before = asyncio.run(run(count, with_ai, False))
+            after = asyncio.run(run(count, with_ai, True))
+            print(
+                f"{count:6} {with_ai!s:>5} {before:8.2f}s {after:8.2f}s "
+                f"{before / after:7.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+
+import pytest
+
+# importing anki_packager creates the user config dir, keep it out of $HOME
+os.environ["HOME"] = tempfile.mkdtemp(prefix="apkger-test-")
+os.environ["APPDATA"] = os.environ["HOME"]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# a handful of ECDICT rows, with inflections, tags, ranks and escapes
+STARDICT_CSV = os.path.join(ROOT, "tests", "fixtures", "stardict.csv")
+
+
+@pytest.fixture
+def stardict_csv():
+    return STARDICT_CSV
+
+
+@pytest.fixture
+def stardict_db(tmp_path, stardict_csv):
+    """stardict.db built from fixtures/stardict.csv, with the FTS index"""
+    from anki_packager.dict import stardict
+
+    path = str(tmp_path / "stardict.db")
+    sd = stardict.StarDict(path)
+    sd.bulk_load(stardict.csv_records(stardict_csv))
+    sd.build_fts_index()
+    sd.close()
+    return path
+
+
+@pytest.fixture(scope="session")
+def ecdict_dicts():
+    """The user dicts directory Ecdict reads: stardict.db built from the
+    fixture, the two .mdx files shipped in dicts/, every index built"""
+    from anki_packager.dict import stardict
+    from anki_packager.dict.ecdict import Ecdict
+    from anki_packager.utils import get_user_config_dir
+
+    dicts = os.path.join(get_user_config_dir(), "dicts")
+    os.makedirs(dicts, exist_ok=True)
+    for filename in Ecdict.MDX_FILES.values():
+        shutil.copy(os.path.join(ROOT, "dicts", filename), dicts)
+    sd = stardict.StarDict(os.path.join(dicts, "stardict.db"))
+    sd.bulk_load(stardict.csv_records(STARDICT_CSV))
+    sd.close()
+    Ecdict(workers=0, build_index=True)
+    return dicts
@@ -0,0 +1,251 @@
+import asyncio
+
+import pytest
+
+from anki_packager import cli
+from anki_packager.cli import (
+    check_spelling,
+    collapse_lemmas,
+    process_word,
+    run_stages,
+)
+from anki_packager.dict.ecdict import Ecdict
+
+
+class Recorder:
+    """Stage factories that log start, finish and cancellation"""
+
+    def __init__(self):
+        self.log = []
+
+    def stage(self, name, delay=0.0, result=None, error=None):
+        async def run():
+            self.log.append(f"start {name}")
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                self.log.append(f"cancel {name}")
+                raise
+            if error is not None:
+                self.log.append(f"fail {name}")
+                raise error
+            self.log.append(f"done {name}")
+            return name if result is None else result
+
+        return run
+
+
+def test_dependency_order_and_concurrency():
+    rec = Recorder()
+    stages = {
+        "root": ((), rec.stage("root", 0.01)),
+        "a": (("root",), rec.stage("a", 0.05)),
+        "b": (("root",), rec.stage("b", 0.01)),
+        "join": (("a", "b"), rec.stage("join")),
+    }
+    results = asyncio.run(run_stages(stages))
+    assert results == {name: name for name in stages}
+    log = rec.log
+    assert log.index("done root") < log.index("start a")
+    assert log.index("done root") < log.index("start b")
+    # a and b overlap: b finishes while a is still running
+    assert log.index("start a") < log.index("done b") < log.index("done a")
+    assert log.index("done a") < log.index("start join")
+
+
+def test_failure_cancels_siblings_and_keeps_partial_results():
+    rec = Recorder()
+    stages = {
+        "root": ((), rec.stage("root")),
+        "fast": (("root",), rec.stage("fast", 0.01)),
+        "slow": (("root",), rec.stage("slow", 10)),
+        "bad": (("root",), rec.stage("bad", 0.05, error=RuntimeError("boom"))),
+        "after": (("slow",), rec.stage("after")),
+    }
+    results = {}
+
+    async def main():
+        with pytest.raises(RuntimeError, match="boom"):
+            await run_stages(stages, results)
+
+    asyncio.run(main())
+    assert results == {"root": "root", "fast": "fast"}
+    assert "cancel slow" in rec.log
+    assert "start after" not in rec.log
+
+
+def test_retry_reruns_only_missing_stages():
+    rec = Recorder()
+    results = {"root": "cached", "a": "cached"}
+    stages = {
+        "root": ((), rec.stage("root")),
+        "a": (("root",), rec.stage("a")),
+        "b": (("root",), rec.stage("b")),
+    }
+    assert asyncio.run(run_stages(stages, results)) == {
+        "root": "cached",
+        "a": "cached",
+        "b": "b",
+    }
+    assert rec.log == ["start b", "done b"]
+
+
+def test_outer_cancel_waits_for_stages():
+    rec = Recorder()
+    stages = {"x": ((), rec.stage("x", 10)), "y": ((), rec.stage("y", 10))}
+
+    async def main():
+        task = asyncio.ensure_future(run_stages(stages))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # both stages were cancelled before run_stages returned
+        assert sorted(rec.log) == ["cancel x", "cancel y", "start x", "start y"]
+
+    asyncio.run(main())
+
+
+def test_unsatisfiable_dependency():
+    stages = {"a": (("missing",), Recorder().stage("a"))}
+    with pytest.raises(ValueError):
+        asyncio.run(run_stages(stages))
+
+
+class FakeEcdict:
+    def __init__(self, known):
+        self.known = known
+
+    async def ret_word(self, word):
+        return {"word": word} if word in self.known else None
+
+
+class FakeYoudao:
+    def __init__(self):
+        self.calls = []
+
+    async def _get_audio(self, word):
+        self.calls.append("audio")
+        await asyncio.sleep(0.01)
+        return f"/tmp/{word}.mp3"
+
+    async def get_word_info(self, word):
+        self.calls.append("youdao")
+        await asyncio.sleep(0.01)
+        return {"word": word, "example_phrases": [], "example_sentences": []}
+
+
+class FakeDeck:
+    def __init__(self, failures=0):
+        self.notes = []
+        self.failures = failures
+
+    def add_note(self, data):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("add_note failed")
+        self.notes.append(data)
+
+
+def test_process_word():
+    youdao, deck, audio = FakeYoudao(), FakeDeck(), []
+    ecdict = FakeEcdict({"apple"})
+    assert asyncio.run(process_word("apple", None, deck, youdao, ecdict, audio))
+    assert audio == ["/tmp/apple.mp3"]
+    note = deck.notes[0]
+    assert note["Pronunciation"] == "apple.mp3"
+    assert note["ECDict"] == {"word": "apple"} and note["AI"] == {}
+
+    # an ECDICT miss fails before any network stage starts
+    youdao.calls.clear()
+    with pytest.raises(Exception, match="ECDICT"):
+        asyncio.run(process_word("zzzz", None, deck, youdao, ecdict, audio))
+    assert youdao.calls == []
+
+
+class SpellingEcdict:
+    words = {"apple", "apply", "ample", "banana"}
+
+    def known(self, words):
+        return [w in self.words for w in words]
+
+    def suggest(self, word):
+        table = {
+            "bananna": [("banana", 1)],
+            "appel": [("apple", 1), ("apply", 1), ("ample", 2)],
+        }
+        return table.get(word, [])
+
+
+def test_check_spelling_skips_unknown_words():
+    words = ["apple", "bananna", "appel", "zzzz"]
+    kept, skipped, corrections = check_spelling(SpellingEcdict(), words)
+    assert kept == ["apple"]
+    assert skipped == ["bananna", "appel", "zzzz"]
+    assert corrections == []
+
+
+def test_check_spelling_autocorrect_reports_corrections():
+    words = ["apple", "bananna", "appel", "zzzz"]
+    kept, skipped, corrections = check_spelling(SpellingEcdict(), words, True)
+    assert kept == ["apple", "banana"]
+    # ambiguous or without suggestions: still skipped
+    assert skipped == ["appel", "zzzz"]
+    assert corrections == [("bananna", "banana")]
+
+
+def test_retry_after_add_note_failure_packages_audio_once(monkeypatch):
+    monkeypatch.setattr(cli, "RETRY_DELAY", 0)
+    youdao, deck, audio = FakeYoudao(), FakeDeck(failures=1), []
+    ecdict = FakeEcdict({"apple"})
+    args = ("apple", None, deck, youdao, ecdict, audio)
+    assert asyncio.run(cli.process_word_with_retries(*args))
+    assert audio == ["/tmp/apple.mp3"]
+    assert len(deck.notes) == 1
+    # the stages that succeeded are not run again
+    assert youdao.calls.count("audio") == 1
+
+
+def test_cancelled_stage_is_a_failure():
+    rec = Recorder()
+
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    stages = {
+        "root": ((), rec.stage("root")),
+        "gone": (("root",), cancelled),
+        "slow": (("root",), rec.stage("slow", 10)),
+    }
+    results = {}
+
+    async def main():
+        with pytest.raises(RuntimeError, match="gone"):
+            await run_stages(stages, results)
+
+    asyncio.run(main())
+    assert results == {"root": "root"}
+    assert "cancel slow" in rec.log
+
+
+def test_collapse_lemmas(ecdict_dicts):
+    ecdict = Ecdict(workers=0)
+    words = ["studied", "study", "Mice", "given", "applied", "took", "foo"]
+    # given/applied are rated entries of their own, not stubs
+    assert ecdict.lemmatize(words) == [
+        "study",
+        "study",
+        "mouse",
+        "given",
+        "applied",
+        "take",
+        "foo",
+    ]
+    assert collapse_lemmas(ecdict, words) == [
+        "study",
+        "mouse",
+        "given",
+        "applied",
+        "take",
+        "foo",
+    ]
@@ -0,0 +1,167 @@
+import asyncio
+import os
+import random
+import shutil
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import py7zr
+import pytest
+from mdict_utils.reader import query
+
+from anki_packager.dict import ecdict, mdx, stardict
+from anki_packager.dict.ecdict import Ecdict, HotSet
+from anki_packager.dict.mdx import MdxReader
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MDX_FILES = {
+    schema: os.path.join(ROOT, "dicts", filename)
+    for schema, filename in Ecdict.MDX_FILES.items()
+}
+
+
+def record(word, frq):
+    data = dict.fromkeys(stardict.RECORD_FIELDS)
+    data.update(id=frq, word=word, sw=word, frq=frq)
+    return data
+
+
+def test_hot_set_get_does_not_count():
+    hot = HotSet([record("apple", 1), record("banana", 2)], {}, {})
+    assert hot.get("Apple")[0]["word"] == "apple"
+    assert hot.get("cherry") is None
+    assert (hot.hits, hot.misses) == (0, 0)
+
+
+def test_hot_set_count_from_threads():
+    hot = HotSet([record("apple", 1)], {}, {})
+    with ThreadPoolExecutor(8) as pool:
+        for _ in range(2000):
+            pool.submit(hot.count, 3, 1)
+    assert (hot.hits, hot.misses) == (6000, 2000)
+    assert hot.hit_rate == 0.75
+
+
+@pytest.fixture(scope="module")
+def archive(tmp_path_factory):
+    lines = ["word,translation"] + [f"word{i},{'x' * 200}" for i in range(50000)]
+    text = "\n".join(lines) + "\n"
+    path = tmp_path_factory.mktemp("7z") / "stardict.7z"
+    with py7zr.SevenZipFile(path, "w") as ar:
+        ar.writestr(text.encode("utf-8"), "stardict.csv")
+    return str(path), text
+
+
+def test_open_7z_csv_streams_member(archive):
+    path, text = archive
+    with ecdict.open_7z_csv(path) as fp:
+        assert fp.read() == text
+
+
+def test_open_7z_csv_stops_producer_when_consumer_fails(archive):
+    path, _ = archive
+    fp = ecdict.open_7z_csv(path)
+    thread = fp.buffer.raw.thread
+    with pytest.raises(ValueError):
+        with fp:
+            fp.readline()
+            raise ValueError("consumer failed")
+    thread.join(5)
+    assert not thread.is_alive()
+
+
+def test_open_7z_csv_falls_back_to_temp_file(archive, monkeypatch):
+    path, text = archive
+    monkeypatch.setattr(ecdict, "_can_stream", lambda ar: False)
+    with ecdict.open_7z_csv(path) as fp:
+        assert fp.read() == text
+        tmpdir = fp.buffer.raw.tmpdir.name
+        assert os.path.exists(tmpdir)
+    assert not os.path.exists(tmpdir)
+
+
+@pytest.mark.parametrize("path", MDX_FILES.values(), ids=list(MDX_FILES))
+def test_mdx_reader_matches_mdict_utils(path):
+    reader = MdxReader(path)
+    words = [word for word, _ in reader.items()]
+    assert len(words) == len(reader)
+    random.seed(0)
+    sample = random.sample(words, 10) + [words[0], words[-1], "no-such-word"]
+    for word in sample:
+        assert reader.lookup(word) == query(path, word)
+    assert "no-such-word" not in reader
+    reader.close()
+
+
+def test_mdx_sidecar(tmp_path):
+    path = str(tmp_path / "words.mdx")
+    shutil.copy2(MDX_FILES["diffrentiation"], path)
+    db_path = mdx.sidecar_path(path)
+    assert db_path == str(tmp_path / "words.db")
+    assert not mdx.sidecar_is_fresh(path, db_path)
+    assert mdx.ensure_sidecar(path) == db_path
+    assert mdx.sidecar_is_fresh(path, db_path)
+    reader = MdxReader(path)
+    conn = sqlite3.connect(db_path)
+    rows = dict(conn.execute("SELECT entry, paraphrase FROM mdx"))
+    conn.close()
+    assert rows == dict(reader.items())
+    reader.close()
+    # the .mdx changed: the sidecar is stale and rebuilt
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert not mdx.sidecar_is_fresh(path, db_path)
+    mdx.ensure_sidecar(path)
+    assert mdx.sidecar_is_fresh(path, db_path)
+    assert not os.path.exists(db_path + ".tmp")
+
+
+@pytest.mark.parametrize("workers", [0, 2])
+def test_ret_word_batches_concurrent_calls(ecdict_dicts, workers):
+    dic = Ecdict(batch_delay=0.01, workers=workers)
+    words = ["apple", "give", "took", "nothing", "apple", "Table"]
+    expected = dic.ret_words(words)
+    calls = []
+    ret_words = dic.ret_words
+    dic.ret_words = lambda batch: calls.append(batch) or ret_words(batch)
+
+    async def lookup():
+        return await asyncio.gather(*(dic.ret_word(word) for word in words))
+
+    results = asyncio.run(lookup())
+    assert calls == [["apple", "give", "took", "nothing", "Table"]]
+    assert results == expected
+    # took is not in the fixture: its lemma is returned
+    assert results[2]["word"] == "take"
+    assert results[3] is None
+    assert "distribution" in results[0]
+    # callers of the same word get their own copies
+    assert results[0] is not results[4]
+
+    def broken(batch):
+        raise RuntimeError("database is gone")
+
+    dic.ret_words = broken
+
+    async def fail():
+        return await asyncio.gather(
+            dic.ret_word("apple"), dic.ret_word("give"), return_exceptions=True
+        )
+
+    assert [str(e) for e in asyncio.run(fail())] == ["database is gone"] * 2
+
+
+def test_hot_set_answers_like_the_database(ecdict_dicts):
+    words = ["give", "take", "apple", "zeitgeist", "took", "nothing", "give"]
+    cold = Ecdict(workers=0)
+    hot = Ecdict(workers=0, hot_size=5)
+    assert cold.hot_stats() is None
+    assert hot.hot_stats()["size"] == 5
+    assert "give" in hot.hot and "zeitgeist" not in hot.hot
+    assert hot.ret_words(words) == cold.ret_words(words)
+    stats = hot.hot_stats()
+    # give x2 and take are hot; took resolves to take through the database
+    assert (stats["hits"], stats["misses"]) == (3, 4)
+    # callers may change the records, the hot set keeps its own
+    hot.ret_words(["give"])[0]["translation"] = "changed"
+    assert hot.ret_words(["give"]) == cold.ret_words(["give"])
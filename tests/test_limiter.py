@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from anki_packager.limiter import AdaptiveLimiter, is_overload
+
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        self.status = status
+
+
+def test_second_cancel_does_not_leak_slot():
+    async def main():
+        limiter = AdaptiveLimiter("test", 1)
+        entered = asyncio.Event()
+
+        async def worker():
+            async with limiter.slot():
+                entered.set()
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(worker())
+        await entered.wait()
+        # hold the condition lock so the release has to wait for it
+        await limiter._cond.acquire()
+        task.cancel()
+        await asyncio.sleep(0)
+        task.cancel()
+        await asyncio.sleep(0)
+        limiter._cond.release()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert limiter.inflight == 0
+        # the slot is usable again
+        async with limiter.slot():
+            assert limiter.inflight == 1
+
+    asyncio.run(main())
+
+
+def test_limit_adapts():
+    async def main():
+        limiter = AdaptiveLimiter("test", 4)
+
+        async def ok():
+            async with limiter.slot():
+                await asyncio.sleep(0.001)
+
+        await asyncio.gather(*[ok() for _ in range(50)])
+        grown = limiter.limit
+        assert grown > 4
+
+        with pytest.raises(HTTPError):
+            async with limiter.slot():
+                raise HTTPError(429)
+        assert limiter.limit == pytest.approx(grown / 2)
+        assert limiter.overloads == 1
+
+        # unrelated errors leave the limit alone
+        with pytest.raises(HTTPError):
+            async with limiter.slot():
+                raise HTTPError(404)
+        assert limiter.limit == pytest.approx(grown / 2)
+
+    asyncio.run(main())
+
+
+def test_is_overload_follows_exception_chain():
+    try:
+        try:
+            raise HTTPError(503)
+        except HTTPError:
+            raise Exception("wrapped")
+    except Exception as e:
+        assert is_overload(e)
+    assert is_overload(asyncio.TimeoutError())
+    assert not is_overload(HTTPError(404))
+    assert not is_overload(ValueError())
@@ -0,0 +1,483 @@
+import os
+import random
+import shutil
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from anki_packager.dict import stardict
+from anki_packager.dict.stardict import (
+    DictBinary,
+    DictCsv,
+    DictCsvLazy,
+    LemmaDB,
+    StarDict,
+    csv_codec,
+    fts_cjk_split,
+    fts_query,
+    tab_codec,
+)
+
+
+def test_escape_codec_round_trip():
+    random.seed(0)
+    alphabet = "ab\\\n\r\t中 "
+    for codec in (csv_codec, tab_codec):
+        for _ in range(2000):
+            text = "".join(
+                random.choice(alphabet) for _ in range(random.randint(0, 12))
+            )
+            assert codec.decode(codec.encode(text)) == text
+
+
+def test_escape_codec_encode():
+    assert csv_codec.encode("a\\b\nc\rd\te") == "a\\\\b\\nc\\rd\te"
+    assert tab_codec.encode("a\\b\nc\rd\te") == "a\\\\b\\nc\\rd\\te"
+    plain = "no escapes here"
+    assert csv_codec.encode(plain) is plain
+
+
+def row(
+    word, definition="", translation="", tag=None, bnc=None, frq=None, exchange=None
+):
+    return (
+        word,
+        None,
+        definition,
+        translation,
+        None,
+        None,
+        None,
+        tag,
+        bnc,
+        frq,
+        exchange,
+        None,
+        None,
+    )
+
+
+def test_bulk_load_replaces_derived_tables(tmp_path):
+    lines = []
+    sd = StarDict(str(tmp_path / "test.db"), lines.append)
+    sd.bulk_load([row("apple", "a round fruit"), row("pear", "a sweet fruit")])
+    sd.build_fts_index()
+    assert sorted(w for _, w in sd.search("fruit")) == ["apple", "pear"]
+    sd.bulk_load([row("stone", "a hard rock"), row("rock", "hard stone")])
+    assert sd.has_fts_index()
+    assert sorted(w for _, w in sd.search("fruit")) == []
+    assert sorted(w for _, w in sd.search("hard")) == ["rock", "stone"]
+    sd.close()
+    # progress goes through the verbose callable, not stdout
+    assert any(line.startswith("[Finished") for line in lines)
+
+
+def test_select_range_excludes_unranked(tmp_path):
+    sd = StarDict(str(tmp_path / "test.db"))
+    sd.bulk_load(
+        [
+            row("common", tag="cet4", frq=10, bnc=20),
+            row("rare", tag="cet4", frq=5000, bnc=0),
+            row("unranked", tag="cet4", frq=0, bnc=0),
+            row("missing", tag="cet6"),
+        ]
+    )
+    words = lambda **kw: [w for _, w in sd.select(**kw)]
+    assert words(frq=(0, 100)) == ["common"]
+    assert words(frq=(None, 10000)) == ["common", "rare"]
+    assert words(frq=0) == ["common", "rare"]
+    assert words(bnc=(0, 100)) == ["common"]
+    # without a range unranked words are kept, sorted last
+    assert words(tag="cet4") == ["common", "rare", "unranked"]
+    sd.close()
+
+
+def test_lemma_cache(tmp_path):
+    source = tmp_path / "lemma.txt"
+    source.write_text("give/100 -> gave,given\ntake -> took\n", encoding="utf-8")
+    lemma = LemmaDB()
+    lemma.load(str(source), cache=True)
+    assert os.path.exists(str(source) + ".bin")
+    cached = LemmaDB()
+    assert cached.load(str(source), cache=True)
+    assert cached.get("give") == ["gave", "given"]
+    assert cached.word_stem("took") == ["take"]
+    # same mtime but a different file: the cache is stale
+    mtime = os.stat(source).st_mtime_ns
+    source.write_text("see -> saw,seen\n", encoding="utf-8")
+    os.utime(source, ns=(mtime, mtime))
+    fresh = LemmaDB()
+    fresh.load(str(source), cache=True)
+    assert fresh.get("see") == ["saw", "seen"]
+    assert fresh.get("give") is None
+
+
+def test_lemma_load_merges_without_cache(tmp_path):
+    first = tmp_path / "first.txt"
+    first.write_text("give -> gave\n", encoding="utf-8")
+    second = tmp_path / "second.txt"
+    second.write_text("take -> took\n", encoding="utf-8")
+    lemma = LemmaDB()
+    lemma.load(str(first), cache=True)
+    lemma.add("go", "went")
+    # the db is not empty any more: second.txt is merged, no cache is written
+    lemma.load(str(second), cache=True)
+    assert not os.path.exists(str(second) + ".bin")
+    assert sorted(lemma) == ["give", "go", "take"]
+    # the cache of first.txt only holds first.txt
+    cached = LemmaDB()
+    cached.load(str(first), cache=True)
+    assert list(cached) == ["give"]
+
+
+def test_slow_paths_without_derived_indexes(tmp_path):
+    records = [
+        row("give", "to hand over", "给", "cet4 zk", 100, 50, "p:gave/d:given"),
+        row("gave", "past of give", "给的过去式", None, 0, 0, "0:give"),
+        row("take", "to grab", "拿", "cet4", 80, 40, "p:took/d:taken"),
+        row("table", "a flat surface", "桌子", "zk", 200, 300),
+        row("cable", "a thick wire", "电缆", "cet6", 900, 800),
+    ]
+    indexed = str(tmp_path / "indexed.db")
+    plain = str(tmp_path / "plain.db")
+    for path in (indexed, plain):
+        sd = StarDict(path)
+        sd.bulk_load(records)
+        sd.build_fts_index()
+        sd.close()
+    sd = StarDict(plain)
+    for name in ("lemma", "spell", "tag", "fts"):
+        sd.execute(f"DROP TABLE stardict_{name};")
+    sd.close()
+    a = StarDict(indexed, readonly=True)
+    b = StarDict(plain, readonly=True)
+    assert not (b.has_lemma_index() or b.has_spell_index() or b.has_fts_index())
+    forms = ["gave", "given", "took", "table", "nothing", ""]
+    assert b.lemma_batch(forms) == a.lemma_batch(forms)
+    assert b.lemma_batch(forms)[:3] == ["give", "give", "take"]
+    for word in ("tabel", "gve", "cabel", "zzzzzz"):
+        assert b.suggest(word) == a.suggest(word)
+    for tag in ("cet4", "zk", "cet4 zk", "cet"):
+        assert list(b.select(tag)) == list(a.select(tag))
+    assert [w for _, w in b.select("cet4")] == ["take", "give"]
+    assert [w for _, w in b.search("give")] == ["gave"]
+    assert [w for _, w in b.search("桌子", "translation")] == ["table"]
+    assert [w for _, w in b.search("THICK wire")] == ["cable"]
+    # plain substrings in id order, no ranking
+    assert [w for _, w in b.search("a", "definition", limit=2)] == ["give", "gave"]
+    a.close()
+    b.close()
+
+
+def test_prefix_index_is_never_written_at_runtime(tmp_path):
+    path = str(tmp_path / "test.db")
+    sd = StarDict(path)
+    sd.bulk_load([row(w) for w in ("apple", "Apply", "banana", "band", "can")])
+    sd.close()
+    ro = StarDict(path, readonly=True)
+    assert ro.prefix_index() is None
+    assert not ro.build_prefix_index()
+    sql = ro.match("ap", 3)
+    assert [w for _, w in sql] == ["apple", "Apply", "banana"]
+    ro.close()
+    assert not os.path.exists(path + ".prefix")
+    sd = StarDict(path)
+    assert sd.build_prefix_index()
+    sd.close()
+    ro = StarDict(path, readonly=True)
+    assert ro.prefix_index() is not None
+    assert ro.match("ap", 3) == sql
+    assert ro.match("BAN", 2, True) == [(3, "banana"), (4, "band")]
+    ro.close()
+    # the database changed: the index is stale and ignored
+    sd = StarDict(path)
+    sd.register("apricot", {"definition": "fruit"})
+    sd.close()
+    ro = StarDict(path, readonly=True)
+    assert ro.prefix_index() is None
+    assert [w for _, w in ro.match("ap", 3)] == ["apple", "Apply", "apricot"]
+    ro.close()
+
+
+def test_csv_prefix_index(tmp_path):
+    path = str(tmp_path / "test.csv")
+    with open(path, "w", encoding="utf-8") as fp:
+        fp.write("word,phonetic,definition,translation\n")
+        for word in ("band", "apple", "Apply", "banana"):
+            fp.write(f"{word},,,\n")
+    dc = DictCsv(path)
+    assert dc.prefix_index() is None
+    expected = dc.match("ap", 3)
+    assert [w for _, w in expected] == ["apple", "Apply", "banana"]
+    assert not os.path.exists(path + ".prefix")
+    assert dc.build_prefix_index()
+    assert DictCsv(path).prefix_index() is not None
+    assert DictCsv(path).match("ap", 3) == expected
+
+
+def fixture_words(path):
+    return [record[0] for record in stardict.csv_records(path)]
+
+
+def test_query_batch_chunks(stardict_db, stardict_csv, monkeypatch):
+    words = fixture_words(stardict_csv)
+    keys = words[::-1] + ["GIVE", "nothing", None, 1, 999, "Mice", "give"]
+    sd = StarDict(stardict_db)
+    expected = [sd.query(key.lower() if isinstance(key, str) else key) for key in keys]
+    assert expected[-7]["word"] == "give"
+    assert expected[-6:-3] == [None, None, sd.query(1)]
+    assert sd.query_batch(keys) == tuple(expected)
+    # several IN lists, then the temp table join
+    monkeypatch.setattr(stardict, "BATCH_CHUNK_SIZE", 3)
+    assert sd.query_batch(keys) == tuple(expected)
+    monkeypatch.setattr(stardict, "BATCH_TEMP_THRESHOLD", 4)
+    assert sd.query_batch(keys) == tuple(expected)
+    assert sd.query_batch(keys) == tuple(expected)
+    sd.close()
+    # read-only: always IN lists, even above the threshold
+    ro = StarDict(stardict_db, readonly=True)
+    assert ro.query_batch(keys) == tuple(expected)
+    assert ro.query_batch([]) == []
+    ro.close()
+
+
+def test_readonly_connection_per_thread(stardict_db, stardict_csv, tmp_path):
+    words = fixture_words(stardict_csv)
+    other = sqlite3.connect(str(tmp_path / "other.db"))
+    other.execute("CREATE TABLE t (word TEXT)")
+    other.execute("INSERT INTO t VALUES ('attached')")
+    other.commit()
+    other.close()
+    ro = StarDict(stardict_db, readonly=True)
+    expected = ro.query_batch(words)
+    ro.attach(str(tmp_path / "other.db"), "other")
+
+    def work(_):
+        # a new thread opens its own connection, with the attached database
+        return (
+            ro.query_batch(words),
+            ro.execute("SELECT word FROM other.t").fetchone()[0],
+        )
+
+    with ThreadPoolExecutor(8) as pool:
+        for records, attached in pool.map(work, range(64)):
+            assert records == expected
+            assert attached == "attached"
+    with pytest.raises(sqlite3.OperationalError):
+        ro.execute("DELETE FROM stardict")
+    ro.close()
+    assert StarDict(stardict_db).count() == len(words)
+
+
+def test_lemma_batch(stardict_db):
+    ro = StarDict(stardict_db, readonly=True)
+    assert ro.has_lemma_index()
+    forms = ["gave", "GIVEN", "mice", "studied", "took", "applied", "apple", "", None]
+    assert ro.lemma_batch(forms) == [
+        "give",
+        "give",
+        "mouse",
+        "study",
+        "take",
+        "apply",
+        None,
+        None,
+        None,
+    ]
+    ro.close()
+
+
+def test_csv_lazy_matches_csv(stardict_csv, tmp_path):
+    path = str(tmp_path / "stardict.csv")
+    shutil.copy(stardict_csv, path)
+    dc = DictCsv(path)
+    lazy = DictCsvLazy(path)
+    assert os.path.exists(path + ".idx")
+    words = fixture_words(path)
+    assert lazy.count() == len(lazy) == dc.count() == len(words)
+    assert sorted(lazy.dumps()) == sorted(dc.dumps())
+    keys = words + ["GIVE", "Mice", "nothing", ""]
+    for key in keys:
+        assert lazy.query(key) == dc.query(key)
+        assert (key in lazy) == (key in dc)
+    assert lazy.query_batch(keys) == dc.query_batch(keys)
+    assert lazy.query("give").detail == {"note": "irregular"}
+    for prefix in ("ap", "BAN", "t", "zz", ""):
+        assert lazy.match(prefix, 4) == dc.match(prefix, 4)
+        assert lazy.match(prefix, 4, True) == dc.match(prefix, 4, True)
+    lazy.close()
+    # the csv changed: the index is stale and rebuilt
+    with open(path, "a", encoding="utf-8") as fp:
+        fp.write("apricot,,a fruit,杏\n")
+    lazy = DictCsvLazy(path)
+    assert lazy.count() == len(words) + 1
+    assert lazy.query("apricot").translation == "杏"
+    assert [w for _, w in lazy.match("apr", 1)] == ["apricot"]
+    lazy.close()
+
+
+def test_suggest_ranking(stardict_db):
+    ro = StarDict(stardict_db, readonly=True)
+    assert ro.has_spell_index()
+    # by edit distance, then by frq rank
+    assert ro.suggest("give") == [("give", 0), ("given", 1), ("gave", 1), ("mice", 2)]
+    assert ro.suggest("Aple") == [
+        ("apple", 1),
+        ("table", 2),
+        ("apply", 2),
+        ("cable", 2),
+    ]
+    assert ro.suggest("tabel", 2) == [("table", 1), ("take", 2)]
+    assert ro.suggest("tabel", distance=1) == [("table", 1)]
+    assert ro.suggest("xylophone") == []
+    ro.close()
+
+
+def test_fts_cjk_split():
+    assert fts_cjk_split("") == ""
+    assert fts_cjk_split("plain text") == "plain text"
+    assert fts_cjk_split("n. 苹果树") == "n.  苹果 果树 树 "
+    assert fts_cjk_split("vt. 应用；申请") == "vt.  应用 用 ； 申请 请 "
+    assert fts_query("苹果 果", "translation") == (
+        'translation : "苹果" AND translation : "果"*'
+    )
+    assert fts_query('crisp "fruit"') == '"crisp" AND """fruit"""'
+
+
+def test_search_fts(stardict_db):
+    ro = StarDict(stardict_db, readonly=True)
+    assert ro.has_fts_index()
+    words = lambda *args, **kw: [w for _, w in ro.search(*args, **kw)]
+    # porter stemming, every term must match
+    assert sorted(words("fruits")) == ["apple", "banana"]
+    assert words("sweet crescent") == ["banana"]
+    assert words("fruit", limit=1) in (["apple"], ["banana"])
+    # chinese bigrams, a single character is a prefix query
+    assert words("香蕉") == ["banana"]
+    assert words("苹") == ["apple"]
+    assert words("申请", "translation") == ["apply"]
+    assert words("申请", "definition") == []
+    assert words("") == []
+    ro.close()
+
+
+def test_lazy_records(stardict_db, stardict_csv):
+    sd = StarDict(stardict_db, readonly=True)
+    dc = DictCsv(stardict_csv)
+    for record in (sd.query("give"), dc.query("give")):
+        assert list(record) == list(stardict.RECORD_FIELDS)
+        assert record.word == record["word"] == "give"
+        assert record.definition.split("\n")[1].startswith("n. the elasticity")
+        assert record.frq == 63 and record.collins == 5
+        # detail is decoded on first access, then kept
+        assert record.detail == {"note": "irregular"}
+        assert record.detail is record.detail
+        with pytest.raises(AttributeError):
+            record.missing
+        copy = record.copy()
+        copy["distribution"] = "v. 100%"
+        copy["frq"] = 1
+        assert "distribution" in copy and "distribution" not in record
+        assert list(copy)[-1] == "distribution"
+        assert len(copy) == len(record) + 1
+        assert record.frq == 63
+        with pytest.raises(KeyError):
+            del copy["word"]
+        del copy["distribution"]
+        assert dict(copy).keys() == dict(record).keys()
+    sd.close()
+
+
+@pytest.mark.parametrize("compress", [None, "zlib", "zstd"])
+def test_binary_dictionary(stardict_db, stardict_csv, tmp_path, compress):
+    sd = StarDict(stardict_db, readonly=True)
+    path = str(tmp_path / "stardict.bdict")
+    # small blocks: records are spread over several compressed blocks
+    stardict.tools.export_binary(sd, path, compress, block=4)
+    bd = DictBinary(path)
+    words = fixture_words(stardict_csv)
+    assert bd.count() == len(bd) == len(words)
+    assert sorted(bd.dumps()) == sorted(sd.dumps())
+    # ids are positions in the binary file
+    fields = lambda record: record and {k: record[k] for k in record if k != "id"}
+    keys = words + ["GIVE", "nothing"]
+    for key, record in zip(keys, bd.query_batch(keys)):
+        assert fields(record) == fields(sd.query(key))
+        assert fields(bd.query(key)) == fields(record)
+        if record:
+            assert bd.query(record.id) == record
+    assert [w for _, w in bd.match("ap", 3)] == [w for _, w in sd.match("ap", 3)]
+    assert [w for _, w in bd.match("BAN", 2, True)] == ["banana", "band"]
+    bd.close()
+    sd.close()
+    with open(path, "r+b") as fp:
+        fp.write(b"garbage!")
+    with pytest.raises(ValueError):
+        DictBinary(path)
+
+
+def test_slim_profile(stardict_csv, tmp_path):
+    records = list(stardict.csv_records(stardict_csv))
+    # enough samples to train the shared zstd dictionary
+    records += [(f"{r[0]}{i}",) + r[1:] for i, r in enumerate(records * 20)]
+    junk = [("<b>bold",) + records[0][1:], ("$usd",) + records[0][1:]]
+    full = StarDict(str(tmp_path / "full.db"))
+    full.bulk_load(records)
+    sd = StarDict(str(tmp_path / "slim.db"))
+    sd.bulk_load(records + junk, slim=True)
+    sd.build_fts_index()
+    sd.close()
+    sd = StarDict(str(tmp_path / "slim.db"), readonly=True)
+    types = dict(
+        sd.execute(
+            "SELECT typeof(definition), count(*) FROM stardict GROUP BY 1"
+        ).fetchall()
+    )
+    assert types["blob"] > 0
+    assert sd.count() == full.count() == len(records)
+    assert sd.query("<b>bold") is None and sd.query("$usd") is None
+    words = [r[0] for r in records]
+    for slim, record in zip(sd.query_batch(words), full.query_batch(words)):
+        assert slim.pos is None and slim.detail is None and slim.audio is None
+        for key in ("word", "definition", "translation", "tag", "frq", "exchange"):
+            assert slim[key] == record[key]
+    # the FTS index is built from the decompressed text
+    found = [w for _, w in sd.search("crescent")]
+    assert len(found) == 21 and "banana" in found
+    sd.close()
+    full.close()
+
+
+def test_select_on_fixture(stardict_db, tmp_path):
+    plain = str(tmp_path / "plain.db")
+    shutil.copy(stardict_db, plain)
+    sd = StarDict(plain)
+    sd.execute("DROP TABLE stardict_tag;")
+    sd.close()
+    for path in (stardict_db, plain):
+        ro = StarDict(path, readonly=True)
+        words = lambda *args, **kw: [w for _, w in ro.select(*args, **kw)]
+        assert words("cet4 cet6") == ["apply", "band", "cable"]
+        assert words("CET6", collins=4) == ["apply", "band"]
+        assert words(collins=(3, 3), order="word") == [
+            "banana",
+            "cable",
+            "given",
+            "mouse",
+            "variable",
+        ]
+        assert words(oxford=True, frq=(None, 500)) == ["give", "take", "study"]
+        assert words(bnc=(1000, 3000), order="bnc") == [
+            "table",
+            "apply",
+            "band",
+            "apple",
+            "variable",
+            "applied",
+        ]
+        # no frq or bnc rank: sorted last, dropped by any range
+        assert words("gre") == ["zeitgeist"]
+        assert words("gre", frq=(None, 10**6)) == []
+        assert words("zk", order="collins", limit=3) == ["give", "take", "study"]
+        ro.close()
@@ -0,0 +1,236 @@
+import asyncio
+import json
+import os
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from anki_packager.dict.youdao import (
+    HTML_PARSER,
+    PAGE_STRAINER,
+    YoudaoCache,
+    YoudaoScraper,
+    parse_word_json,
+    parse_word_page,
+)
+
+# hand-written, reduced copies of the page layout parse_word_page reads,
+# not captured live pages
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures", "youdao")
+WORDS = ["variable", "apple"]
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("word", WORDS)
+def test_strained_page_matches_full_soup(word):
+    page = fixture(f"{word}.html")
+    # what get_word_info did before: the whole page through html.parser
+    expected = parse_word_page(page, word, "html.parser", None)
+    assert expected["example_phrases"] and expected["example_sentences"]
+    assert parse_word_page(page, word, "html.parser", PAGE_STRAINER) == expected
+    assert parse_word_page(page, word) == expected
+    assert parse_word_page(page, word, HTML_PARSER, None) == expected
+
+
+def test_parse_word_page():
+    result = parse_word_page(fixture("variable.html"), "variable")
+    assert result["word"] == "variable"
+    assert result["example_phrases"] == [
+        {"index": "1.", "english": "random variable", "chinese": "随机变量"},
+        {"index": "2.", "english": "dependent variable", "chinese": "因变量"},
+        # no <a class="point">: split on the full-width semicolon
+        {"index": "3.", "english": "variable cost", "chinese": "可变成本"},
+    ]
+    assert result["example_sentences"][1] == {
+        "index": "2.",
+        "english": "Store the result in a variable.",
+        "chinese": "把结果存入一个变量。",
+        "source": "《柯林斯英汉双解大词典》",
+    }
+
+
+@pytest.mark.parametrize("word", WORDS)
+def test_json_matches_html(word):
+    from_json = parse_word_json(json.loads(fixture(f"{word}.json")), word)
+    from_html = parse_word_page(fixture(f"{word}.html"), word)
+    # the .json fixtures are hand-written in the assumed jsonapi layout: this
+    # checks the two parsers agree on the same content, not the live schema
+    assert from_json == from_html
+
+
+def test_parse_word_json():
+    data = json.loads(fixture("variable.json"))
+    result = parse_word_json(data, "variable")
+    # translations given as a list are joined
+    assert result["example_phrases"][1]["chinese"] == "因变量"
+    assert result["example_sentences"][0]["source"] == "《牛津词典》"
+    assert parse_word_json({"phrs": {}}, "variable") == {
+        "word": "variable",
+        "example_phrases": [],
+        "example_sentences": [],
+    }
+    # neither section: an unexpected schema, not a word without examples
+    with pytest.raises(ValueError):
+        parse_word_json({"ec": {"word": []}}, "variable")
+
+
+def stand_in(broken=()):
+    """m.youdao.com and dict.youdao.com/jsonapi serving the fixtures
+
+    `broken` may hold "html" (HTTP 503) and "json" (HTTP 500),
+    "json-body" (an HTML error page instead of JSON) or "json-schema"
+    (valid JSON without the phrs/blng_sents_part sections).
+    """
+    hits = {"html": 0, "json": 0}
+
+    async def html(request):
+        hits["html"] += 1
+        if "html" in broken:
+            return web.Response(status=503)
+        page = fixture(f"{request.query['word']}.html")
+        return web.Response(text=page, content_type="text/html")
+
+    async def jsonapi(request):
+        hits["json"] += 1
+        if "json" in broken:
+            return web.Response(status=500)
+        if "json-body" in broken:
+            return web.Response(text="<html>busy</html>", content_type="text/html")
+        if "json-schema" in broken:
+            return web.json_response({"ec": {"word": [{"trs": []}]}})
+        payload = fixture(f"{request.query['q']}.json")
+        return web.Response(text=payload, content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/result", html)
+    app.router.add_get("/jsonapi", jsonapi)
+    return TestServer(app), hits
+
+
+def lookup(backend, broken=()):
+    async def main():
+        server, hits = stand_in(broken)
+        await server.start_server()
+        try:
+            async with YoudaoScraper(backend=backend) as youdao:
+                youdao.base_url = str(server.make_url("/result"))
+                youdao.json_url = str(server.make_url("/jsonapi"))
+                results = [await youdao.get_word_info(word) for word in WORDS]
+        finally:
+            await server.close()
+        return results, hits
+
+    return asyncio.run(main())
+
+
+def expected():
+    return [parse_word_page(fixture(f"{word}.html"), word) for word in WORDS]
+
+
+def test_json_backend():
+    results, hits = lookup("json")
+    assert results == expected()
+    assert hits == {"html": 0, "json": len(WORDS)}
+
+
+@pytest.mark.parametrize("broken", ["json", "json-body", "json-schema"])
+def test_json_falls_back_to_html(broken):
+    results, hits = lookup("json", {broken})
+    assert results == expected()
+    assert hits == {"html": len(WORDS), "json": len(WORDS)}
+
+
+def test_html_falls_back_to_json():
+    results, hits = lookup("html", {"html"})
+    assert results == expected()
+    assert hits == {"html": len(WORDS), "json": len(WORDS)}
+
+
+def test_both_backends_fail():
+    results, _ = lookup("json", {"json", "html"})
+    assert results == [None] * len(WORDS)
+
+
+def result(word, examples=True):
+    phrases = [{"index": "1.", "english": f"{word} 变量", "chinese": "变"}]
+    return {
+        "word": word,
+        "example_phrases": phrases if examples else [],
+        "example_sentences": [],
+    }
+
+
+def backdate(cache, word, seconds):
+    with cache._conn:
+        cache._conn.execute(
+            "UPDATE youdao SET created = created - ?, accessed = accessed - ? "
+            "WHERE key = ?",
+            (seconds, seconds, cache.normalize(word)),
+        )
+
+
+def test_cache_round_trip(tmp_path):
+    path = str(tmp_path / "youdao.db")
+    cache = YoudaoCache(path)
+    cache.put("  Random  Variable ", result("random variable"))
+    cache.close()
+    # persisted, keyed by the normalized word, unicode intact
+    cache = YoudaoCache(path)
+    assert len(cache) == 1
+    assert cache.get("random variable") == result("random variable")
+    assert cache.get("unknown") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+    cache.close()
+
+
+def test_cache_ttl_and_negative_ttl(tmp_path):
+    cache = YoudaoCache(str(tmp_path / "youdao.db"), ttl=100, negative_ttl=10)
+    cache.put("apple", result("apple"))
+    cache.put("xyzzy", result("xyzzy", examples=False))
+    backdate(cache, "apple", 50)
+    backdate(cache, "xyzzy", 50)
+    # a word without examples expires sooner
+    assert cache.get("apple") == result("apple")
+    assert cache.get("xyzzy") is None
+    assert len(cache) == 1
+    backdate(cache, "apple", 60)
+    assert cache.get("apple") is None
+    assert len(cache) == 0
+    cache.close()
+
+
+def test_cache_without_ttl_never_expires(tmp_path):
+    cache = YoudaoCache(str(tmp_path / "youdao.db"), ttl=None, negative_ttl=None)
+    cache.put("apple", result("apple"))
+    cache.put("xyzzy", result("xyzzy", examples=False))
+    backdate(cache, "apple", 10**9)
+    backdate(cache, "xyzzy", 10**9)
+    assert cache.get("apple") == result("apple")
+    assert cache.get("xyzzy") == result("xyzzy", examples=False)
+    cache.close()
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    path = str(tmp_path / "youdao.db")
+    cache = YoudaoCache(path, max_entries=3)
+    for age, word in enumerate(["a", "b", "c"]):
+        cache.put(word, result(word))
+        backdate(cache, word, 100 - age)
+    # reading "a" makes "b" the least recently used
+    assert cache.get("a") is not None
+    cache.put("d", result("d"))
+    assert len(cache) == 3
+    assert cache.get("b") is None
+    assert [cache.get(w) is not None for w in "acd"] == [True, True, True]
+    # overwriting an entry does not count twice
+    cache.put("d", result("d", examples=False))
+    assert len(cache) == 3
+    cache.close()
+    cache = YoudaoCache(path, max_entries=3)
+    assert len(cache) == 3
+    cache.close()